@@ -1,6 +1,9 @@
 from gryphon.execution.strategies.base import Strategy
 from gryphon.lib import arbitrage as arb
-from gryphon.lib.exchange.consts import Consts
+
+from arb_executor import ArbExecutor
+from balance_book import BalanceBook
+from arb_snapshot import SnapshotFetcher
 
 import logging.handlers
 
@@ -9,8 +12,12 @@ class BTCArb(Strategy):
 
     def __init__(self, db, harness=None, strategy_configuration=None):
         self.done = False
+        self.max_book_skew = None  # seconds between orderbooks, over which we do not look for crosses
+        self.unwind = 'flatten'  # what to do with the imbalance when a leg fails or fills partly : none, flatten or complete
         super(BTCArb, self).__init__(db, harness, strategy_configuration)
 
+        self.fetcher = SnapshotFetcher(max_workers=2, max_skew=self.max_book_skew)
+
         self.logger = logging.getLogger(__name__)
 
         handler = logging.handlers.RotatingFileHandler('BTC_arb.log')
@@ -22,27 +29,55 @@ class BTCArb(Strategy):
 
         self.logger.debug("--Strategy Init--")
 
+        self.executor = ArbExecutor(max_workers=2, unwind=self.unwind, logger=self.logger)
+
+    def configure(self, strategy_configuration):
+        super(BTCArb, self).configure(strategy_configuration)
+        self.init_configurable('max_book_skew', strategy_configuration)
+        self.init_configurable('unwind', strategy_configuration)
+
     def tick(self, open_orders):
 
         self.logger.debug("--Strategy Tick--")
         self.logger.info("Current Orders: " + str(open_orders))
 
-        btc_crosses = arb.detect_cross(
-            self.harness.bitstamp_btc_usd.get_orderbook(),
-             self.harness.bitstamp_btc_eur.get_orderbook()
-        )
+        # both orderbooks at once
+        snapshot = self.fetcher.fetch([
+            self.harness.bitstamp_btc_usd,
+            self.harness.bitstamp_btc_eur,
+        ])
+        self.logger.info(str(snapshot))
+        if not snapshot.synchronized:
+            self.logger.warning("Orderbooks too far apart, not looking for crosses.")
+            return
 
-        for cross in btc_crosses:
-            print("Cross: " + str(cross))
+        # balances fetched once for the tick, updated as legs are sent
+        balances = BalanceBook(snapshot)
+
+        # one cross at most, None without
+        cross = arb.detect_cross(*snapshot.orderbooks)
+
+        if cross:
+            self.logger.info("Cross: " + str(cross))
             executable_volume = arb.get_executable_volume(
                 cross,
-                cross.buy_exchange.get_balance(),
-                cross.sell_exchange.get_balance(),
+                balances.get_balance(cross.buy_exchange),
+                balances.get_balance(cross.sell_exchange),
             )
-            print("Executable Volume:" + str(executable_volume))
+            self.logger.info("Executable Volume:" + str(executable_volume))
             if executable_volume:
-                cross.buy_exchange.market_order(executable_volume, Consts.BID)
-                cross.sell_exchange.market_order(executable_volume, Consts.ASK)
+                execution = self.executor.execute(cross, executable_volume)
+                balances.apply_execution(execution)
+                self.logger.info("Execution: " + str(execution))
+        else:
+            self.logger.info("No Cross detected.")
 
     def is_complete(self):
-        return self.done
\ No newline at end of file
+        return self.done
+
+    def close(self):
+        """
+        Release what the strategy holds besides memory, once it is not ticked any more.
+        """
+        self.fetcher.close()
+        self.executor.close()
\ No newline at end of file
@@ -1,32 +1,191 @@
+import numpy as np
+from cdecimal import Decimal, ROUND_DOWN
+
 from gryphon.execution.strategies.base import Strategy
 from gryphon.lib import arbitrage as arb
-from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.money import Money
+
+from arb_graph import PairGraph
+from arb_executor import ArbExecutor
+from balance_book import BalanceBook
+from arb_snapshot import SnapshotFetcher
+from basic_ts import monotonic_ns
+from book_index import BookSide
+
+try:
+    # compiled from arb.pyx
+    from arb import book_arrays, crossed_pairs, find_crosses, rates_to
+except ImportError:
+    find_crosses = None
+
+
+VOLUME_PRECISION = Decimal('0.00000001')
+
+
+class KernelCross(object):
+    """
+    A cross found by the compiled kernel, with the volume executable on the books, fees included.
+    """
+
+    def __init__(self, buy_exchange, sell_exchange, buy_ob, volume, profit):
+        self.buy_exchange = buy_exchange
+        self.sell_exchange = sell_exchange
+        self.buy_ob = buy_ob
+        self.volume = volume  # Money, in volume currency
+        self.profit = profit  # float, in the price currency of the first book
+
+    def __str__(self):
+        return "buy " + str(self.volume) + " on " + str(self.buy_exchange.name) + ", sell on " + str(self.sell_exchange.name) + ", profit " + str(self.profit)
 
 
 class ETHArb(Strategy):
 
     def __init__(self, db, harness=None, strategy_configuration=None):
         self.done = False
+        self.max_book_skew = None  # seconds between orderbooks, over which we do not look for crosses
+        self.unwind = 'flatten'  # what to do with the imbalance when a leg fails or fills partly : none, flatten or complete
+        self.cycle_pairs = None  # comma separated exchange keys, to look for multi-hop cycles between them
+        self.cycle_max_hops = 3
+        self.fx_refresh = 60  # seconds a conversion rate between price currencies is kept
+        # books compared directly
+        self.pairs = [
+            'bitstamp_eth_eur',
+            #'bitstamp_eth_btc',
+            'bitstamp_eth_usd',
+        ]
         super(ETHArb, self).__init__(db, harness, strategy_configuration)
 
+        self.graph = None
+        if self.cycle_pairs:
+            self.graph = PairGraph(max_hops=int(self.cycle_max_hops))
+            for key in [k.strip() for k in self.cycle_pairs.split(',')]:
+                self.graph.add_pair(key, fee=getattr(self.harness, key).market_order_fee)
+
+        self.fetcher = SnapshotFetcher(max_workers=3, max_skew=self.max_book_skew)
+        self.executor = ArbExecutor(max_workers=2, unwind=self.unwind)
+        self.rates = {}  # (currency, to currency) -> (rate, monotonic ns when fetched)
+
+    def configure(self, strategy_configuration):
+        super(ETHArb, self).configure(strategy_configuration)
+        self.init_configurable('max_book_skew', strategy_configuration)
+        self.init_configurable('unwind', strategy_configuration)
+        self.init_configurable('cycle_pairs', strategy_configuration)
+        self.init_configurable('cycle_max_hops', strategy_configuration)
+        self.init_configurable('fx_refresh', strategy_configuration)
+
     def tick(self, open_orders):
-        eth_crosses = arb.detect_crosses_between_many_orderbooks(
-            [self.harness.bitstamp_eth_eur.get_orderbook(),
-            #self.harness.bitstamp_eth_btc.get_orderbook(),
-            self.harness.bitstamp_eth_usd.get_orderbook(),]
-        )
+        keys = list(self.pairs)
+        if self.graph is not None:
+            keys += [k for k in self.graph.edges if k not in keys]
+
+        # all orderbooks at once
+        snapshot = self.fetcher.fetch([getattr(self.harness, k) for k in keys])
+        if not snapshot.synchronized:
+            print("Orderbooks too far apart, not looking for crosses. " + str(snapshot))
+            return
+
+        if self.graph is not None:
+            for key, book in zip(keys, snapshot.books):
+                if key in self.graph.edges:
+                    self.graph.update(key, book.ob)
+            for cycle in self.graph.profitable_cycles():
+                print("Cycle: " + str(cycle))
+
+        books = snapshot.books[:len(self.pairs)]
+        if find_crosses is None:
+            eth_crosses = arb.detect_crosses_between_many_orderbooks([b.ob for b in books])
+        else:
+            eth_crosses = self.detect_crosses(books)
+
+        # balances fetched once for the tick, updated as legs are sent
+        balances = BalanceBook(snapshot)
 
         for cross in eth_crosses:
             print("Cross: " + str(cross))
-            executable_volume = arb.get_executable_volume(
-                cross,
-                cross.buy_exchange.get_balance(),
-                cross.sell_exchange.get_balance(),
-            )
+            if isinstance(cross, KernelCross):
+                executable_volume = self.executable_volume(cross, balances)
+            else:
+                executable_volume = arb.get_executable_volume(
+                    cross,
+                    balances.get_balance(cross.buy_exchange),
+                    balances.get_balance(cross.sell_exchange),
+                )
             print("Executable Volume:" + str(executable_volume))
             if executable_volume:
-                cross.buy_exchange.market_order(executable_volume, Consts.BID)
-                cross.sell_exchange.market_order(executable_volume, Consts.ASK)
+                execution = self.executor.execute(cross, executable_volume)
+                balances.apply_execution(execution)
+                print("Execution: " + str(execution))
+
+    def conversion_rates(self, orderbooks):
+        """
+        Price multipliers to the price currency of the first book, for book_arrays().
+        Rates are fetched again every fx_refresh seconds only.
+        """
+        currency = orderbooks[0]['bids'][0].price.currency
+        now = monotonic_ns()
+        rates = []
+        for ob in orderbooks:
+            key = (ob['bids'][0].price.currency, currency)
+            cached = self.rates.get(key)
+            if cached is None or now - cached[1] > float(self.fx_refresh) * 1e9:
+                cached = self.rates[key] = (rates_to([ob], currency)[0], now)
+            rates.append(cached[0])
+        return rates
+
+    def detect_crosses(self, books):
+        """
+        Scan all pairs of books with the compiled kernel, its volumes are the ones we size orders from.
+        :param books: list of arb_snapshot.StampedOrderbook
+        :return: list of KernelCross, most profitable first, one per pair of books at most
+        """
+        orderbooks = [b.ob for b in books]
+        if any(not ob['bids'] or not ob['asks'] for ob in orderbooks):
+            return arb.detect_crosses_between_many_orderbooks(orderbooks)
+
+        fees = np.array([float(b.exchange.market_order_fee) for b in books])
+        volumes, profits = find_crosses(*book_arrays(orderbooks, rates=self.conversion_rates(orderbooks)), fees=fees)
+
+        crosses = []
+        seen = set()
+        for buyer, seller, volume, profit in crossed_pairs(volumes, profits):
+            pair = frozenset((buyer, seller))
+            if pair in seen:
+                continue
+            seen.add(pair)
+            currency = orderbooks[buyer]['asks'][0].volume.currency
+            amount = Decimal(repr(volume)).quantize(VOLUME_PRECISION, rounding=ROUND_DOWN)
+            crosses.append(KernelCross(books[buyer].exchange, books[seller].exchange, orderbooks[buyer],
+                                       Money(amount, currency=currency), profit))
+        return crosses
+
+    def executable_volume(self, cross, balances):
+        """
+        Kernel volume of a cross, down to what we can sell and pay for.
+        :param balances: balance_book.BalanceBook
+        :return: Money, None if under the minimum order size of either exchange
+        """
+        volume = cross.volume
+        currency = volume.currency
+        volume = min(volume, balances.get_balance(cross.sell_exchange)[currency])
+
+        asks = BookSide(cross.buy_ob['asks'], descending=False)
+        price_currency = asks.best.currency
+        budget = balances.get_balance(cross.buy_exchange)[price_currency].amount / (1 + cross.buy_exchange.market_order_fee)
+        affordable = Decimal(asks.volume_for_cost(budget)).quantize(VOLUME_PRECISION, rounding=ROUND_DOWN)
+        volume = min(volume, Money(affordable, currency=currency))
+
+        for exchange in (cross.buy_exchange, cross.sell_exchange):
+            min_order_size = getattr(exchange, 'min_order_size', None)
+            if volume.amount <= 0 or (min_order_size is not None and volume < min_order_size):
+                return None
+        return volume
 
     def is_complete(self):
-        return self.done
\ No newline at end of file
+        return self.done
+
+    def close(self):
+        """
+        Release what the strategy holds besides memory, once it is not ticked any more.
+        """
+        self.fetcher.close()
+        self.executor.close()
\ No newline at end of file
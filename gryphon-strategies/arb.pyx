@@ -1,29 +1,161 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True
+"""
+Compiled cross detection between N orderbooks, and the Arb strategy.
+
+find_crosses() scans every ordered pair of books (buy on one, sell on the other) on typed arrays
+of their top levels, fees included, and gives the executable volume and profit for each pair.
+
+Needs Cython 3 (see requirements.txt) and numpy's include directory to compile, e.g. with pyximport.
+"""
+import numpy as np
+
+from libc.math cimport isnan
+
 from gryphon.execution.strategies.base import Strategy
 from gryphon.lib import arbitrage as arb
-from gryphon.lib.exchange.consts import Consts
+
+from arb_executor import ArbExecutor
+from balance_book import BalanceBook
+from arb_snapshot import SnapshotFetcher
+
+
+def book_arrays(orderbooks, int depth=20, rates=None):
+    """
+    Top levels of several orderbooks, as find_crosses() takes them.
+    :param rates: price multipliers to a common currency, one per book, None if they already share one
+    :return: (bid_prices, bid_volumes, ask_prices, ask_volumes), N x depth float64 arrays, NaN padded
+    """
+    n = len(orderbooks)
+    bid_prices, bid_volumes, ask_prices, ask_volumes = [np.full((n, depth), np.nan) for _ in range(4)]
+    for i, ob in enumerate(orderbooks):
+        rate = 1. if rates is None else float(rates[i])
+        for k, level in enumerate(ob['bids'][:depth]):
+            bid_prices[i, k] = float(level.price.amount) * rate
+            bid_volumes[i, k] = float(level.volume.amount)
+        for k, level in enumerate(ob['asks'][:depth]):
+            ask_prices[i, k] = float(level.price.amount) * rate
+            ask_volumes[i, k] = float(level.volume.amount)
+    return bid_prices, bid_volumes, ask_prices, ask_volumes
+
+
+def rates_to(orderbooks, currency):
+    """
+    :return: multipliers bringing the prices of each orderbook to `currency`, for book_arrays()
+    """
+    rates = []
+    for ob in orderbooks:
+        price = ob['bids'][0].price
+        rates.append(1. if price.currency == currency else float(price.to(currency).amount / price.amount))
+    return rates
+
+
+cdef void _cross(const double[:, ::1] ask_prices, const double[:, ::1] ask_volumes,
+                 const double[:, ::1] bid_prices, const double[:, ::1] bid_volumes,
+                 Py_ssize_t buyer, Py_ssize_t seller, double buy_fee, double sell_fee,
+                 double* volume, double* profit) noexcept nogil:
+    # walking up the buyer asks and down the seller bids, while it stays profitable
+    cdef Py_ssize_t a = 0, b = 0, depth = ask_prices.shape[1]
+    cdef double left_ask, left_bid, take, buy, sell
+
+    volume[0] = 0
+    profit[0] = 0
+    if depth == 0:
+        return
+    left_ask = ask_volumes[buyer, 0]
+    left_bid = bid_volumes[seller, 0]
+    while a < depth and b < depth:
+        buy = ask_prices[buyer, a] * (1 + buy_fee)
+        sell = bid_prices[seller, b] * (1 - sell_fee)
+        if isnan(buy) or isnan(sell) or buy >= sell:
+            break
+        take = left_ask if left_ask < left_bid else left_bid
+        volume[0] += take
+        profit[0] += take * (sell - buy)
+        left_ask -= take
+        left_bid -= take
+        if left_ask <= 0:
+            a += 1
+            if a < depth:
+                left_ask = ask_volumes[buyer, a]
+        if left_bid <= 0:
+            b += 1
+            if b < depth:
+                left_bid = bid_volumes[seller, b]
+
+
+def find_crosses(const double[:, ::1] bid_prices, const double[:, ::1] bid_volumes,
+                 const double[:, ::1] ask_prices, const double[:, ::1] ask_volumes,
+                 const double[::1] fees):
+    """
+    Every profitable cross between N orderbooks, in one pass.
+    :param fees: taker fee rate of each book
+    :return: (volumes, profits), N x N arrays where [i, j] is for buying on book i and selling on book j,
+    zero where there is no cross. Profits are in the common price currency.
+    """
+    cdef Py_ssize_t n = bid_prices.shape[0], i, j
+    volumes = np.zeros((n, n))
+    profits = np.zeros((n, n))
+    cdef double[:, ::1] v = volumes
+    cdef double[:, ::1] p = profits
+
+    with nogil:
+        for i in range(n):
+            for j in range(n):
+                if i != j:
+                    _cross(ask_prices, ask_volumes, bid_prices, bid_volumes, i, j, fees[i], fees[j], &v[i, j], &p[i, j])
+    return volumes, profits
+
+
+def crossed_pairs(volumes, profits):
+    """
+    :return: list of (buy book index, sell book index, volume, profit), most profitable first
+    """
+    buyers, sellers = np.nonzero(volumes)
+    pairs = [(int(i), int(j), float(volumes[i, j]), float(profits[i, j])) for i, j in zip(buyers, sellers)]
+    return sorted(pairs, key=lambda pair: -pair[3])
 
 
 class Arb(Strategy):
 
     def __init__(self, db, harness=None, strategy_configuration=None):
         self.done = False
+        self.max_book_skew = None  # seconds between orderbooks, over which we do not look for crosses
+        self.unwind = 'flatten'  # what to do with the imbalance when a leg fails or fills partly : none, flatten or complete
         super(Arb, self).__init__(db, harness, strategy_configuration)
 
+        self.fetcher = SnapshotFetcher(max_workers=2, max_skew=self.max_book_skew)
+        self.executor = ArbExecutor(max_workers=2, unwind=self.unwind)
+
+    def configure(self, strategy_configuration):
+        super(Arb, self).configure(strategy_configuration)
+        self.init_configurable('max_book_skew', strategy_configuration)
+        self.init_configurable('unwind', strategy_configuration)
+
     def tick(self, open_orders):
-        cross = arb.detect_cross(
-            self.harness.kraken_btc_eur.get_orderbook(),
-            self.harness.bitstamp_btc_eur.get_orderbook(),
-        )
+        # both orderbooks at once
+        snapshot = self.fetcher.fetch([
+            self.harness.kraken_btc_eur,
+            self.harness.bitstamp_btc_eur,
+        ])
+        if not snapshot.synchronized:
+            print("Orderbooks too far apart, not looking for crosses. " + str(snapshot))
+            return
+
+        # balances fetched once for the tick, updated as legs are sent
+        balances = BalanceBook(snapshot)
+
+        cross = arb.detect_cross(*snapshot.orderbooks)
 
         if cross:
             executable_volume = arb.get_executable_volume(
                 cross,
-                cross.buy_exchange.get_balance(),
-                cross.sell_exchange.get_balance(),
+                balances.get_balance(cross.buy_exchange),
+                balances.get_balance(cross.sell_exchange),
             )
             if executable_volume:
-                cross.buy_exchange.market_order(executable_volume, Consts.BID)
-                cross.sell_exchange.market_order(executable_volume, Consts.ASK)
+                execution = self.executor.execute(cross, executable_volume)
+                balances.apply_execution(execution)
+                print("Execution: " + str(execution))
             else:
                 print("Executable Volume:" + str(executable_volume))
                 self.done = True
@@ -31,4 +163,11 @@ class Arb(Strategy):
             print("No Cross detected.")
 
     def is_complete(self):
-        return self.done
\ No newline at end of file
+        return self.done
+
+    def close(self):
+        """
+        Release what the strategy holds besides memory, once it is not ticked any more.
+        """
+        self.fetcher.close()
+        self.executor.close()
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""
+Execution of both legs of an arbitrage at once.
+Sending the sell leg after the buy leg has come back leaves it a round-trip late, on a book
+that may have moved. Here both market orders go out together, and if one leg fails or fills
+less than the other, the difference is unwound.
+Fills are read back from the exchange. A leg whose fill could not be read stays unconfirmed, and
+nothing is unwound for an execution with such a leg, as its imbalance is not known.
+"""
+import logging
+from multiprocessing.pool import ThreadPool
+
+from gryphon.lib.money import Money
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.exchange.exceptions import ExchangeAPIErrorException, ExchangeAPIFailureException
+
+from basic_ts import monotonic_ns
+from order_batch import OrderIntent, dispatch
+
+
+UNWIND_NONE = 'none'  # keep the imbalance
+UNWIND_FLATTEN = 'flatten'  # undo the excess on the leg that filled more
+UNWIND_COMPLETE = 'complete'  # send the missing volume again on the leg that filled less
+UNWIND_MODES = (UNWIND_NONE, UNWIND_FLATTEN, UNWIND_COMPLETE)
+
+
+class Leg(object):
+
+    def __init__(self, exchange, mode, volume):
+        self.exchange = exchange
+        self.intent = OrderIntent.market(mode, volume)
+        self.result = None  # order_batch.OrderResult
+        self.filled = Money('0', currency=volume.currency)  # as read from the exchange, 0 until confirmed
+        self.price = None  # average fill price, None if unknown
+        self.confirmed = False  # fill read from the exchange
+
+    @property
+    def mode(self):
+        return self.intent.mode
+
+    @property
+    def volume(self):
+        return self.intent.volume
+
+    @property
+    def latency(self):
+        """
+        order round-trip, in seconds
+        """
+        return self.result.duration if self.result is not None else None
+
+    @property
+    def success(self):
+        return self.result is not None and self.result.success
+
+    def __str__(self):
+        if not self.success:
+            status = " FAILED"
+        elif not self.confirmed:
+            status = " UNCONFIRMED"
+        else:
+            status = ""
+        return str(self.exchange.name) + " " + str(self.intent) + " filled: " + str(self.filled) + " @ " + str(self.price) + " in " + str(self.latency) + "s" + status
+
+
+class ArbExecution(object):
+
+    def __init__(self, legs):
+        self.legs = legs  # [buy leg, sell leg]
+        self.unwinds = []
+        self.started = None  # monotonic nanoseconds
+        self.ended = None
+
+    @property
+    def buy(self):
+        return self.legs[0]
+
+    @property
+    def sell(self):
+        return self.legs[1]
+
+    @property
+    def imbalance(self):
+        """
+        volume bought minus volume sold, unwinds included. Positive when we are left long.
+        Unconfirmed legs count as not filled, see confirmed.
+        """
+        imbalance = self.buy.filled - self.sell.filled
+        for leg in self.unwinds:
+            imbalance += leg.filled if leg.mode == Consts.BID else -leg.filled
+        return imbalance
+
+    @property
+    def confirmed(self):
+        """
+        False if a leg was sent but its fill is not known, the imbalance is then unknown as well
+        """
+        return all(leg.confirmed for leg in self.legs if leg.success)
+
+    @property
+    def complete(self):
+        return self.buy.success and self.sell.success and self.confirmed and not self.imbalance.amount
+
+    @property
+    def skew(self):
+        """
+        in seconds, between the first leg sent and the last one answered
+        """
+        return (max(l.result.ended for l in self.legs) - min(l.result.started for l in self.legs)) / 1e9
+
+    @property
+    def duration(self):
+        return (self.ended - self.started) / 1e9
+
+    def __str__(self):
+        s = "Buy: " + str(self.buy) + " Sell: " + str(self.sell) + " skew: " + str(self.skew) + "s"
+        for leg in self.unwinds:
+            s += " Unwind: " + str(leg)
+        return s + " imbalance: " + str(self.imbalance) + " in " + str(self.duration) + "s"
+
+
+class ArbExecutor(object):
+    """
+    Sends the legs of an arbitrage concurrently, on a bounded pool of threads.
+    """
+
+    def __init__(self, max_workers=2, unwind=UNWIND_FLATTEN, logger=None):
+        if unwind not in UNWIND_MODES:
+            raise ValueError("unwind should be one of " + ", ".join(UNWIND_MODES) + ", not " + str(unwind))
+        self.pool = ThreadPool(max_workers)
+        self.unwind = unwind
+        self.logger = logger or logging.getLogger(__name__)
+
+    def _send(self, leg):
+        leg.result = dispatch(leg.exchange, leg.intent)
+        if leg.success:
+            self._read_fill(leg)
+        return leg
+
+    def _read_fill(self, leg):
+        """
+        Fill of a leg, as the exchange reports it. The leg stays unconfirmed if it cannot be read.
+        """
+        response = leg.result.response or {}
+        order_id = response.get('order_id')
+        if order_id is None or not hasattr(leg.exchange, 'get_order_details'):
+            self.logger.warning("No order details for " + str(leg) + ", fill unknown")
+            return
+        try:
+            details = leg.exchange.get_order_details(order_id)
+        except (ExchangeAPIErrorException, ExchangeAPIFailureException) as e:
+            self.logger.error("Reading the fill of " + str(leg) + " failed: " + str(e))
+            return
+        leg.filled = details['btc_total']
+        if leg.filled.amount:
+            leg.price = details['fiat_total'] / leg.filled.amount
+        leg.confirmed = True
+
+    def execute(self, cross, volume):
+        """
+        Buy `volume` on the cross buy exchange and sell it on the sell exchange, at the same time.
+        :return: ArbExecution
+        """
+        execution = ArbExecution([
+            Leg(cross.buy_exchange, Consts.BID, volume),
+            Leg(cross.sell_exchange, Consts.ASK, volume),
+        ])
+        execution.started = monotonic_ns()
+        self.pool.map(self._send, execution.legs)
+
+        imbalance = execution.imbalance
+        if not execution.confirmed:
+            # unwinding a guess could open the position it means to close
+            self.logger.error("Fills unknown, not unwinding: " + str(execution.buy) + " / " + str(execution.sell))
+        elif imbalance.amount and self.unwind != UNWIND_NONE:
+            execution.unwinds = [self._send(self._unwind_leg(execution, imbalance))]
+        execution.ended = monotonic_ns()
+        return execution
+
+    def _unwind_leg(self, execution, imbalance):
+        if imbalance.amount > 0:
+            # long: sell the excess
+            exchange = execution.buy.exchange if self.unwind == UNWIND_FLATTEN else execution.sell.exchange
+            return Leg(exchange, Consts.ASK, imbalance)
+        exchange = execution.sell.exchange if self.unwind == UNWIND_FLATTEN else execution.buy.exchange
+        return Leg(exchange, Consts.BID, -imbalance)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
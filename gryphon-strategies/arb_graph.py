@@ -0,0 +1,181 @@
+"""
+Multi-hop arbitrage detection over a graph of currencies.
+
+Each pair (e.g. bitstamp_eth_btc) gives two edges : selling the base at the best bid, and buying it
+at the best ask, both after fees. Edges are weighted by the log of their rate, so a cycle is profitable
+when its weights sum above zero (ETH -> BTC -> EUR -> ETH and the like).
+
+Cycles are enumerated once, when pairs are added. On each tick, only the edges of pairs whose top of
+book changed are recomputed, and only the cycles going through them are evaluated again.
+"""
+import math
+
+from gryphon.lib.exchange.consts import Consts
+
+
+def currencies(exchange_key):
+    """
+    'bitstamp_eth_btc' -> ('ETH', 'BTC')
+    """
+    base, quote = exchange_key.split('_')[-2:]
+    return base.upper(), quote.upper()
+
+
+class Edge(object):
+
+    def __init__(self, key, source, target, mode):
+        self.key = key  # exchange key of the pair
+        self.source = source  # currency given
+        self.target = target  # currency received
+        self.mode = mode  # order to place on the pair : ASK sells the base, BID buys it
+        self.price = None  # best price used
+        self.volume = None  # volume available at that price, in base currency
+        self.log_rate = None  # log of target received per source given, after fees
+
+    @property
+    def capacity(self):
+        """
+        most we can give at the best price, in source currency
+        """
+        if self.volume is None:
+            return None
+        return self.volume if self.mode == Consts.ASK else self.volume * self.price
+
+    def __str__(self):
+        return self.source + "->" + self.target + " (" + str(self.mode) + " " + self.key + " @ " + str(self.price) + ")"
+
+
+class Cycle(object):
+
+    def __init__(self, edges):
+        self.edges = edges
+        self.log_return = None
+
+    @property
+    def currencies(self):
+        return [e.source for e in self.edges] + [self.edges[0].source]
+
+    def evaluate(self):
+        if any(e.log_rate is None for e in self.edges):
+            self.log_return = None
+        else:
+            self.log_return = sum(e.log_rate for e in self.edges)
+        return self.log_return
+
+    @property
+    def profit(self):
+        """
+        relative gain over the whole cycle, after fees
+        """
+        return math.exp(self.log_return) - 1 if self.log_return is not None else None
+
+    @property
+    def volume(self):
+        """
+        most we can put in the cycle at the best prices, in the starting currency
+        """
+        best = None
+        log_rate = 0.
+        for e in self.edges:
+            # capacity of this hop, brought back to the starting currency
+            capacity = e.capacity / math.exp(log_rate)
+            best = capacity if best is None else min(best, capacity)
+            log_rate += e.log_rate
+        return best
+
+    def __str__(self):
+        return " -> ".join(self.currencies) + " profit: " + str(self.profit) + " volume: " + str(self.volume) + " " + self.edges[0].source + " via " + ", ".join(e.key for e in self.edges)
+
+
+class PairGraph(object):
+
+    def __init__(self, max_hops=3, min_profit=0.):
+        """
+        :param max_hops: longest cycle looked for
+        :param min_profit: relative profit under which cycles are ignored
+        """
+        self.max_hops = max_hops
+        self.min_log_return = math.log(1 + min_profit)
+
+        self.fees = {}  # pair key -> taker fee rate
+        self.edges = {}  # pair key -> (sell base edge, buy base edge)
+        self.tops = {}  # pair key -> (best bid, best ask) last seen
+        self.cycles = []
+        self.cycles_by_pair = {}  # pair key -> cycles using that pair
+        self.profitable = set()
+
+    def add_pair(self, key, fee=0.):
+        base, quote = currencies(key)
+        self.fees[key] = float(fee)
+        self.edges[key] = (Edge(key, base, quote, Consts.ASK), Edge(key, quote, base, Consts.BID))
+        self._enumerate_cycles()
+
+    def _enumerate_cycles(self):
+        outgoing = {}
+        for pair_edges in self.edges.values():
+            for e in pair_edges:
+                outgoing.setdefault(e.source, []).append(e)
+
+        order = dict((c, i) for i, c in enumerate(sorted(outgoing)))
+        cycles = []
+
+        def extend(start, path, visited):
+            for e in outgoing.get(path[-1].target, []):
+                if e.target == start:
+                    cycles.append(Cycle(path + [e]))
+                # each cycle is found once, from its smallest currency
+                elif len(path) + 1 < self.max_hops and e.target not in visited and order[e.target] > order[start] and e.key not in (p.key for p in path):
+                    extend(start, path + [e], visited | set([e.target]))
+
+        for start in sorted(outgoing):
+            for e in outgoing[start]:
+                if order[e.target] > order[start]:
+                    extend(start, [e], set([start, e.target]))
+
+        # a pair traded back and forth is not a cycle
+        self.cycles = [c for c in cycles if len(set(e.key for e in c.edges)) == len(c.edges)]
+        self.cycles_by_pair = {}
+        for c in self.cycles:
+            for e in c.edges:
+                self.cycles_by_pair.setdefault(e.key, []).append(c)
+        self.profitable = set()
+
+    def update(self, key, ob):
+        """
+        New orderbook for a pair. Nothing is recomputed if its top of book did not change.
+        :return: True if the top of book changed
+        """
+        if not ob['bids'] or not ob['asks']:
+            top = None
+        else:
+            bid, ask = ob['bids'][0], ob['asks'][0]
+            top = (bid.price.amount, bid.volume.amount, ask.price.amount, ask.volume.amount)
+        if self.tops.get(key) == top and key in self.tops:
+            return False
+        self.tops[key] = top
+
+        sell, buy = self.edges[key]
+        keep = 1. - self.fees[key]
+        if top is None:
+            for e in (sell, buy):
+                e.price = e.volume = e.log_rate = None
+        else:
+            bid_price, bid_volume, ask_price, ask_volume = [float(x) for x in top]
+            sell.price, sell.volume = bid_price, bid_volume
+            sell.log_rate = math.log(bid_price * keep)
+            buy.price, buy.volume = ask_price, ask_volume
+            buy.log_rate = math.log(keep / ask_price)
+
+        for c in self.cycles_by_pair.get(key, []):
+            log_return = c.evaluate()
+            if log_return is not None and log_return > self.min_log_return:
+                self.profitable.add(c)
+            else:
+                self.profitable.discard(c)
+        return True
+
+    def profitable_cycles(self):
+        """
+        :return: cycles currently profitable, most profitable first
+        """
+        return sorted(self.profitable, key=lambda c: -c.log_return)
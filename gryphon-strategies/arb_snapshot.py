@@ -0,0 +1,79 @@
+"""
+Orderbooks of all the legs of an arbitrage, fetched at the same time.
+Fetching them one after the other leaves the first one stale by a round-trip when we compare them,
+and crosses found between books seen at different times are often gone already.
+"""
+from multiprocessing.pool import ThreadPool
+
+from basic_ts import monotonic_ns
+
+
+class StampedOrderbook(object):
+
+    def __init__(self, exchange, ob, started, ended):
+        self.exchange = exchange
+        self.ob = ob
+        self.started = started  # monotonic nanoseconds
+        self.ended = ended
+
+    @property
+    def latency(self):
+        """
+        fetch round-trip, in seconds
+        """
+        return (self.ended - self.started) / 1e9
+
+
+class ArbSnapshot(object):
+
+    def __init__(self, books, max_skew=None):
+        """
+        :param books: list of StampedOrderbook
+        :param max_skew: in seconds, None for no bound
+        """
+        self.books = books
+        self.max_skew = max_skew
+
+    @property
+    def orderbooks(self):
+        return [b.ob for b in self.books]
+
+    @property
+    def skew(self):
+        """
+        in seconds, between the first fetch started and the last one completed:
+        no two books are further apart in time than this
+        """
+        return (max(b.ended for b in self.books) - min(b.started for b in self.books)) / 1e9
+
+    @property
+    def synchronized(self):
+        return self.max_skew is None or self.skew <= self.max_skew
+
+    def __str__(self):
+        return "Skew: " + str(self.skew) + "s latencies: " + ", ".join(str(b.exchange.name) + " " + str(b.latency) + "s" for b in self.books)
+
+
+class SnapshotFetcher(object):
+    """
+    Fetches the orderbooks of several exchanges concurrently, on a bounded pool of threads.
+    """
+
+    def __init__(self, max_workers=4, max_skew=None):
+        self.pool = ThreadPool(max_workers)
+        self.max_skew = None if max_skew is None else float(max_skew)
+
+    def _fetch(self, exchange):
+        started = monotonic_ns()
+        ob = exchange.get_orderbook()
+        return StampedOrderbook(exchange, ob, started, monotonic_ns())
+
+    def fetch(self, exchanges):
+        """
+        :return: ArbSnapshot, books in the same order as the exchanges
+        """
+        return ArbSnapshot(self.pool.map(self._fetch, exchanges), max_skew=self.max_skew)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,504 @@
+"""
+Offline backtest : replays recorded orderbooks through the tick() of an unmodified strategy,
+as fast as the CPU allows, with no network and no database.
+
+BacktestHarness stands in for the gryphon harness, BacktestExchange for the exchanges it gives out.
+Orders are matched against the recorded orderbooks with the FillSimulator, and balances and positions
+are kept by the BacktestExchange. Strategies reading the time from basic_ts see the recorded time,
+so timeouts and time bars do not depend on how fast the replay runs.
+
+Usage :
+    python backtest.py dynamic_market_making.DynamicMarketMaking dynamic_market_making.conf <orderbooks> \
+        --exchange bitstamp_btc_eur --balance bitstamp_btc_eur:EUR:1000 --balance bitstamp_btc_eur:BTC:0.1
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import time
+
+try:
+    from ConfigParser import RawConfigParser
+except ImportError:
+    from configparser import RawConfigParser
+
+import numpy as np
+from cdecimal import Decimal, InvalidOperation
+
+from gryphon.lib.money import Money
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.metrics import midpoint as midpoint_lib
+
+import ob_recorder
+import ob_stream
+from basic_ts import set_replay_time
+from fill_simulator import FillSimulator
+from orderbook import BookLevel, currencies
+
+
+# settings of live runs, that would have a backtest restore and extend the live indicator stores and recordings
+LIVE_ONLY = ('ts_directory', 'ob_directory')
+
+
+class SimOrder(object):
+    __slots__ = ('mode', 'id', 'kind', 'price', 'volume', 'volume_filled', 'seq')
+
+    def __init__(self, mode, id, kind, price, volume, seq):
+        self.mode = mode
+        self.id = id
+        self.kind = kind
+        self.price = price
+        self.volume = volume
+        self.volume_filled = Money('0', currency=volume.currency)
+        self.seq = seq
+
+
+class BacktestAccount(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.position = {}
+
+
+class BacktestExchange(object):
+    """
+    Same interface as the exchanges given by the harness, over recorded orderbooks.
+    It is its own exchange_wrapper.
+    """
+
+    def __init__(self, key, balance=None, fee=Decimal('0.0025'), limit_order_fee=None, market_order_fee=None, min_order_size=None):
+        self.key = key
+        self.name = key.upper()
+        self.volume_currency, self.price_currency = currencies(key)
+
+        self.exchange_wrapper = self
+        self.exchange_account = BacktestAccount(self.name)
+        self.fee = Decimal(fee)
+        self.limit_order_fee = self.fee if limit_order_fee is None else Decimal(limit_order_fee)
+        self.market_order_fee = self.fee if market_order_fee is None else Decimal(market_order_fee)
+        self.min_order_size = min_order_size if min_order_size is not None else Money('0', currency=self.volume_currency)
+
+        self.balance = {
+            self.volume_currency: Money('0', currency=self.volume_currency),
+            self.price_currency: Money('0', currency=self.price_currency),
+        }
+        self.balance.update(balance or {})
+        self.initial_balance = dict(self.balance)
+        self.exchange_account.position = {
+            self.volume_currency: Money('0', currency=self.volume_currency),
+            self.price_currency: Money('0', currency=self.price_currency),
+        }
+
+        self.ob = None
+        self.simulator = FillSimulator()
+        self.open_orders = {}
+        self.orders_count = 0
+        self.order_details = {}  # order id -> as given by get_order_details()
+        self.eaten_order_ids = []  # orders done filling since the last tick
+
+        # statistics
+        self.fills = 0
+        self.volume_traded = Money('0', currency=self.volume_currency)
+        self.fees_paid = Money('0', currency=self.price_currency)
+
+    # replay
+
+    def update(self, bids, asks):
+        """
+        A new orderbook, resting orders are matched against it.
+        :param bids: list of (price, volume), best first
+        :param asks: list of (price, volume), best first
+        """
+        self.ob = {
+            'bids': [BookLevel(Money(p, self.price_currency), Money(v, self.volume_currency), self, Consts.BID) for p, v in bids],
+            'asks': [BookLevel(Money(p, self.price_currency), Money(v, self.volume_currency), self, Consts.ASK) for p, v in asks],
+        }
+        for order, volume in self.simulator.match(self.ob):
+            self._execute(order, volume, order.price, self.limit_order_fee)
+
+    def midpoint(self):
+        if self.ob and self.ob['bids'] and self.ob['asks']:
+            return midpoint_lib.get_midpoint_from_orderbook(self.ob)
+
+    # funds
+
+    def _available(self, currency):
+        locked = Money('0', currency=currency)
+        for o in self.open_orders.values():
+            remaining = o.volume - o.volume_filled
+            if o.mode == Consts.BID and currency == self.price_currency:
+                locked += remaining.amount * o.price
+            elif o.mode == Consts.ASK and currency == self.volume_currency:
+                locked += remaining
+        return self.balance[currency] - locked
+
+    def _affordable(self, mode, volume, price):
+        if mode == Consts.BID:
+            return self._available(self.price_currency) >= price * volume.amount
+        return self._available(self.volume_currency) >= volume
+
+    def _execute(self, order, volume, price, fee_rate):
+        """
+        Apply a fill of `volume` at `price` to our balances
+        """
+        cost = price * volume.amount
+        fee = cost * fee_rate
+        sign = 1 if order.mode == Consts.BID else -1
+        position = self.exchange_account.position
+        for books in (self.balance, position):
+            books[self.volume_currency] += volume * sign
+            books[self.price_currency] -= cost * sign
+            books[self.price_currency] -= fee
+
+        details = self.order_details[order.id]
+        details['btc_total'] += volume
+        details['fiat_total'] += cost
+
+        order.volume_filled += volume
+        if order.volume_filled >= order.volume:
+            self.open_orders.pop(order.id, None)
+            self.simulator.forget(order)
+            self.eaten_order_ids.append(order.id)
+
+        self.fills += 1
+        self.volume_traded += volume
+        self.fees_paid += fee
+
+    def _new_order(self, mode, kind, volume, price):
+        self.orders_count += 1
+        # unique across exchanges, as the harness gives the eaten ones of all exchanges together
+        order = SimOrder(mode, self.key + "-" + str(self.orders_count), kind, price, volume, self.orders_count)
+        self.order_details[order.id] = {
+            'type': mode,
+            'btc_total': Money('0', currency=self.volume_currency),
+            'fiat_total': Money('0', currency=self.price_currency),
+            'trades': [],
+        }
+        return order
+
+    # exchange interface
+
+    def get_orderbook(self, *args, **kwargs):
+        return self.ob
+
+    def get_balance(self):
+        return dict(self.balance)
+
+    def get_open_orders(self):
+        return [{
+            'mode': o.mode,
+            'id': o.id,
+            'price': o.price,
+            'volume_remaining': o.volume - o.volume_filled,
+        } for o in sorted(self.open_orders.values(), key=lambda o: o.seq)]
+
+    def get_order_details(self, order_id):
+        """
+        :return: volume (btc_total) and cost (fiat_total) filled so far, as gryphon exchanges give them
+        """
+        return dict(self.order_details[order_id])
+
+    def limit_order(self, mode, volume, price, *args, **kwargs):
+        if volume < self.min_order_size or not self._affordable(mode, volume, price):
+            return {'success': False}
+
+        order = self._new_order(mode, 'limit', volume, price)
+        self.open_orders[order.id] = order
+        filled = self.simulator.placed(order, self.ob)
+        if filled > 0:
+            # crossing the book : the price we asked for, at worst
+            self._execute(order, filled, price, self.market_order_fee)
+        return {'success': True, 'order_id': order.id}
+
+    def market_order(self, volume, mode, *args, **kwargs):
+        if volume < self.min_order_size:
+            return {'success': False}
+
+        order = self._new_order(mode, 'market', volume, None)
+        cost = Money('0', currency=self.price_currency)
+        # walking the book, as long as we can pay for it
+        for level in (self.ob['asks'] if mode == Consts.BID else self.ob['bids']):
+            if order.volume_filled >= volume:
+                break
+            fill = min(level.volume, volume - order.volume_filled)
+            if not self._affordable(mode, fill, level.price):
+                break
+            self._execute(order, fill, level.price, self.market_order_fee)
+            cost += level.price * fill.amount
+
+        if not order.volume_filled:
+            return {'success': False}
+        if order.volume_filled < volume:
+            # the book was not deep enough, the rest is not pending anywhere
+            self.eaten_order_ids.append(order.id)
+        # average execution price
+        return {'success': True, 'order_id': order.id, 'price': cost / order.volume_filled.amount}
+
+    def cancel_order(self, order_id=None, *args, **kwargs):
+        order = self.open_orders.pop(order_id, None)
+        if order is not None:
+            self.simulator.forget(order)
+        return order is not None
+
+    def cancel_all_open_orders(self, *args, **kwargs):
+        for oid in list(self.open_orders):
+            self.cancel_order(oid)
+
+    def eaten(self):
+        """
+        :return: ids of the orders done filling since the last call, as the harness gives them to strategies
+        """
+        eaten, self.eaten_order_ids = self.eaten_order_ids, []
+        return eaten
+
+    def consolidate_ledger(self):
+        return self.get_open_orders(), []
+
+
+class BacktestHarness(object):
+    """
+    Stands in for the gryphon harness. Exchanges are reachable by key, as attributes too.
+    """
+
+    def __init__(self, exchanges):
+        self.exchanges = dict((e.key, e) for e in exchanges)
+        self.execute = True  # our exchanges answer like real ones
+
+    def exchange_from_key(self, key):
+        return self.exchanges[key.lower()]
+
+    def log(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['exchanges'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class BacktestReport(object):
+
+    def __init__(self, exchanges, timestamps, equity, elapsed):
+        """
+        :param equity: dict of price currency -> numpy array of our balances value, on each tick
+        """
+        self.exchanges = exchanges
+        self.timestamps = timestamps
+        self.equity = equity
+        self.elapsed = elapsed
+
+    @property
+    def ticks(self):
+        return len(self.timestamps)
+
+    def pnl(self, currency):
+        curve = self.equity[currency]
+        return float(curve[-1] - curve[0]) if len(curve) else 0.
+
+    def max_drawdown(self, currency):
+        """
+        largest drop of our balances value from a previous peak
+        """
+        curve = self.equity[currency]
+        if not len(curve):
+            return 0.
+        return float((np.maximum.accumulate(curve) - curve).max())
+
+    def __str__(self):
+        lines = ["Backtest: " + str(self.ticks) + " ticks in " + str(round(self.elapsed, 2)) + "s (" + str(int(self.ticks / self.elapsed) if self.elapsed else 0) + " ticks/s)"]
+        for e in self.exchanges:
+            lines.append(e.name + ": " + str(e.fills) + " fills, volume " + str(e.volume_traded) + ", fees " + str(e.fees_paid))
+            lines.append("  balance " + str(e.initial_balance) + " -> " + str(e.balance))
+        for currency in sorted(self.equity):
+            lines.append(currency + " PnL: " + str(round(self.pnl(currency), 8)) + " max drawdown: " + str(round(self.max_drawdown(currency), 8)))
+        return "\n".join(lines)
+
+
+class Backtest(object):
+
+    def __init__(self, strategy_class, strategy_configuration, exchanges, quiet=True):
+        """
+        :param strategy_configuration: dict, as parsed by load_configuration(). LIVE_ONLY settings are ignored.
+        :param exchanges: list of BacktestExchange
+        :param quiet: disable logging below WARNING during the replay, it is most of the time spent otherwise
+        """
+        self.exchanges = exchanges
+        self.harness = BacktestHarness(exchanges)
+        self.quiet = quiet
+        strategy_configuration = dict((k, v) for k, v in strategy_configuration.items() if k not in LIVE_ONLY)
+        self.strategy = strategy_class(None, self.harness, strategy_configuration)
+
+        tick = self.strategy.tick
+        # strategies take either (current_orders) or (current_orders, eaten_order_ids)
+        self.tick_args = tick.__code__.co_argcount - 1
+
+    def _position(self):
+        # Strategy.position comes from the database otherwise
+        currency = getattr(self.strategy, 'volume_currency', self.exchanges[0].volume_currency)
+        total = Money('0', currency=currency)
+        for e in self.exchanges:
+            if e.volume_currency == currency:
+                total += e.exchange_account.position[currency]
+        return total
+
+    def _equity(self, equity):
+        values = {}
+        for e in self.exchanges:
+            midpoint = e.midpoint()
+            if midpoint is None:
+                continue
+            value = e.balance[e.volume_currency].amount * midpoint.amount + e.balance[e.price_currency].amount
+            values[e.price_currency] = values.get(e.price_currency, 0) + float(value)
+        for currency, value in values.items():
+            equity.setdefault(currency, []).append(value)
+
+    def run(self, snapshots):
+        """
+        :param snapshots: iterable of (timestamp, exchange key, bids, asks), in time order, timestamps in
+        nanoseconds since epoch. Snapshots with the same timestamp make one tick.
+        The strategy clocks (basic_ts now_ns, monotonic_ns and now) give the recorded time meanwhile,
+        so timeouts and time bars follow the recording, whatever the replay speed.
+        :return: BacktestReport
+        """
+        timestamps = []
+        equity = {}
+        if self.quiet:
+            logging.disable(logging.WARNING)
+        started = time.time()
+        try:
+            current = None
+            for timestamp, key, bids, asks in snapshots:
+                if current is not None and timestamp != current:
+                    if self._tick(current, timestamps, equity):
+                        break
+                current = timestamp
+                self.harness.exchange_from_key(key).update(bids, asks)
+            else:
+                if current is not None:
+                    self._tick(current, timestamps, equity)
+        finally:
+            set_replay_time(None)
+            if self.quiet:
+                logging.disable(logging.NOTSET)
+
+        return BacktestReport(self.exchanges, np.array(timestamps),
+                              dict((c, np.array(v)) for c, v in equity.items()),
+                              time.time() - started)
+
+    def _tick(self, timestamp, timestamps, equity):
+        """
+        :return: True if the strategy is done
+        """
+        set_replay_time(timestamp)
+        self.strategy._position = self._position()
+        current_orders = {}
+        eaten_order_ids = []
+        for e in self.exchanges:
+            eaten_order_ids += e.eaten()
+        if self.tick_args >= 2:
+            self.strategy.tick(current_orders, eaten_order_ids)
+        else:
+            self.strategy.tick(current_orders)
+        timestamps.append(timestamp)
+        self._equity(equity)
+        return hasattr(self.strategy, 'is_complete') and bool(self.strategy.is_complete())
+
+
+def read_jsonl(path):
+    """
+    Orderbook snapshots, one JSON object per line :
+    {"timestamp": 1500000000.0, "exchange": "bitstamp_btc_eur", "bids": [["4000.1", "0.5"], ...], "asks": [...]}
+    Timestamps are in seconds since epoch, and given in nanoseconds.
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                s = json.loads(line)
+                yield int(Decimal(str(s['timestamp'])) * 10 ** 9), s['exchange'], s['bids'], s['asks']
+
+
+def parse_value(value):
+    """
+    Configuration values, as gryphon reads them : yes/no, "BTC 0.005", numbers, or strings.
+    """
+    if value in ('yes', 'no'):
+        return value == 'yes'
+    parts = value.split()
+    if len(parts) == 2 and parts[0].isalpha() and parts[0].isupper():
+        try:
+            return Money(parts[1], currency=parts[0])
+        except (InvalidOperation, ValueError):
+            return value
+    try:
+        return Decimal(value)
+    except (InvalidOperation, ValueError):
+        return value
+
+
+def load_configuration(path):
+    """
+    :return: (strategy configuration dict, dict of exchange key -> exchange configuration dict)
+    """
+    parser = RawConfigParser()
+    parser.read(path)
+    strategy = dict((k, parse_value(v)) for k, v in parser.items('strategy')) if parser.has_section('strategy') else {}
+    exchanges = dict((s, dict((k, parse_value(v)) for k, v in parser.items(s)))
+                     for s in parser.sections() if s not in ('strategy', 'platform'))
+    return strategy, exchanges
+
+
+def backtest_exchange(key, exchange_configuration=None, balance=None):
+    """
+    A BacktestExchange set up from its section in a strategy .conf file
+    """
+    conf = exchange_configuration or {}
+    return BacktestExchange(key, balance=balance,
+                            fee=conf.get('market_order_fee', Decimal('0.0025')),
+                            limit_order_fee=conf.get('limit_order_fee'),
+                            market_order_fee=conf.get('market_order_fee'),
+                            min_order_size=conf.get('min_order_size'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded orderbooks through a strategy")
+    parser.add_argument('strategy', help="module.Class, e.g. dynamic_market_making.DynamicMarketMaking")
+    parser.add_argument('configuration', help="strategy .conf file")
+    parser.add_argument('orderbooks', help="recorded orderbooks, .jsonl file or ob_recorder directory")
+    parser.add_argument('--exchange', action='append', default=[], help="exchange key, the first one is the strategy exchange")
+    parser.add_argument('--balance', action='append', default=[], help="EXCHANGE:CURRENCY:AMOUNT starting balance")
+    parser.add_argument('--resolution', type=float, default=1., help="seconds, ob_recorder orderbooks of different exchanges within it make one tick")
+    parser.add_argument('--stream', action='store_true', help="replay ob_recorder orderbooks as level updates, one tick per change of the best prices")
+    parser.add_argument('--drop', type=float, default=0., help="with --stream, fraction of updates lost, to exercise resynchronization")
+    parser.add_argument('--verbose', action='store_true', help="keep the strategy logs")
+    args = parser.parse_args()
+
+    module_name, class_name = args.strategy.rsplit('.', 1)
+    strategy_class = getattr(importlib.import_module(module_name), class_name)
+
+    strategy_configuration, exchanges_configuration = load_configuration(args.configuration)
+    if args.exchange:
+        strategy_configuration.setdefault('exchange', args.exchange[0])
+
+    balances = {}
+    for b in args.balance:
+        key, currency, amount = b.split(':')
+        balances.setdefault(key, {})[currency] = Money(amount, currency=currency)
+
+    exchanges = [backtest_exchange(key, exchanges_configuration.get(key), balances.get(key)) for key in args.exchange]
+    backtest = Backtest(strategy_class, strategy_configuration, exchanges, quiet=not args.verbose)
+    streams = []
+    if args.stream:
+        snapshots, streams = ob_stream.replay_snapshots(args.orderbooks, args.exchange, top_only=True, drop=args.drop)
+    elif os.path.isdir(args.orderbooks):
+        snapshots = ob_recorder.snapshots(args.orderbooks, args.exchange, resolution=int(args.resolution * 1e9))
+    else:
+        snapshots = read_jsonl(args.orderbooks)
+    print(backtest.run(snapshots))
+    for stream in streams:
+        print(stream)
+
+
+if __name__ == '__main__':
+    main()
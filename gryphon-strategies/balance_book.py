@@ -0,0 +1,96 @@
+"""
+Balances of the exchanges of an arbitrage, fetched at most once per tick.
+Legs sent during the tick are debited and credited locally, so the next crosses of the same tick
+are sized against what is left, without asking the exchanges again.
+
+Pairs of one exchange draw on one account (bitstamp_btc_usd and bitstamp_btc_eur share their BTC),
+so balances are kept per account, and a leg on one pair is seen by the others.
+"""
+from gryphon.lib.exchange.consts import Consts
+
+
+def account(exchange_name):
+    """
+    'BITSTAMP_BTC_EUR' -> 'bitstamp', the account the pairs of an exchange share
+    """
+    return exchange_name.lower().split('_')[0]
+
+
+class BalanceBook(object):
+
+    def __init__(self, snapshot=None):
+        """
+        :param snapshot: arb_snapshot.ArbSnapshot of the tick, for the price of fills the exchange did not give
+        """
+        self.snapshot = snapshot
+        self.balances = {}  # account -> balance of all currencies seen on its pairs
+        self.fetched = set()  # exchange names
+        self.fetches = 0
+
+    def get_balance(self, exchange):
+        """
+        :return: balance of the exchange account, as its pairs get_balance() gave it at the first call in
+        the tick, with the legs sent since applied
+        """
+        if exchange.name not in self.fetched:
+            fetched = exchange.get_balance()
+            balance = self.balances.setdefault(account(exchange.name), fetched)
+            if balance is not fetched:
+                for currency, amount in fetched.items():
+                    # a currency already known was fetched through another pair, and maybe spent since
+                    balance.setdefault(currency, amount)
+            self.fetched.add(exchange.name)
+            self.fetches += 1
+        return self.balances[account(exchange.name)]
+
+    def forget(self, exchange):
+        """
+        Fetch the balances of the exchange account again on the next get_balance().
+        """
+        self.balances.pop(account(exchange.name), None)
+        self.fetched = set(name for name in self.fetched if account(name) != account(exchange.name))
+
+    def _best_price(self, exchange, mode):
+        if self.snapshot is None:
+            return None
+        for book in self.snapshot.books:
+            if book.exchange.name == exchange.name:
+                levels = book.ob['asks'] if mode == Consts.BID else book.ob['bids']
+                return levels[0].price if levels else None
+        return None
+
+    def apply(self, leg):
+        """
+        Debit and credit the balance of the leg exchange account with its fill, fees included.
+        :param leg: arb_executor.Leg
+        """
+        if leg.success and not leg.confirmed:
+            # the fill is not known, only the exchange can tell what is left
+            self.forget(leg.exchange)
+            return
+        # not fetched yet: the exchange will give it with this fill included
+        balance = self.balances.get(account(leg.exchange.name))
+        if not leg.filled.amount or balance is None:
+            return
+        price = leg.price if leg.price is not None else self._best_price(leg.exchange, leg.mode)
+        if price is None:
+            raise ValueError("no price to account for " + str(leg))
+
+        volume = leg.filled
+        cost = price * volume.amount
+        fee = cost * leg.exchange.market_order_fee
+        if leg.mode == Consts.BID:
+            changes = [volume, -(cost + fee)]
+        else:
+            changes = [-volume, cost - fee]
+        for change in changes:
+            # currencies not fetched yet come with this fill included
+            if change.currency in balance:
+                balance[change.currency] += change
+
+    def apply_execution(self, execution):
+        """
+        :param execution: arb_executor.ArbExecution, legs and unwinds
+        """
+        for leg in execution.legs + execution.unwinds:
+            self.apply(leg)
@@ -0,0 +1,783 @@
+"""
+Basic time series, shared by our strategies to track market indicators tick after tick.
+
+TS and LocalMoneyTS keep exact values (Money, Decimal) for a few indicators updated on each tick.
+ArrayTS and the vectorized indicators below work on float64 columns, for live ticks as well as
+for bulk recomputation over long recorded histories.
+"""
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+from cdecimal import Decimal
+
+from gryphon.lib.money import Money
+
+
+# recorded time during a replay, in nanoseconds since epoch: the wall clock gives it, the monotonic clock runs from it
+_replay_ns = None
+# system monotonic clock when the replay time was set, and last replayed monotonic reading
+_replay_set = None
+_replay_last = None
+
+
+def set_replay_time(timestamp):
+    """
+    :param timestamp: in nanoseconds since epoch, None to go back to the system clocks
+    """
+    global _replay_ns, _replay_set, _replay_last
+    if timestamp is None:
+        _replay_ns = _replay_set = _replay_last = None
+        return
+    _replay_ns = int(timestamp)
+    _replay_set = _monotonic_ns()
+
+
+def now_ns():
+    """
+    wall clock time, in nanoseconds since epoch
+    """
+    if _replay_ns is not None:
+        return _replay_ns
+    return int(time.time() * 1e9)
+
+
+def now():
+    """
+    wall clock time, as a naive local datetime
+    """
+    return datetime.fromtimestamp(now_ns() / 1e9)
+
+
+try:
+    _monotonic_ns = time.monotonic_ns
+except AttributeError:
+    # python < 3.7
+    _monotonic = getattr(time, 'monotonic', time.time)
+
+    def _monotonic_ns():
+        return int(_monotonic() * 1e9)
+
+
+def monotonic_ns():
+    """
+    monotonic clock, in nanoseconds. Only meaningful relative to another reading.
+    During a replay, it runs from the recorded time at the system clock pace, so the latencies of a tick
+    are still measured, and never goes back when the next recorded time is closer than the tick took.
+    """
+    global _replay_last
+    if _replay_ns is None:
+        return _monotonic_ns()
+    reading = _replay_ns + _monotonic_ns() - _replay_set
+    if _replay_last is not None and reading < _replay_last:
+        reading = _replay_last
+    _replay_last = reading
+    return reading
+
+
+def monotonic_offset():
+    """
+    :return: nanoseconds to add to a monotonic_ns() reading to get wall clock time, as of now
+    """
+    return now_ns() - monotonic_ns()
+
+
+class RingBuffer(object):
+    """
+    Fixed capacity buffer of (timestamp, value) pairs, stored in two preallocated columns.
+    Timestamps are int64 nanoseconds, and must not decrease, so entries can be searched by time.
+    When the buffer is full, appending overwrites the oldest entry, so memory stays bounded.
+    """
+
+    def __init__(self, capacity):
+        assert capacity > 0
+        self.capacity = int(capacity)
+        self.timestamps = np.zeros(self.capacity, dtype=np.int64)
+        self.values = [None] * self.capacity
+        self.start = 0  # physical index of the oldest entry
+        self.size = 0
+        self.appended = 0  # total number of entries ever appended, to number them
+
+    def _index(self, i):
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError("RingBuffer index out of range")
+        return (self.start + i) % self.capacity
+
+    def append(self, timestamp, value):
+        end = (self.start + self.size) % self.capacity
+        if self.size == self.capacity:
+            # overwriting the oldest entry
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.size += 1
+        self.timestamps[end] = timestamp
+        self.values[end] = value
+        self.appended += 1
+
+    def dropfirst(self, number):
+        """
+        Forget the oldest entries. References are left in place and overwritten by later appends.
+        :param number: number of entries to drop
+        """
+        number = min(int(number), self.size)
+        self.start = (self.start + number) % self.capacity
+        self.size -= number
+
+    def timestamp(self, i):
+        return int(self.timestamps[self._index(i)])
+
+    def value(self, i):
+        return self.values[self._index(i)]
+
+    def value_at(self, seq):
+        """
+        :param seq: the sequence number of an entry still in the buffer (0 for the first entry ever appended)
+        """
+        return self.value(seq - (self.appended - self.size))
+
+    def search(self, timestamp, side='left'):
+        """
+        Binary search by timestamp.
+        :param side: 'left' for the index of the first entry at or after timestamp, 'right' for the first one after it.
+        :return: logical index, len(self) if all entries are before timestamp
+        """
+        end = self.start + self.size
+        if end <= self.capacity:
+            return int(np.searchsorted(self.timestamps[self.start:end], timestamp, side))
+        # the buffer wraps around : two sorted segments
+        first = self.timestamps[self.start:]
+        i = int(np.searchsorted(first, timestamp, side))
+        if i < len(first):
+            return i
+        return i + int(np.searchsorted(self.timestamps[:end - self.capacity], timestamp, side))
+
+    def slice(self, i, j):
+        """
+        :return: list of (timestamp, value) for logical indexes [i, j)
+        """
+        return [self[k] for k in range(max(i, 0), min(j, self.size))]
+
+    def __getitem__(self, i):
+        p = self._index(i)
+        return int(self.timestamps[p]), self.values[p]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for i in range(self.size):
+            p = (self.start + i) % self.capacity
+            yield int(self.timestamps[p]), self.values[p]
+
+    def __reversed__(self):
+        for i in range(self.size - 1, -1, -1):
+            p = (self.start + i) % self.capacity
+            yield int(self.timestamps[p]), self.values[p]
+
+
+class RollingWindow(object):
+    """
+    Running statistics over the last `length` values of a RingBuffer.
+    Values are numbered by their sequence in the buffer, the window holds sequences [first, first + count).
+    """
+
+    def __init__(self, length, first=0):
+        assert length > 0
+        self.length = int(length)
+        self.first = first
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        # monotonic queues of (seq, value) candidates for min and max
+        self.mins = deque()
+        self.maxs = deque()
+
+    def push(self, seq, value):
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+
+        while self.mins and self.mins[-1][1] >= value:
+            self.mins.pop()
+        self.mins.append((seq, value))
+        while self.maxs and self.maxs[-1][1] <= value:
+            self.maxs.pop()
+        self.maxs.append((seq, value))
+
+    def pop(self, value):
+        """
+        Remove the oldest value from the window.
+        :param value: the value at sequence `first`
+        """
+        self.count -= 1
+        self.total -= value
+        self.total_sq -= value * value
+
+        self.first += 1
+        if self.mins and self.mins[0][0] < self.first:
+            self.mins.popleft()
+        if self.maxs and self.maxs[0][0] < self.first:
+            self.maxs.popleft()
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def variance(self):
+        if not self.count:
+            return None
+        mean = self.total / self.count
+        # rounding errors could make this slightly negative on floats
+        return max(self.total_sq / self.count - mean * mean, 0)
+
+    @property
+    def minimum(self):
+        return self.mins[0][1] if self.mins else None
+
+    @property
+    def maximum(self):
+        return self.maxs[0][1] if self.maxs else None
+
+
+class TS(object):
+    """
+    A time series of values, along with its relative derivative.
+    Only the last `capacity` values are kept.
+    Values are stamped with a monotonic clock in nanoseconds (see monotonic_ns), and can be looked up by time.
+    Statistics over the derivative are maintained incrementally for each registered window length.
+    """
+
+    def __init__(self, capacity=10000, windows=()):
+        assert capacity > 1
+        self.series = RingBuffer(capacity)
+        # one derivative value less than the series, so both drop their oldest entry at the same time.
+        self.derivative = RingBuffer(capacity - 1)
+        # running sum of the derivative, by physical index in the derivative buffer, for averages over time ranges
+        self.cumulative = [None] * self.derivative.capacity
+        self.store = None  # persistence, see attach()
+
+        self.windows = {}
+        for length in windows:
+            self.register_window(length)
+
+    def register_window(self, length):
+        """
+        Start maintaining statistics over the last `length` derivative values.
+        Values already in the series are accounted for.
+        :param length: window length, in number of ticks
+        :return: the RollingWindow
+        """
+        length = int(length)
+        assert length <= self.derivative.capacity, "window longer than the series capacity"
+        if length not in self.windows:
+            count = min(length, len(self.derivative))
+            window = RollingWindow(length, first=self.derivative.appended - count)
+            for seq in range(window.first, self.derivative.appended):
+                window.push(seq, self.derivative.value_at(seq))
+            self.windows[length] = window
+        return self.windows[length]
+
+    def _relative_change(self, new, old):
+        if not new + old:
+            # undefined when values cancel out (e.g. v and -v), counted as no change
+            return Decimal(0)
+        return 2*(new - old)/(new + old)
+
+    def _last_derivatives(self, last):
+        last = min(int(last), len(self.derivative))
+        return [self.derivative.value(-i) for i in range(1, last + 1)]
+
+    def __add__(self, other):
+        assert other is not None
+        timestamp = monotonic_ns()
+
+        d = None
+        if self.series:
+            # never go back in time, even if the clock does
+            timestamp = max(timestamp, self.series.timestamp(-1))
+            last_amount = self.series.value(-1)
+            assert last_amount is not None
+            d = self._relative_change(other, last_amount)
+
+        self._append(timestamp, other, d)
+        if self.store is not None:
+            # stored in wall clock time, monotonic readings do not survive a reboot
+            self.store.append(timestamp + monotonic_offset(), self._to_float(other), float('nan') if d is None else float(d))
+        return self
+
+    def _append(self, timestamp, value, d=None):
+        if d is not None:
+            seq = self.derivative.appended
+            for window in self.windows.values():
+                if window.count == window.length:
+                    window.pop(self.derivative.value_at(window.first))
+                window.push(seq, d)
+
+            cumulative = self.cumulative[self.derivative._index(-1)] + d if self.derivative else d
+            self.derivative.append(timestamp, d)
+            self.cumulative[self.derivative._index(-1)] = cumulative
+        self.series.append(timestamp, value)
+
+    # conversions for storage as float64
+    def _to_float(self, value):
+        return float(value)
+
+    def _from_float(self, value):
+        return Decimal(repr(value))
+
+    def _derivative_from_float(self, value):
+        return Decimal(repr(value))
+
+    def attach(self, store):
+        """
+        Persist this series in a TSStore, after restoring the last values recorded there.
+        Only the values that fit in this series capacity are read back.
+        :param store: ts_store.TSStore
+        """
+        records = store.tail(self.series.capacity)
+        offset = monotonic_offset()
+        for i, (timestamp, value, d) in enumerate(records):
+            # the first derivative restored would refer to a value we do not have
+            self._append(int(timestamp) - offset, self._from_float(float(value)), None if i == 0 or np.isnan(d) else self._derivative_from_float(float(d)))
+        self.store = store
+        return self
+
+    def since(self, timestamp):
+        """
+        :param timestamp: monotonic nanoseconds
+        :return: list of (timestamp, value) recorded at or after timestamp
+        """
+        return self.series.slice(self.series.search(timestamp), len(self.series))
+
+    def between(self, start, end):
+        """
+        :return: list of (timestamp, value) recorded from start to end, both included
+        """
+        return self.series.slice(self.series.search(start), self.series.search(end, side='right'))
+
+    def last_duration(self, seconds):
+        """
+        :return: list of (timestamp, value) recorded during the last `seconds`
+        """
+        return self.since(monotonic_ns() - int(seconds * 1e9))
+
+    def deriv_since(self, timestamp):
+        """
+        average derivative value since timestamp, in O(log n)
+        :param timestamp: monotonic nanoseconds
+        """
+        i = self.derivative.search(timestamp)
+        j = len(self.derivative)
+        if i >= j:
+            return None
+        total = self.cumulative[self.derivative._index(j - 1)] - self.cumulative[self.derivative._index(i)] + self.derivative.value(i)
+        return total / (j - i)
+
+    def deriv(self, last=1):
+        """
+        calculate derivative value for the n last values
+        O(1) if a window of that length is registered.
+        :param last: number of derivative values to average
+        :return:
+        """
+        if last in self.windows:
+            return self.windows[last].mean
+        elif self.derivative:
+            values = self._last_derivatives(last)
+            return sum(values) / len(values)
+        else:
+            return None
+
+    def variance(self, last=1):
+        """
+        calculate variance of the n last derivative values
+        O(1) if a window of that length is registered.
+        """
+        if last in self.windows:
+            return self.windows[last].variance
+        elif self.derivative:
+            values = self._last_derivatives(last)
+            mean = sum(values) / len(values)
+            return sum((v - mean) * (v - mean) for v in values) / len(values)
+        else:
+            return None
+
+    def minimum(self, last=1):
+        """
+        minimum of the n last derivative values
+        O(1) if a window of that length is registered.
+        """
+        if last in self.windows:
+            return self.windows[last].minimum
+        return min(self._last_derivatives(last)) if self.derivative else None
+
+    def maximum(self, last=1):
+        """
+        maximum of the n last derivative values
+        O(1) if a window of that length is registered.
+        """
+        if last in self.windows:
+            return self.windows[last].maximum
+        return max(self._last_derivatives(last)) if self.derivative else None
+
+    def last(self):
+        return self.series[-1]
+
+    def dropfirst(self, number):  # number should be int
+        # dropped values leave the windows as well
+        first_kept = self.derivative.appended - max(len(self.derivative) - int(number), 0)
+        for window in self.windows.values():
+            while window.count and window.first < first_kept:
+                window.pop(self.derivative.value_at(window.first))
+
+        self.series.dropfirst(number)
+        self.derivative.dropfirst(number)
+
+    def __reversed__(self):
+        return reversed(self.series)
+
+    def __len__(self):
+        return len(self.series)
+
+
+#TODO : test + pandas ...
+class LocalMoneyTS(TS):
+
+    def __init__(self, cur="EUR", capacity=10000, windows=()):
+        self.currency = cur
+        super(LocalMoneyTS, self).__init__(capacity=capacity, windows=windows)
+
+    def __add__(self, other):
+        assert isinstance(other, Money) and other.currency == self.currency
+
+        return super(LocalMoneyTS, self).__add__(other)
+
+    def _to_float(self, value):
+        return float(value.amount)
+
+    def _from_float(self, value):
+        return Money(repr(value), self.currency)
+
+    def volatility(self, last=1):
+        """
+        calculate volatility distribution and returns volatility averaged over the derivative values
+        :param last: number of derivative values to average
+        :return:
+        """
+        return super(LocalMoneyTS, self).deriv(last)
+
+    def volatility_since(self, timestamp):
+        """
+        volatility averaged over the derivative values since timestamp
+        :param timestamp: monotonic nanoseconds
+        """
+        return self.deriv_since(timestamp)
+
+
+class FloatTS(TS):
+    """
+    A time series of native floats, for indicators where exact decimals are not needed.
+    Money values are converted on the way in, without currency check, and converted back with to_money()
+    only when they end up in an order.
+    With a tick_size, values are stored as integer numbers of ticks (fixed point) instead.
+    """
+
+    def __init__(self, cur="EUR", tick_size=None, capacity=10000, windows=()):
+        self.currency = cur
+        self.tick_size = None if tick_size is None else Decimal(tick_size)
+        self._tick = None if tick_size is None else float(tick_size)
+        super(FloatTS, self).__init__(capacity=capacity, windows=windows)
+
+    def __add__(self, other):
+        value = float(getattr(other, 'amount', other))
+        if self._tick:
+            value = int(round(value / self._tick))
+        return super(FloatTS, self).__add__(value)
+
+    def _relative_change(self, new, old):
+        if not new + old:
+            return 0.0
+        return 2.0*(new - old)/(new + old)
+
+    def _to_float(self, value):
+        return float(value)
+
+    def _from_float(self, value):
+        return int(round(value)) if self._tick else value
+
+    def _derivative_from_float(self, value):
+        return value
+
+    def volatility(self, last=1):
+        """
+        calculate volatility distribution and returns volatility averaged over the derivative values
+        :param last: number of derivative values to average
+        :return:
+        """
+        return self.deriv(last)
+
+    def volatility_since(self, timestamp):
+        """
+        volatility averaged over the derivative values since timestamp
+        :param timestamp: monotonic nanoseconds
+        """
+        return self.deriv_since(timestamp)
+
+    def to_money(self, value):
+        """
+        convert a value of the series back to Money
+        """
+        if self.tick_size is not None:
+            return Money(self.tick_size * int(value), self.currency)
+        return Money(repr(float(value)), self.currency)
+
+
+class TrendCounter(object):
+    """
+    Counts bull (positive) and bear (negative) values over the last `horizon` values, for several horizons.
+    Counts are updated on each value, adding the new sign and removing the one leaving each horizon.
+    """
+
+    def __init__(self, horizons):
+        self.horizons = sorted(set(int(h) for h in horizons))
+        assert self.horizons and self.horizons[0] > 0
+        self.capacity = self.horizons[-1]
+        self.signs = [0] * self.capacity
+        self.count = 0
+        self.bulls = dict((h, 0) for h in self.horizons)
+        self.bears = dict((h, 0) for h in self.horizons)
+
+    def __add__(self, other):
+        sign = (other > 0) - (other < 0)
+        for h in self.horizons:
+            if self.count >= h:
+                leaving = self.signs[(self.count - h) % self.capacity]
+                if leaving > 0:
+                    self.bulls[h] -= 1
+                elif leaving < 0:
+                    self.bears[h] -= 1
+            if sign > 0:
+                self.bulls[h] += 1
+            elif sign < 0:
+                self.bears[h] += 1
+        self.signs[self.count % self.capacity] = sign
+        self.count += 1
+        return self
+
+    def follow(self, ts):
+        """
+        Count the last derivative values of a series, e.g. restored from a store.
+        Flat ticks are not counted, as when counting on each tick.
+        :param ts: TS
+        """
+        signed = []
+        for timestamp, d in reversed(ts.derivative):
+            if len(signed) == self.capacity:
+                break
+            if d:
+                signed.append(d)
+        for d in reversed(signed):
+            self += d
+        return self
+
+    def bullcount(self, horizon):
+        return self.bulls[int(horizon)]
+
+    def bearcount(self, horizon):
+        return self.bears[int(horizon)]
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def __str__(self):
+        return " ".join(str(h) + ": +" + str(self.bulls[h]) + "/-" + str(self.bears[h]) for h in self.horizons)
+
+
+# Vectorized indicators. All take a float64 array and return an array of the same length,
+# with NaN where there is not enough history yet.
+
+def returns(values):
+    """
+    simple returns between consecutive values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    result[1:] = values[1:] / values[:-1] - 1
+    return result
+
+
+def log_returns(values):
+    """
+    log returns between consecutive values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    result[1:] = np.diff(np.log(values))
+    return result
+
+
+def ema(values, span, initial=None):
+    """
+    exponential moving average, with alpha = 2 / (span + 1)
+    :param initial: last ema value, to continue a previous computation. Defaults to the first value.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.empty(len(values))
+    if not len(values):
+        return result
+
+    alpha = 2.0 / (span + 1)
+    decay = 1 - alpha
+    if decay <= 0:
+        result[:] = values
+        return result
+
+    previous = values[0] if initial is None else initial
+    # Within a block, ema[t] = decay^(t+1) * previous + alpha * sum(decay^(t-k) * values[k] for k <= t),
+    # computed with a cumulative sum. Blocks are short enough for decay^-block not to overflow.
+    block = max(int(300 / -np.log(decay)), 1)
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        result[start:start + len(chunk)] = powers * (previous + alpha * np.cumsum(chunk / powers))
+        previous = result[start + len(chunk) - 1]
+    return result
+
+
+def rolling_sum(values, window):
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if window <= len(values):
+        cumsum = np.cumsum(np.concatenate(([0.], values)))
+        result[window - 1:] = cumsum[window:] - cumsum[:-window]
+    return result
+
+
+def rolling_mean(values, window):
+    return rolling_sum(values, window) / window
+
+
+def rolling_std(values, window):
+    """
+    population standard deviation over a rolling window
+    """
+    values = np.asarray(values, dtype=np.float64)
+    # centering first limits cancellation errors when values are far from 0 (prices)
+    centered = values - np.nanmean(values) if len(values) else values
+    mean = rolling_mean(centered, window)
+    variance = rolling_mean(centered * centered, window) - mean * mean
+    return np.sqrt(np.maximum(variance, 0))
+
+
+def realized_volatility(values, window):
+    """
+    square root of the sum of squared log returns over a rolling window
+    """
+    squared = log_returns(values) ** 2
+    squared[:1] = 0  # no return for the first value
+    result = np.sqrt(rolling_sum(squared, window))
+    result[:window] = np.nan  # the first window lacks one return
+    return result
+
+
+def zscore(values, window):
+    """
+    distance of each value from its rolling mean, in rolling standard deviations
+    """
+    values = np.asarray(values, dtype=np.float64)
+    std = rolling_std(values, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (values - rolling_mean(values, window)) / std
+
+
+class ArrayTS(object):
+    """
+    A columnar time series of floats, with int64 nanosecond timestamps.
+    Keeps the last `capacity` points contiguous in memory, so `timestamps` and `values` are views, not copies.
+    """
+
+    def __init__(self, capacity=100000):
+        assert capacity > 0
+        self.capacity = int(capacity)
+        # twice the capacity, so the data only needs to be moved back every `capacity` appends
+        self._timestamps = np.zeros(2 * self.capacity, dtype=np.int64)
+        self._values = np.zeros(2 * self.capacity, dtype=np.float64)
+        self.start = 0
+        self.end = 0
+
+    def _reserve(self, number):
+        if self.end + number > len(self._values):
+            keep = min(self.end - self.start, self.capacity - number)
+            self._timestamps[:keep] = self._timestamps[self.end - keep:self.end]
+            self._values[:keep] = self._values[self.end - keep:self.end]
+            self.start, self.end = 0, keep
+
+    def append(self, value, timestamp=None):
+        self._reserve(1)
+        self._timestamps[self.end] = now_ns() if timestamp is None else timestamp
+        self._values[self.end] = value
+        self.end += 1
+        self.start = max(self.start, self.end - self.capacity)
+        return self
+
+    def __add__(self, other):
+        return self.append(other)
+
+    def extend(self, values, timestamps=None):
+        """
+        Ingest a batch of points at once. Only the last `capacity` ones are kept.
+        :param values: array like of floats
+        :param timestamps: array like of int64 nanoseconds, defaults to now for all points
+        """
+        values = np.asarray(values, dtype=np.float64)[-self.capacity:]
+        number = len(values)
+        self._reserve(number)
+        if timestamps is None:
+            self._timestamps[self.end:self.end + number] = now_ns()
+        else:
+            self._timestamps[self.end:self.end + number] = np.asarray(timestamps, dtype=np.int64)[-number:] if number else []
+        self._values[self.end:self.end + number] = values
+        self.end += number
+        self.start = max(self.start, self.end - self.capacity)
+        return self
+
+    @property
+    def timestamps(self):
+        return self._timestamps[self.start:self.end]
+
+    @property
+    def values(self):
+        return self._values[self.start:self.end]
+
+    def last(self):
+        return self._timestamps[self.end - 1], self._values[self.end - 1]
+
+    def dropfirst(self, number):
+        self.start = min(self.start + int(number), self.end)
+
+    def __len__(self):
+        return self.end - self.start
+
+    # indicators over the whole series
+
+    def returns(self):
+        return returns(self.values)
+
+    def log_returns(self):
+        return log_returns(self.values)
+
+    def ema(self, span):
+        return ema(self.values, span)
+
+    def rolling_std(self, window):
+        return rolling_std(self.values, window)
+
+    def realized_volatility(self, window):
+        return realized_volatility(self.values, window)
+
+    def zscore(self, window):
+        return zscore(self.values, window)
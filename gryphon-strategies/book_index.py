@@ -0,0 +1,135 @@
+"""
+Orderbook view built once per snapshot, with cumulative volume and notional on each side,
+so quotes for a volume or up to a price are binary searches instead of walks through the book.
+Sums are exact decimals, as prices and volumes in the orderbook.
+"""
+from bisect import bisect_left, bisect_right
+
+from gryphon.lib.money import Money
+from gryphon.lib.exchange.consts import Consts
+
+
+class BookSide(object):
+
+    def __init__(self, levels, descending):
+        """
+        :param levels: orderbook entries, best price first
+        :param descending: True for bids
+        """
+        self.levels = levels
+        self.descending = descending
+        # prices as sorted ascending keys, negated for bids
+        self.keys = [-l.price.amount if descending else l.price.amount for l in levels]
+        self.cum_volume = []
+        self.cum_notional = []
+        volume = 0
+        notional = 0
+        for l in levels:
+            volume += l.volume.amount
+            notional += l.volume.amount * l.price.amount
+            self.cum_volume.append(volume)
+            self.cum_notional.append(notional)
+
+    @property
+    def best(self):
+        return self.levels[0].price if self.levels else None
+
+    @property
+    def depth(self):
+        """
+        total volume amount on this side
+        """
+        return self.cum_volume[-1] if self.cum_volume else 0
+
+    def index_for_volume(self, amount):
+        """
+        :return: index of the level where `amount` is completed, None if the side is not deep enough
+        """
+        i = bisect_left(self.cum_volume, amount)
+        return i if i < len(self.levels) else None
+
+    def cost(self, amount):
+        """
+        :return: notional amount for taking `amount`, None if the side is not deep enough
+        """
+        i = self.index_for_volume(amount)
+        if i is None:
+            return None
+        before_volume = self.cum_volume[i - 1] if i else 0
+        before_notional = self.cum_notional[i - 1] if i else 0
+        return before_notional + (amount - before_volume) * self.levels[i].price.amount
+
+    def volume_for_cost(self, notional):
+        """
+        :return: volume amount we can take for a notional amount, all the side if it is enough
+        """
+        i = bisect_left(self.cum_notional, notional)
+        if i == len(self.levels):
+            return self.depth
+        before_volume = self.cum_volume[i - 1] if i else 0
+        before_notional = self.cum_notional[i - 1] if i else 0
+        return before_volume + (notional - before_notional) / self.levels[i].price.amount
+
+    def volume_up_to(self, price_amount):
+        """
+        :return: volume amount at prices equal or better than this one
+        """
+        key = -price_amount if self.descending else price_amount
+        i = bisect_right(self.keys, key)
+        return self.cum_volume[i - 1] if i else 0
+
+
+class OrderbookIndex(object):
+    """
+    Quotes are for an order of `mode`, taking from the opposite side: a BID takes the asks.
+    """
+
+    def __init__(self, ob):
+        self.ob = ob
+        self.bids = BookSide(ob['bids'], descending=True)
+        self.asks = BookSide(ob['asks'], descending=False)
+
+        self.midpoint = None
+        self.spread = None
+        if self.bids.levels and self.asks.levels:
+            self.midpoint = (self.bids.best + self.asks.best) / 2
+            self.spread = self.asks.best - self.bids.best
+
+    def _taken(self, mode):
+        return self.asks if mode == Consts.BID else self.bids
+
+    def price_for_volume(self, mode, volume):
+        """
+        :return: the worst price reached when taking `volume`, None if the book is not deep enough
+        """
+        side = self._taken(mode)
+        i = side.index_for_volume(volume.amount)
+        return side.levels[i].price if i is not None else None
+
+    def vwap(self, mode, volume):
+        """
+        :return: average price when taking `volume`, None if the book is not deep enough
+        """
+        side = self._taken(mode)
+        cost = side.cost(volume.amount)
+        if cost is None or not volume.amount:
+            return None
+        return Money(cost / volume.amount, currency=side.best.currency)
+
+    def volume_up_to(self, mode, price):
+        """
+        :return: volume we can take without going past `price`
+        """
+        side = self._taken(mode)
+        currency = side.levels[0].volume.currency if side.levels else None
+        return Money(side.volume_up_to(price.amount), currency=currency)
+
+    def slippage(self, mode, volume):
+        """
+        :return: relative distance of the average price from the best one, when taking `volume`
+        """
+        vwap = self.vwap(mode, volume)
+        if vwap is None:
+            return None
+        best = self._taken(mode).best
+        return abs(vwap.amount - best.amount) / best.amount
@@ -13,6 +13,13 @@ from gryphon.lib.money import Money
 from gryphon.lib.exchange.consts import Consts
 from gryphon.lib.metrics import midpoint as midpoint_lib
 
+from basic_ts import TS, LocalMoneyTS, FloatTS
+from ohlcv import OHLCV
+from ts_store import open_store
+from tick_snapshot import tick_exchange
+from order_batch import BatchDispatcher
+from quote_reconciler import QuoteReconciler
+
 import logging
 import logging.handlers
 
@@ -20,60 +27,6 @@ from datetime import datetime
 
 
 
-class TS(object):
-
-    def __init__(self):
-        self.series = []
-        self.derivative = []
-
-    def __add__(self, other):
-        assert other is not None
-        timestamp = datetime.now()
-
-        if self.series:
-            last_amount = self.series[-1][1]
-            assert last_amount is not None
-            self.derivative.append((timestamp, 2*(other - last_amount)/(other + last_amount)))
-        self.series.append((timestamp, other))
-        return self
-
-    def deriv(self, last=1):
-        """
-        calculate derivative value for the n last values
-        :param percentile:
-        :return:
-        """
-        if self.derivative:
-            return sum(t[1] for t in self.derivative[-last:]) / len(self.derivative[-last:])
-        else:
-            return None
-
-    def last(self):
-        return self.series[-1]
-
-
-#TODO : test + pandas ...
-class LocalMoneyTS(TS):
-
-    def __init__(self, cur="EUR"):
-        self.currency = cur
-        super(LocalMoneyTS, self).__init__()
-
-    def __add__(self, other):
-        assert isinstance(other, Money) and other.currency == self.currency
-
-        return super(LocalMoneyTS, self).__add__(other)
-
-    def volatility(self, last=1):
-        """
-        calculate volatility distribution and returns volatility averaged over the derivative values
-        :param percentile:
-        :return:
-        """
-        return super(LocalMoneyTS, self).deriv(last)
-
-
-
 class DynamicMarketMaking(Strategy):
 
     @property
@@ -100,8 +53,21 @@ class DynamicMarketMaking(Strategy):
 
         self.logger.debug("--Strategy Init--")
 
-        self.volat = TS()
-        self.midpoints = LocalMoneyTS(cur='EUR')
+        self.volat = None  # not yet... wait for configuration
+        self.midpoints = None  # not yet... wait for configuration
+
+        self.volatility_periods = 1  # number of ticks to average volatility over
+        self.bar_seconds = 0  # react on completed bars of that duration, instead of every tick
+        self.bars = None
+        # shared settings, see README.md
+        self.float_indicators = False
+        self.ts_directory = None
+        self.ob_directory = None
+        self.order_workers = 3  # orders sent concurrently
+        self.dispatcher = None
+        self.quote_price_tolerance = Decimal('0')  # relative price move under which live quotes are kept
+        self.quote_volume_tolerance = Decimal('0')  # relative volume change under which live quotes are kept
+        self.reconciler = None
 
         # Configurable properties with defaults.
         self.spread = Decimal('0.01')  # how much spread should we start with around orderbook midpoint for ask/bid
@@ -127,20 +93,53 @@ class DynamicMarketMaking(Strategy):
         self.init_configurable('spread_adjust_coef', strategy_configuration)
         self.init_configurable('spread_coef_on_loss', strategy_configuration)
         self.init_configurable('base_volume_adjust_coef', strategy_configuration)
+        self.init_configurable('volatility_periods', strategy_configuration)
+        self.init_configurable('float_indicators', strategy_configuration)
+        self.init_configurable('bar_seconds', strategy_configuration)
+        self.init_configurable('ts_directory', strategy_configuration)
+        self.init_configurable('ob_directory', strategy_configuration)
+        self.init_configurable('order_workers', strategy_configuration)
+        self.init_configurable('quote_price_tolerance', strategy_configuration)
+        self.init_configurable('quote_volume_tolerance', strategy_configuration)
+
+        self.reconciler = QuoteReconciler(price_tolerance=self.quote_price_tolerance, volume_tolerance=self.quote_volume_tolerance)
+
+        if self.bar_seconds:
+            self.bars = OHLCV(seconds=(self.bar_seconds,))
+
+        # volatility over the configured periods is maintained incrementally on each tick
+        if self.float_indicators:
+            self.midpoints = FloatTS(cur='EUR', windows=(int(self.volatility_periods),))
+            self.volat = FloatTS()
+        else:
+            self.midpoints = LocalMoneyTS(cur='EUR', windows=(int(self.volatility_periods),))
+            self.volat = TS()
 
         assert self.spread_coef_on_loss > self.spread_adjust_coef
 
         self.init_primary_exchange()
 
+        if self.ts_directory:
+            self.restore_indicators()
+
+    def restore_indicators(self):
+        for name, ts in [('midpoints', self.midpoints), ('volatility', self.volat)]:
+            store = open_store(self.ts_directory, self.actor, self.exchange, name)
+            ts.attach(store)
+            self.logger.info("Restored " + str(len(ts)) + " " + name + " from " + store.path)
+
     def init_primary_exchange(self):
-        self.primary_exchange = self.harness.exchange_from_key(self.exchange)
+        self.primary_exchange = tick_exchange(self.harness, self.exchange, self.ob_directory)
 
         # This causes us to always audit our primary exchange.
         self.target_exchanges = [self.primary_exchange.name]
 
+        self.dispatcher = BatchDispatcher(self.primary_exchange, max_workers=int(self.order_workers))
+
     def tick(self, current_orders):
 
         self.logger.debug("--Strategy Tick--")
+        self.primary_exchange.new_tick()
         self.logger.info("Current Orders: " + str(current_orders))
         # Question : Can we detect fulfilled orders ?
         # upon fulfilled order we can increase spread base on volatility
@@ -148,7 +147,16 @@ class DynamicMarketMaking(Strategy):
 
         ob = self.primary_exchange.get_orderbook()
 
-        self.midpoints += midpoint_lib.get_midpoint_from_orderbook(ob)
+        midpoint = midpoint_lib.get_midpoint_from_orderbook(ob)
+        if self.bars:
+            # Indicators follow completed bars only, current orders stay in place meanwhile
+            bar = self.bars.update(midpoint).get(self.bar_seconds)
+            if bar is None:
+                return
+            self.logger.info("Bar completed: " + str(bar))
+            midpoint = bar.close
+
+        self.midpoints += midpoint
 
         # SAFETY
         # if (hasattr(self, 'last_ask_price') and self.last_ask_price < self.midpoint) or (hasattr(self, 'last_bid_price') and self.last_bid_price > self.midpoint):
@@ -165,8 +173,9 @@ class DynamicMarketMaking(Strategy):
         # -> We should play on spread + base_volume only
 
         # OPTIMIZATION
-        if self.midpoints.volatility(last=1):
-            self.volat += self.midpoints.volatility(last=1)  # TODO : since last successful order...
+        volatility = self.midpoints.volatility(last=int(self.volatility_periods))
+        if volatility:
+            self.volat += volatility  # TODO : since last successful order...
 
             if self.volat.last()[1] < 0:
                 self.logger.info("Price went down. skipping this tick...")
@@ -178,7 +187,9 @@ class DynamicMarketMaking(Strategy):
                 # TODO : define what value derivative of volatility should be
 
                 #  and set the spread based on that.
-                self.spread = self.volat.last()[1] / 2
+                spread = self.volat.last()[1] / 2
+                # back to exact decimals, as the spread sets our order prices
+                self.spread = Decimal(repr(spread)) if self.float_indicators else spread
                 # TODO : reduce spread if expectation failed (order not passed), to maximize likelyhood to pass order...
                 # TODO: increase spread if successful order passed, trying to maximize profit on volatile markets
 
@@ -213,7 +224,6 @@ class DynamicMarketMaking(Strategy):
                     # -> Check control theory for a converging / asymptotic optimisation of control (yet easily reversible if needed...)
 
                     bid_price, ask_price = mm.midpoint_centered_fixed_spread(ob, self.spread)
-                    # TODO : improve by doing everything based on ohlcv since last check...
 
                     bid_volume, ask_volume = mm.simple_position_responsive_sizing(
                         self.base_volume,
@@ -226,16 +236,30 @@ class DynamicMarketMaking(Strategy):
                     placeable_bid = self.primary_exchange.get_balance().get(bid_price.currency).amount >= bid_price.amount * bid_volume.amount
                     placeable_ask = self.primary_exchange.get_balance().get(ask_volume.currency).amount >= ask_volume.amount
 
-                    # TODO : maybe we do not need to cancel everything everytime ?
-                    self.primary_exchange.cancel_all_open_orders()
-
                     # Place order only if we can...
-                    if placeable_bid:
-                        self.primary_exchange.limit_order(Consts.BID, bid_volume, bid_price)
+                    desired = {
+                        Consts.BID: (bid_volume, bid_price) if placeable_bid else None,
+                        Consts.ASK: (ask_volume, ask_price) if placeable_ask else None,
+                    }
 
-                    # Place order only if we can...
-                    if placeable_ask:
-                        self.primary_exchange.limit_order(Consts.ASK, ask_volume, ask_price)
+                    # only the quotes that moved are cancelled and posted again
+                    intents = self.reconciler.reconcile(self.primary_exchange.get_open_orders(), desired)
+
+                    # both sides are sent together, once the cancels are done
+                    for result in self.dispatcher.submit(intents):
+                        if result.success:
+                            self.logger.info(str(result))
+                        else:
+                            self.logger.error(str(result))
 
                     self.last_bid_price = bid_price
-                    self.last_ask_price = ask_price
\ No newline at end of file
+                    self.last_ask_price = ask_price
+
+        self.logger.debug(self.primary_exchange.report())
+        self.logger.debug(self.reconciler.report())
+
+    def close(self):
+        """
+        Release what the strategy holds besides memory, once it is not ticked any more.
+        """
+        self.dispatcher.close()
@@ -0,0 +1,125 @@
+"""
+Deterministic fills for dry-runs, driven by the orderbooks we observe.
+
+Market orders, and limit orders crossing the book, fill at once by walking the opposite side.
+Resting limit orders fill only when a later orderbook crosses their price, after the volume
+that was queued ahead of them at their price level.
+Same orderbooks in, same fills out.
+"""
+from gryphon.lib.exchange.consts import Consts
+
+
+def crosses(mode, price, level_price):
+    """
+    :return: True if an order of this mode at price would match an opposite order at level_price
+    """
+    if mode == Consts.BID:
+        return level_price <= price
+    return level_price >= price
+
+
+def opposite_side(ob, mode):
+    return ob['asks'] if mode == Consts.BID else ob['bids']
+
+
+def same_side(ob, mode):
+    return ob['bids'] if mode == Consts.BID else ob['asks']
+
+
+def walk(levels, mode, volume, price=None):
+    """
+    Walk the opposite side of the book.
+    :param levels: opposite side, best price first
+    :param price: limit price, None for a market order
+    :return: volume that can be matched, up to `volume`
+    """
+    matched = volume * 0
+    for level in levels:
+        if price is not None and not crosses(mode, price, level.price):
+            break
+        matched += min(level.volume, volume - matched)
+        if matched >= volume:
+            break
+    return matched
+
+
+def crossing_volume(levels, mode, price):
+    """
+    :return: volume of the opposite side at prices matching ours, None if there is none
+    """
+    total = None
+    for level in levels:
+        if not crosses(mode, price, level.price):
+            break
+        total = level.volume if total is None else total + level.volume
+    return total
+
+
+def level_volume(levels, price):
+    """
+    :return: visible volume at this price on one side of the book, None if the level is empty
+    """
+    total = None
+    for level in levels:
+        if level.price == price:
+            total = level.volume if total is None else total + level.volume
+    return total
+
+
+class FillSimulator(object):
+
+    def __init__(self):
+        self.queue_ahead = {}  # resting order id -> volume in front of it at its price level
+        self.orders = {}  # resting order id -> order
+
+    def placed(self, order, ob):
+        """
+        A new order, against the current orderbook.
+        :return: volume filled right away
+        """
+        remaining = order.volume - order.volume_filled
+        filled = walk(opposite_side(ob, order.mode), order.mode, remaining, None if order.kind == 'market' else order.price)
+
+        if order.kind == 'limit' and filled < remaining:
+            ahead = level_volume(same_side(ob, order.mode), order.price) if not filled else None
+            self.queue_ahead[order.id] = ahead if ahead is not None else remaining * 0
+            self.orders[order.id] = order
+        return filled
+
+    def forget(self, order):
+        self.queue_ahead.pop(order.id, None)
+        self.orders.pop(order.id, None)
+
+    def match(self, ob):
+        """
+        Fill resting orders from a new orderbook, oldest first.
+        :return: list of (order, volume filled)
+        """
+        fills = []
+        # liquidity already taken by our own orders on this book, by side
+        taken = {}
+        for oid, order in sorted(self.orders.items(), key=lambda item: item[1].seq):
+            remaining = order.volume - order.volume_filled
+            zero = remaining * 0
+            ahead = self.queue_ahead[oid]
+
+            crossing = crossing_volume(opposite_side(ob, order.mode), order.mode, order.price)
+            if crossing is not None:
+                crossing -= taken.get(order.mode, zero)
+
+            if crossing is not None and crossing > 0:
+                # the other side went through our level: the queue in front of us goes first
+                volume = min(remaining, crossing - ahead) if crossing > ahead else zero
+                self.queue_ahead[oid] = ahead - crossing if ahead > crossing else zero
+                taken[order.mode] = taken.get(order.mode, zero) + min(ahead, crossing) + volume
+                if volume > 0:
+                    fills.append((order, volume))
+                    if volume == remaining:
+                        self.forget(order)
+            else:
+                # orders in front of us can only have left (filled or cancelled)
+                visible = level_volume(same_side(ob, order.mode), order.price)
+                visible = zero if visible is None else visible
+                if visible < ahead:
+                    self.queue_ahead[oid] = visible
+        return fills
@@ -4,7 +4,6 @@ framework.
 """
 import datetime
 import functools
-import random
 import uuid
 from collections import OrderedDict
 
@@ -18,6 +17,13 @@ from gryphon.lib.metrics import midpoint as midpoint_lib
 
 from gryphon.lib.metrics import quote as quote_lib
 
+import order_batch
+from basic_ts import now_ns
+from book_index import OrderbookIndex
+from fill_simulator import FillSimulator
+from order_archive import OrderArchive
+from tick_snapshot import tick_exchange
+
 import logging
 import logging.handlers
 
@@ -31,6 +37,7 @@ class MonoExchangeStrategy(Strategy):
         self.primary_exchange = None
 
         self.volume_currency = 'BTC'
+        self.ob_directory = None  # shared setting, see README.md
 
         # This calls configure...
         super(MonoExchangeStrategy, self).__init__(db, harness, strategy_configuration)
@@ -39,12 +46,13 @@ class MonoExchangeStrategy(Strategy):
         super(MonoExchangeStrategy, self).configure(strategy_configuration)
 
         self.init_configurable('exchange', strategy_configuration)
+        self.init_configurable('ob_directory', strategy_configuration)
         self.init_primary_exchange()
 
         self.init_configurable('volume_currency', strategy_configuration)
 
     def init_primary_exchange(self):
-        self.primary_exchange = self.harness.exchange_from_key(self.exchange)
+        self.primary_exchange = tick_exchange(self.harness, self.exchange, self.ob_directory)
 
         # This causes us to always audit our primary exchange.
         self.target_exchanges = [self.primary_exchange.name]
@@ -102,11 +110,16 @@ class MonoExchangeStrategy(Strategy):
 
 
 class Order(object):
+    # Live orders only. Once settled, they are kept in the Desk OrderArchive.
+    __slots__ = ('mode', 'id', 'volume', 'volume_filled', 'seq', 'placed_at')
+
     def __init__(self, mode, id, volume):
         self.mode = mode  # Consts.ASK or Const.BID
         self.id = id
         self.volume = volume
         self.volume_filled = Money('0', currency=volume.currency)
+        self.seq = None  # placement number, assigned by the Desk
+        self.placed_at = now_ns()
 
     def fill(self, volume=None):
         """
@@ -127,6 +140,9 @@ class Order(object):
 
 
 class MarketOrder(Order):
+    __slots__ = ('price',)
+    kind = 'market'
+
     def __init__(self, mode, id, price, volume):
         self.price = price  # because we need it to estimate our position before order is filled...
         super(MarketOrder, self).__init__(mode, id, volume)
@@ -139,6 +155,9 @@ class MarketOrder(Order):
 
 
 class LimitOrder(Order):
+    __slots__ = ('price',)
+    kind = 'limit'
+
     def __init__(self, mode, id, price, volume):
         self.price = price
         super(LimitOrder, self).__init__(mode, id, volume)
@@ -150,204 +169,284 @@ class LimitOrder(Order):
         return super(LimitOrder, self).__str__() + " @ " + str(self.price)
 
 
+class PositionLedger(object):
+    """
+    Position implied by the orders we passed, updated when an order is placed and when it gets filled.
+    Funds committed to an order leave the position when it is placed, what we get back enters it as it fills.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.position = {}
+
+    def _add(self, money):
+        self.position[money.currency] = self.position.get(money.currency, Money('0', currency=money.currency)) + money
+
+    def _sub(self, money):
+        self.position[money.currency] = self.position.get(money.currency, Money('0', currency=money.currency)) - money
+
+    def placed(self, order):
+        if order.mode == Consts.BID:
+            self._sub(order.volume.amount * order.price)
+        elif order.mode == Consts.ASK:
+            self._sub(order.volume)
+        else:
+            self.logger.error("unknown order mode")
+
+    def filled(self, order, volume):
+        """
+        :param volume: the volume just filled, possibly partial
+        """
+        if order.mode == Consts.BID:
+            self._add(volume)
+        elif order.mode == Consts.ASK:
+            self._add(volume.amount * order.price)
+        else:
+            self.logger.error("unknown order mode")
+
+    def cancelled(self, order):
+        # funds committed to the unfilled part come back
+        remaining = order.volume - order.volume_filled
+        if order.mode == Consts.BID:
+            self._add(remaining.amount * order.price)
+        elif order.mode == Consts.ASK:
+            self._add(remaining)
+        else:
+            self.logger.error("unknown order mode")
+
+
 class Desk(object):
 
-    def __init__(self, harness, exchange, logger):
+    def __init__(self, harness, exchange, logger, max_workers=4):
         self.harness = harness
         self.exchange = exchange
         self.logger = logger
 
-        self.ob = self.exchange.get_orderbook()
-        self.orders_passed = OrderedDict()
+        self.ob = None  # fetched on each tick
+        self.book = None  # quotes on self.ob
+        self.ledger = PositionLedger(logger)
+
+        # live orders, in the order they were placed, overall and by mode
+        self.open_orders = OrderedDict()
+        self.open_by_mode = {Consts.BID: OrderedDict(), Consts.ASK: OrderedDict()}
+        # settled orders leave the live structures
+        self.archive = OrderArchive()
+        # last placed of the filled orders, overall and by mode
+        self.last_filled = None
+        self.last_filled_by_mode = {Consts.BID: None, Consts.ASK: None}
+        self.orders_count = 0
 
         self.min_order_size = self.exchange.exchange_wrapper.min_order_size
 
-    # def _place_order(self, callable_order_type, mode, volume, price):
-    #     if volume > self.min_order_size:
-    #         order = callable_order_type(mode=mode, volume=volume, price=price)
-    #         if order:
-    #             if callable_order_type == self.exchange.limit_order:
-    #                 msg = "Limit Order"
-    #             elif callable_order_type == self.exchange.market_order:
-    #                 msg = "Market Order"
-    #             else:
-    #                 msg = "Unknown Order"
-    #
-    #             if not order.get('success'):
-    #                 self.logger.error(msg + " cannot be placed !")
-    #                 return None
-    #         else:
-    #             assert not self.harness.execute
-    #             pass  # dry-run
-    #
-    #         # assign id, even if harness doesnt give us anything
-    #         oid = order.get('order_id') if order else str(uuid.uuid4())[:8]
-    #
-    #         # Store order for this run even if we do not execute, to be able to test strategy over multiple ticks
-    #         if callable_order_type == self.exchange.limit_order:
-    #             order = LimitOrder(mode=mode, id=oid, price=price, volume=volume)
-    #         elif callable_order_type == self.exchange.market_order:
-    #             order = MarketOrder(mode=mode, id=oid, price=price, volume=volume)
-    #
-    #         self.orders_passed[order.id] = order
-    #         return order
-    #
-    #     else:
-    #         self.logger.warning("Volume " + str(volume) + " too low, CANNOT buy !")
+        # fills orders from the orderbooks we observe, in dry-run
+        self.simulator = FillSimulator()
+        self.simulated_eaten = []  # filled since the last tick
 
-    def limit_bid(self, bid_volume, bid_price):
-        order = self.exchange.limit_order(Consts.BID, bid_volume, bid_price)
-        if order:
-            if not order.get('success'):
-                self.logger.error("Limit Order cannot be placed !")
+        # to send several orders concurrently
+        self.dispatcher = order_batch.BatchDispatcher(self.exchange, max_workers=max_workers)
+
+    def _book(self, kind, mode, volume, price, response):
+        """
+        Keep track of an order, once the exchange answered (or not, in dry-run).
+        :param kind: 'limit' or 'market'
+        :param response: what the exchange returned for this order
+        :return: the Order, None if it was not placed
+        """
+        if response:
+            if not response.get('success'):
+                self.logger.error(kind.capitalize() + " Order cannot be placed !")
                 return None
-        elif bid_volume < self.min_order_size:
+        elif volume < self.min_order_size:
             return None
         else:
             assert not self.harness.execute
             pass  # dry-run
 
         # assign id, even if harness doesnt give us anything
-        oid = order.get('order_id') if order else str(uuid.uuid4())[:8]
+        oid = response.get('order_id') if response else str(uuid.uuid4())[:8]
 
         # Store order for this run even if we do not execute, to be able to test strategy over multiple ticks
-        order = LimitOrder(mode=Consts.BID, id=oid, price=bid_price, volume=bid_volume)
-        self.orders_passed[order.id] = order
+        if kind == 'market':
+            if response:
+                price = response.get('price')
+            else:
+                if self.book is None:
+                    # ordering before the first tick
+                    self._observe()
+                price = self.book.price_for_volume(mode, volume)
+                if price is None:
+                    # book not deep enough, left to quote_lib
+                    price = quote_lib.price_quote_from_orderbook(self.ob, mode, volume).get('price_for_order')
+            order = MarketOrder(mode=mode, id=oid, volume=volume, price=price)
+        else:
+            order = LimitOrder(mode=mode, id=oid, price=price, volume=volume)
+        self._record(order)
+
+        if not response and self.ob is not None:
+            # dry-run : matching what is already in the book
+            filled = self.simulator.placed(order, self.ob)
+            if filled > 0:
+                self.logger.warning("SIMULATING ORDER FILL: " + str(order) + " filled " + str(filled))
+                self._fill(order, filled)
+                if order.filled:
+                    self.simulated_eaten.append(order)
+            if order.kind == 'market' and not order.filled:
+                # the book was too thin, the rest of a market order does not stay on the exchange
+                self._cancelled(order.id)
         return order
 
-    def market_bid(self, bid_volume):
-        order = self.exchange.market_order(Consts.BID, bid_volume)
-        if order:
-            if not order.get('success'):
-                self.logger.error("Market Order cannot be placed !")
-                return None
-        elif bid_volume < self.min_order_size:
-            return None
-        else:
-            assert not self.harness.execute
-            pass  # dry-run
-        # assign id, even if harness doesnt give us anything
-        oid = order.get('order_id') if order else str(uuid.uuid4())[:8]
-        op = order.get('price') if order else quote_lib.price_quote_from_orderbook(self.ob, Consts.BID, bid_volume).get('price_for_order')
+    def limit_bid(self, bid_volume, bid_price):
+        return self._book('limit', Consts.BID, bid_volume, bid_price, self.exchange.limit_order(Consts.BID, bid_volume, bid_price))
 
-        # Store order for this run even if we do not execute, to be able to test strategy over multiple ticks
-        order = MarketOrder(mode=Consts.BID, id=oid, volume=bid_volume, price=op)
-        self.orders_passed[order.id] = order
-        return order
+    def market_bid(self, bid_volume):
+        return self._book('market', Consts.BID, bid_volume, None, self.exchange.market_order(bid_volume, Consts.BID))
 
     def limit_ask(self, ask_volume, ask_price):
-        order = self.exchange.limit_order(Consts.ASK, ask_volume, ask_price)
-        if order:
-            if not order.get('success'):
-                self.logger.error("Limit Order cannot be placed !")
-                return None
-        elif ask_volume < self.min_order_size:
-            return None
-        else:
-            assert not self.harness.execute
-            pass  # dry-run
-        # assign id, even if harness doesnt give us anything
-        oid = order.get('order_id') if order else str(uuid.uuid4())[:8]
-
-        # Store order for this run even if we do not execute, to be able to test strategy over multiple ticks
-        order = LimitOrder(mode=Consts.ASK, id=oid, price=ask_price, volume=ask_volume)
-        self.orders_passed[order.id] = order
-        return order
+        return self._book('limit', Consts.ASK, ask_volume, ask_price, self.exchange.limit_order(Consts.ASK, ask_volume, ask_price))
 
     def market_ask(self, ask_volume):
-        order = self.exchange.market_order(Consts.ASK, ask_volume)
-        if order:
-            if not order.get('success'):
-                self.logger.error("Market Order cannot be placed !")
-                return None
-        elif ask_volume < self.min_order_size:
-            return None
-        else:
-            assert not self.harness.execute
-            pass  # dry-run
-        # assign id, even if harness doesnt give us anything
-        oid = order.get('order_id') if order else str(uuid.uuid4())[:8]
-        op = order.get('price') if order else quote_lib.price_quote_from_orderbook(self.ob, Consts.ASK, ask_volume).get('price_for_order')
+        return self._book('market', Consts.ASK, ask_volume, None, self.exchange.market_order(ask_volume, Consts.ASK))
 
-        # Store order for this run even if we do not execute, to be able to test strategy over multiple ticks
-        order = MarketOrder(mode=Consts.ASK, id=oid, volume=ask_volume, price=op)
-        self.orders_passed[order.id] = order
-        return order
+    def batch(self, intents):
+        """
+        Send several orders and cancels at once, see order_batch.
+        :param intents: list of order_batch.OrderIntent
+        :return: list of order_batch.OrderResult, in the same order, with the Order placed if any
+        """
+        results = self.dispatcher.submit(intents)
+        for result in results:
+            intent = result.intent
+            if result.error is not None:
+                self.logger.error(str(intent) + " failed: " + str(result.error))
+            elif intent.kind == order_batch.CANCEL:
+                self._cancelled(intent.order_id)
+            elif intent.kind == order_batch.CANCEL_ALL:
+                for oid in list(self.open_orders):
+                    self._cancelled(oid)
+            else:
+                result.order = self._book(intent.kind, intent.mode, intent.volume, intent.price, result.response)
+            self.logger.debug(str(result))
+        return results
+
+    def _record(self, order):
+        order.seq = self.orders_count
+        self.orders_count += 1
+        self.open_orders[order.id] = order
+        self.open_by_mode.setdefault(order.mode, OrderedDict())[order.id] = order
+        self.ledger.placed(order)
+
+    def _fill(self, order, volume=None):
+        filled_before = order.volume_filled
+        order.fill(volume)
+        self.ledger.filled(order, order.volume_filled - filled_before)
+        if order.filled:
+            self._settle(order)
+
+    def _settle(self, order, cancelled=False):
+        self.simulator.forget(order)
+        self.open_orders.pop(order.id, None)
+        self.open_by_mode[order.mode].pop(order.id, None)
+        self.archive.append(order, settled_at=now_ns(), cancelled=cancelled)
+        if cancelled:
+            return
+
+        if self.last_filled is None or order.seq > self.last_filled.seq:
+            self.last_filled = order
+        last = self.last_filled_by_mode.get(order.mode)
+        if last is None or order.seq > last.seq:
+            self.last_filled_by_mode[order.mode] = order
+
+    def order(self, order_id):
+        """
+        :return: the live order with this id, None if unknown or settled (settled orders are only aggregated, in self.archive)
+        """
+        return self.open_orders.get(order_id)
+
+    def last_unfilled(self, mode=None):
+        """
+        :return: last placed of the live orders, for a mode if specified
+        """
+        orders = self.open_orders if mode is None else self.open_by_mode.get(mode, {})
+        if not orders:
+            return None
+        return orders[next(reversed(orders))]
 
     def cancel(self, order_id):
-        # TODO : find order in passed list
         # TODO : handle orders cancelled by harness...
         self.exchange.cancel_order(order_id=order_id)
-        raise NotImplementedError
+        return self._cancelled(order_id)
+
+    def _cancelled(self, order_id):
+        order = self.open_orders.get(order_id)
+        if order is not None:
+            self.ledger.cancelled(order)
+            self._settle(order, cancelled=True)
+        return order
 
     @property
     def ephemeral_position(self):
-        # compute position here
-        calculated_position = {}
-        for oid, o in self.orders_passed.items():
-            if o.mode == Consts.BID:
-                calculated_position.setdefault(o.price.currency, Money('0', currency=o.price.currency))
-                calculated_position[o.price.currency] -= o.volume.amount * o.price
-
-                if o.filled:
-                    calculated_position.setdefault(o.volume_filled.currency, Money('0', currency=o.volume_filled.currency))
-                    calculated_position[o.volume_filled.currency] += o.volume_filled
-
-            elif o.mode == Consts.ASK:
-                calculated_position.setdefault(o.price.currency, Money('0', currency=o.price.currency))
-                calculated_position[o.volume.currency] -= o.volume
-
-                if o.filled:
-                    calculated_position.setdefault(o.volume_filled.currency, Money('0', currency=o.volume_filled.currency))
-                    calculated_position[o.price.currency] += o.volume_filled.amount * o.price
-
-            else:
-                self.logger.error("unknown order mode")
-        return calculated_position
+        # maintained as orders are placed and filled
+        return dict(self.ledger.position)
 
     # useful question for simple order strategies
     def last_filled_order_is(self, mode= None):
 
-        if not self.orders_passed:
+        if not self.orders_count:
             return False
 
-        for oid, o in reversed(self.orders_passed.items()):
-            if o.filled:
-                return mode == o.mode
+        if self.last_filled:
+            return mode == self.last_filled.mode
 
     # useful question for simple order strategies
     def last_unfilled_order_is(self, mode=None):
-        if not self.orders_passed:
+        if not self.orders_count:
             return False
 
-        for oid, o in reversed(self.orders_passed.items()):
-            if not o.filled:
-                return mode == o.mode
+        last = self.last_unfilled()
+        if last:
+            return mode == last.mode
+
+    def _observe(self):
+        """
+        Fetch the orderbook, and index its quotes.
+        """
+        self.ob = self.exchange.get_orderbook()
+        self.book = OrderbookIndex(self.ob)
 
     def tick(self, current_orders, eaten_orders):
         # to keep track of order filling
 
-        self.ob = self.exchange.get_orderbook()
+        self._observe()
+        eaten = []
 
         if not self.harness.execute:
-            for oid, o in self.orders_passed.items():
-                if not o.filled:
-                    # random fill  # TODO : check sim_exchange...
-                    if random.random() > 0.5:
-                        self.logger.warning("SIMULATING ORDER FILL: " + str(o))
-                        # TODO :  better filling mock logic... limit order might NEVER get filled.
-                        o.fill(o.volume)  # simulating complete fill only for now
-                        eaten_orders[oid] = o.gryphon()
-                    else:
-                        current_orders[oid] = o.gryphon()
-                # Note : eaten order appear only on one loop, when they disappeared, not the following one AFAIK
+            eaten, self.simulated_eaten = self.simulated_eaten, []
+            for o, volume in self.simulator.match(self.ob):
+                self.logger.warning("SIMULATING ORDER FILL: " + str(o) + " filled " + str(volume))
+                self._fill(o, volume)
+                if o.filled:
+                    eaten.append(o)
+            for o in eaten:
+                eaten_orders[o.id] = o.gryphon()
+            for oid, o in self.open_orders.items():
+                current_orders[oid] = o.gryphon()
+            # Note : eaten order appear only on one loop, when they disappeared, not the following one AFAIK
         else:
             # actual filling, other way around...
             for i in eaten_orders:
-                self.orders_passed[i].fill()
+                if i in self.open_orders:
+                    o = self.open_orders[i]
+                    self._fill(o)
+                    eaten.append(o)
 
         # TODO : what happens on partial fills ?
-        return self.ob, current_orders, [self.orders_passed[oid] for oid in eaten_orders]
+        return self.ob, current_orders, eaten
+
+    def close(self):
+        """
+        Stop the threads sending our orders.
+        """
+        self.dispatcher.close()
 
 
 class PositionTracker(object):
@@ -539,11 +638,12 @@ class PositionTracker(object):
 #         return "Volume: " + str(self.order_volume) + " IN: " + str(self.entered_price) + " OUT+: " + str(self.exit_loss_price) + " OUT-: " + str(self.exit_loss_price) + "Timeout: " + str(self.timeout - datetime.now())
 
 
-from basic_ts import TS, LocalMoneyTS
+from basic_ts import LocalMoneyTS, FloatTS, ArrayTS, TrendCounter, realized_volatility
+from ts_store import open_store
 
 class MarketObserver(object):
     """ A very basic market observer, when we dont have ohlcv and we have to do everything ourselves..."""
-    def __init__(self, logger, bullcount_periods, bullcount_trend, bearcount_periods, bearcount_trend):
+    def __init__(self, logger, bullcount_periods, bullcount_trend, bearcount_periods, bearcount_trend, float_indicators=False):
 
         self.logger= logger
         self.bullcount_periods = bullcount_periods
@@ -553,8 +653,31 @@ class MarketObserver(object):
         self.bearcount = 0
         self.bullcount = 0
 
-        self.midpoint_derivative = TS()
-        self.midpoints = LocalMoneyTS(cur='EUR')
+        # bull and bear counts over the last periods, updated on each tick
+        self.trend = TrendCounter((bullcount_periods, bearcount_periods))
+        if float_indicators:
+            self.midpoints = FloatTS(cur='EUR', windows=(1,))
+        else:
+            self.midpoints = LocalMoneyTS(cur='EUR', windows=(1,))
+        # float history of midpoints, for vectorized indicators
+        self.midpoint_history = ArrayTS()
+
+    @property
+    def realized_volatility(self):
+        window = int(max(self.bearcount_periods, self.bullcount_periods))
+        if len(self.midpoint_history) > window:
+            return realized_volatility(self.midpoint_history.values[-window - 1:], window)[-1]
+
+    def restore(self, store):
+        """
+        Resume from the midpoints recorded in a TSStore, and keep recording there.
+        :param store: ts_store.TSStore
+        """
+        self.midpoints.attach(store)
+        records = store.tail(len(self.midpoints))
+        self.midpoint_history.extend(records['value'], records['timestamp'])
+        self.trend.follow(self.midpoints)
+        self.logger.info("Restored " + str(len(self.midpoints)) + " midpoints from " + store.path)
 
     def tick(self, midpoint, on_bull_trend=None, on_bear_trend=None):
         """
@@ -564,30 +687,24 @@ class MarketObserver(object):
         :return:
         """
         self.midpoints += midpoint
+        self.midpoint_history += float(midpoint.amount)
         md = self.midpoints.deriv(last=1)
         if md:
-            self.midpoint_derivative += md
-
-            bearcount = 0
-            bullcount = 0
-            for md in reversed(self.midpoint_derivative):
-                bearcount += (1 if md[1] < 0 else 0)
-                bullcount += (1 if md[1] > 0 else 0)
-            if len(self.midpoint_derivative) > max(self.bearcount_periods, self.bullcount_periods):
-                drop_by = len(self.midpoint_derivative) - int(max(self.bearcount_periods, self.bullcount_periods))
-                self.midpoint_derivative.dropfirst(drop_by)
-                self.midpoints.dropfirst(drop_by)
-                assert len(self.midpoints) == len(self.midpoint_derivative) + 1  # just to be sure...
+            self.trend += md
+            self.logger.info("Realized volatility: " + str(self.realized_volatility))
+
+            self.bullcount = bullcount = self.trend.bullcount(self.bullcount_periods)
+            self.bearcount = bearcount = self.trend.bearcount(self.bearcount_periods)
 
             # We check bull market first as it is easier to deal with this kind of strategy.
             if bullcount >= self.bullcount_trend:
 
-                self.logger.info("BULL market trend detected ! " + str(self.midpoint_derivative))
+                self.logger.info("BULL market trend detected ! " + str(self.trend))
                 if on_bull_trend and callable(on_bull_trend):
                     on_bull_trend()
             elif bearcount >= self.bearcount_trend:
 
-                self.logger.info("BEAR market trend detected ! " + str(self.midpoint_derivative))
+                self.logger.info("BEAR market trend detected ! " + str(self.trend))
 
                 if on_bear_trend and callable(on_bear_trend):
                     on_bear_trend()
@@ -624,6 +741,10 @@ class InvestSingle(MonoExchangeStrategy):
         self.hodl_until_loss_base = 0.002
         #self.hodl_timeout_base = 60
 
+        # shared settings, see README.md
+        self.float_indicators = False
+        self.ts_directory = None
+
         self.base_volume = Money('0.005', currency='BTC')
         self.market_observer = None  # not yet... wait for configuration
 
@@ -652,17 +773,24 @@ class InvestSingle(MonoExchangeStrategy):
 
         #self.init_configurable('hodl_timeout_base', strategy_configuration)
 
+        self.init_configurable('float_indicators', strategy_configuration)
+        self.init_configurable('ts_directory', strategy_configuration)
+
         self.market_observer = MarketObserver(self.logger,
                                               bullcount_periods=self.bullcount_periods,
                                               bullcount_trend=self.bullcount_trend,
                                               bearcount_periods=self.bearcount_periods,
-                                              bearcount_trend=self.bearcount_trend)
+                                              bearcount_trend=self.bearcount_trend,
+                                              float_indicators=self.float_indicators)
+        if self.ts_directory:
+            self.market_observer.restore(open_store(self.ts_directory, self.actor, self.exchange, 'midpoints'))
 
         self.init_configurable('base_volume', strategy_configuration)
 
     def tick(self, current_orders, eaten_order_ids):
 
         self.logger.debug("--Strategy Tick--")
+        self.primary_exchange.new_tick()
 
         # Desk can be our runtime mock, when operating without exchange...
         ob, current_orders, eaten_order_ids = self.desk.tick(current_orders=current_orders, eaten_orders=eaten_order_ids)
@@ -671,8 +799,12 @@ class InvestSingle(MonoExchangeStrategy):
 
         balance = self.primary_exchange.get_balance()
 
-        midpoint = midpoint_lib.get_midpoint_from_orderbook(ob)
+        # computed with the desk orderbook index
+        midpoint = self.desk.book.midpoint
         #self.midpoints += midpoint
+        if midpoint is None:
+            self.logger.warning("One side of the orderbook is empty, skipping this tick")
+            return
 
         self.logger.info("Current midpoint of orderbook : " + str(midpoint))
 
@@ -719,5 +851,10 @@ class InvestSingle(MonoExchangeStrategy):
             else:
                 self.logger.error("Cannot calculate exit profit price")
 
+        self.logger.debug(self.primary_exchange.report())
 
-
+    def close(self):
+        """
+        Release what the strategy holds besides memory, once it is not ticked any more.
+        """
+        self.desk.close()
@@ -13,68 +13,16 @@ from gryphon.lib.money import Money
 from gryphon.lib.exchange.consts import Consts
 from gryphon.lib.metrics import midpoint as midpoint_lib
 
+from basic_ts import LocalMoneyTS, FloatTS, TrendCounter, now
+from ts_store import open_store
+from tick_snapshot import tick_exchange
+
 import logging
 import logging.handlers
 
 from datetime import datetime, timedelta
 
 
-class TS(object):
-
-    def __init__(self):
-        self.series = []
-        self.derivative = []
-
-    def __add__(self, other):
-        assert other is not None
-        timestamp = datetime.now()
-
-        if self.series:
-            last_amount = self.series[-1][1]
-            assert last_amount is not None
-            self.derivative.append((timestamp, 2*(other - last_amount)/(other + last_amount)))
-        self.series.append((timestamp, other))
-        return self
-
-    def deriv(self, last=1):
-        """
-        calculate derivative value for the n last values
-        :param percentile:
-        :return:
-        """
-        if self.derivative:
-            return sum(t[1] for t in self.derivative[-last:]) / len(self.derivative[-last:])
-        else:
-            return None
-
-    def last(self):
-        return self.series[-1]
-
-    def dropfirst(self, number):  # number should be int
-        self.series = self.series[number:]
-        self.derivative = self.derivative[number:]
-
-    def __reversed__(self):
-        return reversed(self.series)
-
-    def __len__(self):
-        return len(self.series)
-
-
-#TODO : test + pandas ...
-class LocalMoneyTS(TS):
-
-    def __init__(self, cur="EUR"):
-        self.currency = cur
-        super(LocalMoneyTS, self).__init__()
-
-    def __add__(self, other):
-        assert isinstance(other, Money) and other.currency == self.currency
-
-        return super(LocalMoneyTS, self).__add__(other)
-
-
-
 class Position(object):
 
     def __init__(self, exchange, logger, targetted_profit_pct, acceptable_loss_pct, timeout = timedelta(minutes=1)):
@@ -82,7 +30,7 @@ class Position(object):
         self.exchange = exchange
         self.targetted_profit_pct = targetted_profit_pct
         self.acceptable_loss_pct = acceptable_loss_pct
-        self.timeout = datetime.now() + timeout
+        self.timeout = now() + timeout
         self.min_order_size = self.exchange.exchange_wrapper.min_order_size
 
         # self.order_volume = None
@@ -135,7 +83,7 @@ class Trade(Position):
         self.exchange = exchange
         self.targetted_profit_pct = targetted_profit_pct
         self.acceptable_loss_pct = acceptable_loss_pct
-        self.timeout = datetime.now() + timeout
+        self.timeout = now() + timeout
         self.min_order_size = self.exchange.exchange_wrapper.min_order_size
 
         self.order_volume = None
@@ -223,7 +171,7 @@ class Trade(Position):
             # we have the funds !
             self.limit_exit(self.exit_profit_price)
 
-        elif self.timeout < datetime.now():
+        elif self.timeout < now():
             # TODO : maybe should put stop_loss early on as well ?
             self.logger.info("Position timeout passed, giving up...")
 
@@ -233,7 +181,7 @@ class Trade(Position):
             self.market_exit(midpoint)
 
     def __str__(self):
-        return "Volume: " + str(self.order_volume) + " IN: " + str(self.entered_price) + " OUT+: " + str(self.exit_loss_price) + " OUT-: " + str(self.exit_loss_price) + "Timeout: " + str(self.timeout - datetime.now())
+        return "Volume: " + str(self.order_volume) + " IN: " + str(self.entered_price) + " OUT+: " + str(self.exit_loss_price) + " OUT-: " + str(self.exit_loss_price) + "Timeout: " + str(self.timeout - now())
 
 
 class MarketHodl(Strategy):
@@ -266,8 +214,8 @@ class MarketHodl(Strategy):
 
         self.trades = []
 
-        self.midpoint_derivative = TS()
-        self.midpoints = LocalMoneyTS(cur='EUR')
+        self.trend = None  # not yet... wait for configuration
+        self.midpoints = None  # not yet... wait for configuration
 
         # Defaults values for settings
         self.stake_currency = u'BTC'
@@ -282,6 +230,11 @@ class MarketHodl(Strategy):
         self.hodl_until_loss_base = Decimal('0.003')
         self.hodl_timeout_base = Decimal('30')
 
+        # shared settings, see README.md
+        self.float_indicators = False
+        self.ts_directory = None
+        self.ob_directory = None
+
         self.configure(strategy_configuration)
 
     def configure(self, strategy_configuration):
@@ -300,15 +253,36 @@ class MarketHodl(Strategy):
         self.init_configurable('hodl_until_profit_base', strategy_configuration)
         self.init_configurable('hodl_until_loss_base', strategy_configuration)
         self.init_configurable('hodl_timeout_base', strategy_configuration)
+        self.init_configurable('float_indicators', strategy_configuration)
+        self.init_configurable('ts_directory', strategy_configuration)
+        self.init_configurable('ob_directory', strategy_configuration)
+
+        # rising ticks counts over the last periods, updated on each tick
+        self.trend = TrendCounter((self.bullcount_periods, self.bearcount_periods))
+
+        if self.float_indicators:
+            self.midpoints = FloatTS(cur='EUR', windows=(1,))
+        else:
+            self.midpoints = LocalMoneyTS(cur='EUR', windows=(1,))
 
         self.init_primary_exchange()
 
+        if self.ts_directory:
+            self.restore_indicators()
+
     def init_primary_exchange(self):
-        self.primary_exchange = self.harness.exchange_from_key(self.exchange)
+        self.primary_exchange = tick_exchange(self.harness, self.exchange, self.ob_directory)
 
         # This causes us to always audit our primary exchange.
         self.target_exchanges = [self.primary_exchange.name]
 
+    def restore_indicators(self):
+        store = open_store(self.ts_directory, self.actor, self.exchange, 'midpoints')
+        self.midpoints.attach(store)
+        # trend counts follow the restored history
+        self.trend.follow(self.midpoints)
+        self.logger.info("Restored " + str(len(self.midpoints)) + " midpoints from " + store.path)
+
     @property
     def actor(self):
         """
@@ -323,6 +297,7 @@ class MarketHodl(Strategy):
     def tick(self, current_orders):
 
         self.logger.debug("--Strategy Tick--")
+        self.primary_exchange.new_tick()
         # NOTE : we currently minimize the number of simultaneous trades, to avoid unintended tricky behavior...
 
         balance = self.primary_exchange.get_balance()
@@ -336,7 +311,7 @@ class MarketHodl(Strategy):
         # TODO : complex tech analysis...
         md = self.midpoints.deriv(last=1)
         if md:
-            self.midpoint_derivative += md
+            self.trend += md
 
         if self.position and self.position > self.primary_exchange.exchange_wrapper.min_order_size:
             self.logger.info("Already in a position!")
@@ -353,11 +328,8 @@ class MarketHodl(Strategy):
                 self.logger.info("Thinking about recovering from current position...")
                 # think about entering a position on this exchange+pair
 
-                bearcount = 0
-                for md in reversed(self.midpoint_derivative):
-                    bearcount += (1 if md[1] > 0 else 0)
-                if len(self.midpoint_derivative) > self.bearcount_periods:
-                    self.midpoint_derivative.dropfirst(len(self.midpoint_derivative) - int(self.bearcount_periods))
+                # NOTE : counting rising ticks here as well
+                bearcount = self.trend.bullcount(self.bearcount_periods)
 
                 if bearcount >= self.bearcount_trend:
 
@@ -394,11 +366,7 @@ class MarketHodl(Strategy):
                 # think about entering a position on this exchange+pair
 
 
-                bullcount = 0
-                for md in reversed(self.midpoint_derivative):
-                    bullcount += (1 if md[1] > 0 else 0)
-                if len(self.midpoint_derivative) > self.bullcount_periods:
-                    self.midpoint_derivative.dropfirst(len(self.midpoint_derivative) - int(self.bullcount_periods))
+                bullcount = self.trend.bullcount(self.bullcount_periods)
 
                 if bullcount >= self.bullcount_trend:
 
@@ -422,7 +390,7 @@ class MarketHodl(Strategy):
                     # profitable trades should be done now, and non profitable trades should wait... until timeout
                     t.tick(balance, midpoint, current_orders)
 
-
+        self.logger.debug(self.primary_exchange.report())
 
 
         #
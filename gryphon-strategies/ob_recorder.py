@@ -0,0 +1,240 @@
+"""
+Records the orderbooks our strategies see, to study them or backtest on them later.
+
+Snapshots go to append-only segment files of fixed-width records, one series of segments per exchange,
+each segment holding a fixed number of records before the next one is started.
+
+Segment layout : a 64 bytes header (magic, record count, depth, exchange key), followed by records of
+int64 timestamp (nanoseconds since epoch) and float64 price and volume of the top `depth` bids and asks,
+NaN where the book is shallower. Segments are read back as numpy arrays over an mmap, without copying.
+"""
+import glob
+import heapq
+import os
+from collections import Counter
+
+import numpy as np
+
+from basic_ts import now_ns
+
+
+MAGIC = b'GRYOB001'
+HEADER_SIZE = 64
+KEY_SIZE = HEADER_SIZE - len(MAGIC) - 16
+
+
+def record_dtype(depth):
+    return np.dtype([
+        ('timestamp', '<i8'),
+        ('bid_price', '<f8', (depth,)),
+        ('bid_volume', '<f8', (depth,)),
+        ('ask_price', '<f8', (depth,)),
+        ('ask_volume', '<f8', (depth,)),
+    ])
+
+
+def segment_path(directory, key, number):
+    return os.path.join(directory, key + "." + str(number).zfill(6) + ".ob")
+
+
+def segment_paths(directory, key):
+    return sorted(glob.glob(os.path.join(directory, key + ".*.ob")))
+
+
+def segment_number(path):
+    """
+    'bitstamp_btc_eur.000012.ob' -> 12
+    """
+    return int(os.path.basename(path).split('.')[-2])
+
+
+def read_header(path):
+    """
+    :return: (record count, depth, exchange key)
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError(path + " is not an orderbook segment")
+    count, depth = np.frombuffer(header[len(MAGIC):len(MAGIC) + 16], dtype='<i8')
+    key = header[len(MAGIC) + 16:].rstrip(b'\0').decode('ascii')
+    return int(count), int(depth), key
+
+
+class Segment(object):
+
+    def __init__(self, path, key=None, depth=None, capacity=None):
+        """
+        Opens a segment, or creates it when key, depth and capacity are given.
+        """
+        self.path = path
+        if not os.path.exists(path):
+            encoded = key.encode('ascii')
+            assert len(encoded) <= KEY_SIZE, "exchange key too long"
+            with open(path, 'wb') as f:
+                f.write(MAGIC + np.array([0, depth], dtype='<i8').tobytes() + encoded.ljust(KEY_SIZE, b'\0'))
+                f.truncate(HEADER_SIZE + capacity * record_dtype(depth).itemsize)
+
+        count, self.depth, self.key = read_header(path)
+        self.dtype = record_dtype(self.depth)
+        self.capacity = (os.path.getsize(path) - HEADER_SIZE) // self.dtype.itemsize
+
+    def _map(self, mode):
+        self.header = np.memmap(self.path, dtype='<i8', mode=mode, offset=len(MAGIC), shape=(1,))
+        self.records = np.memmap(self.path, dtype=self.dtype, mode=mode, offset=HEADER_SIZE, shape=(self.capacity,))
+
+    @property
+    def full(self):
+        return len(self) >= self.capacity
+
+    def append(self, timestamp, bids, asks):
+        """
+        :param bids: (price, volume) of each level, best first, as numbers or strings
+        """
+        if not hasattr(self, 'records'):
+            self._map('r+')
+        count = int(self.header[0])
+        record = self.records[count]
+        record['timestamp'] = timestamp
+        for side, prefix in ((bids, 'bid'), (asks, 'ask')):
+            prices = record[prefix + '_price']
+            volumes = record[prefix + '_volume']
+            n = min(len(side), self.depth)
+            for i in range(n):
+                prices[i] = float(side[i][0])
+                volumes[i] = float(side[i][1])
+            prices[n:] = np.nan
+            volumes[n:] = np.nan
+        # the count is updated last, so a crash never exposes a partial record
+        self.header[0] = count + 1
+
+    def view(self):
+        """
+        :return: the records in this segment, read-only, without copying them
+        """
+        count = read_header(self.path)[0]
+        return np.memmap(self.path, dtype=self.dtype, mode='r', offset=HEADER_SIZE, shape=(self.capacity,))[:count]
+
+    def flush(self):
+        if hasattr(self, 'records'):
+            self.records.flush()
+            self.header.flush()
+
+    def __len__(self):
+        if hasattr(self, 'header'):
+            return int(self.header[0])
+        return read_header(self.path)[0]
+
+
+class OrderbookRecorder(object):
+    """
+    Appends orderbooks of one exchange to its segments in `directory`.
+    """
+
+    def __init__(self, directory, key, depth=20, segment_records=8640):
+        """
+        :param depth: number of price levels kept on each side
+        :param segment_records: records per segment, 8640 is a day of 10 seconds ticks
+        """
+        self.directory = directory
+        self.key = key.lower()
+        self.depth = int(depth)
+        self.segment_records = int(segment_records)
+
+        paths = segment_paths(directory, self.key)
+        # of the next segment to create, after the last one, as old segments may have been pruned
+        self.number = segment_number(paths[-1]) + 1 if paths else 0
+        self.segment = None
+        if paths:
+            last = Segment(paths[-1])
+            # resume in the last segment, if it is compatible
+            if not last.full and last.depth == self.depth:
+                self.segment = last
+
+    def record(self, ob, timestamp=None):
+        """
+        :param ob: orderbook, as gryphon exchanges give them
+        """
+        self.append(now_ns() if timestamp is None else timestamp,
+                    [(level.price.amount, level.volume.amount) for level in ob['bids'][:self.depth]],
+                    [(level.price.amount, level.volume.amount) for level in ob['asks'][:self.depth]])
+
+    def append(self, timestamp, bids, asks):
+        """
+        :param bids: (price, volume) of each level, best first
+        """
+        if self.segment is None or self.segment.full:
+            if self.segment is not None:
+                self.segment.flush()
+            self.segment = Segment(segment_path(self.directory, self.key, self.number), self.key, self.depth, self.segment_records)
+            self.number += 1
+        self.segment.append(timestamp, bids, asks)
+
+    def flush(self):
+        if self.segment is not None:
+            self.segment.flush()
+
+
+class RecordingExchange(object):
+    """
+    Exchange wrapper recording every orderbook fetched, everything else is delegated to the wrapped exchange.
+    """
+
+    def __init__(self, exchange, recorder):
+        self.exchange = exchange
+        self.recorder = recorder
+
+    def get_orderbook(self, *args, **kwargs):
+        ob = self.exchange.get_orderbook(*args, **kwargs)
+        self.recorder.record(ob)
+        return ob
+
+    def __getattr__(self, name):
+        return getattr(self.exchange, name)
+
+
+def save(directory, snapshots, depth=None):
+    """
+    Write orderbook snapshots to segments in `directory`, one segment per exchange.
+    :param snapshots: iterable of (timestamp, exchange key, bids, asks), as backtest.read_jsonl gives them
+    :param depth: levels kept on each side, defaults to the deepest side seen
+    :return: the exchange keys saved
+    """
+    snapshots = list(snapshots)
+    if depth is None:
+        depth = max([len(bids) for _, _, bids, _ in snapshots] + [len(asks) for _, _, _, asks in snapshots] + [1])
+    counts = Counter(key.lower() for _, key, _, _ in snapshots)
+    recorders = dict((key, OrderbookRecorder(directory, key, depth, segment_records=count)) for key, count in counts.items())
+    for timestamp, key, bids, asks in snapshots:
+        recorders[key.lower()].append(timestamp, bids, asks)
+    for recorder in recorders.values():
+        recorder.flush()
+    return sorted(recorders)
+
+
+def load(directory, key):
+    """
+    :return: list of numpy record arrays, one per segment of this exchange, mmapped read-only
+    """
+    return [Segment(path).view() for path in segment_paths(directory, key.lower())]
+
+
+def _snapshots(directory, key, resolution):
+    for records in load(directory, key):
+        for r in records:
+            timestamp = int(r['timestamp'])
+            if resolution:
+                timestamp -= timestamp % resolution
+            # skipping the NaN levels, where the book was shallower
+            bids = [(repr(float(p)), repr(float(v))) for p, v in zip(r['bid_price'], r['bid_volume']) if p == p]
+            asks = [(repr(float(p)), repr(float(v))) for p, v in zip(r['ask_price'], r['ask_volume']) if p == p]
+            yield timestamp, key.lower(), bids, asks
+
+
+def snapshots(directory, keys, resolution=None):
+    """
+    Recorded orderbooks of several exchanges, in time order, as backtest.Backtest.run() takes them.
+    :param resolution: in nanoseconds, timestamps are rounded down to it, so the orderbooks of
+    different exchanges fetched during the same tick share a timestamp (e.g. 10**9)
+    """
+    return heapq.merge(*[_snapshots(directory, key, resolution) for key in keys])
@@ -0,0 +1,443 @@
+"""
+Streaming orderbook : a local copy of an exchange orderbook, kept up to date from a feed of level updates
+(add, modify, delete) instead of polling full snapshots every tick.
+
+Updates carry a sequence number. One that does not follow the last applied means some were lost, the book
+is then resynchronized from a full snapshot and the updates it already covers are skipped. Updates received
+while out of sync are kept until a snapshot catches up with them. A snapshot is a full REST request on a live
+exchange: one is asked per gap, and when it does not bring the book back in sync, the next one waits, longer
+after each failure. Listeners are called after each update applied, so strategies can react within the update
+instead of at the next tick.
+
+ReplayFeed stands in for an exchange feed, replaying the orderbooks recorded by ob_recorder as updates.
+"""
+import heapq
+import random
+import time
+from bisect import bisect_left, insort
+
+from cdecimal import Decimal
+
+from gryphon.lib.money import Money
+from gryphon.lib.exchange.consts import Consts
+
+import ob_recorder
+from basic_ts import monotonic_ns, now_ns
+from orderbook import BookLevel, currencies
+
+
+ADD = 'add'
+MODIFY = 'modify'
+DELETE = 'delete'
+
+
+class LevelUpdate(object):
+    __slots__ = ('sequence', 'side', 'action', 'price', 'volume', 'timestamp')
+
+    def __init__(self, sequence, side, action, price, volume=None, timestamp=None):
+        """
+        :param side: Consts.BID or Consts.ASK
+        :param price: price amount of the level
+        :param volume: new volume amount of the level, None to delete it
+        :param timestamp: nanoseconds since epoch
+        """
+        self.sequence = sequence
+        self.side = side
+        self.action = action
+        self.price = Decimal(price)
+        self.volume = None if volume is None else Decimal(volume)
+        self.timestamp = timestamp
+
+    def __str__(self):
+        return "#" + str(self.sequence) + " " + self.action.upper() + " " + str(self.side) + " " + str(self.price) + ("" if self.volume is None else " " + str(self.volume))
+
+
+class SequenceGap(Exception):
+
+    def __init__(self, expected, received):
+        super(SequenceGap, self).__init__("expected update #" + str(expected) + ", received #" + str(received))
+        self.expected = expected
+        self.received = received
+
+
+def diff(side, old, new):
+    """
+    Level updates turning one side of an orderbook into another.
+    :param old: dict of price amount -> volume amount
+    :param new: dict of price amount -> volume amount
+    :return: list of (side, action, price, volume)
+    """
+    updates = []
+    for price, volume in old.items():
+        if price not in new:
+            updates.append((side, DELETE, price, None))
+        elif new[price] != volume:
+            updates.append((side, MODIFY, price, new[price]))
+    for price, volume in new.items():
+        if price not in old:
+            updates.append((side, ADD, price, volume))
+    return updates
+
+
+class LocalOrderbook(object):
+
+    def __init__(self, key, depth=None):
+        """
+        :param depth: number of levels given on each side by orderbook(), None for all
+        """
+        self.key = key.lower()
+        self.volume_currency, self.price_currency = currencies(self.key)
+        self.depth = depth
+
+        self.levels = {Consts.BID: {}, Consts.ASK: {}}  # price amount -> volume amount
+        # prices as sorted ascending keys, negated for bids
+        self.keys = {Consts.BID: [], Consts.ASK: []}
+        self.sequence = None  # of the last update applied, None until the first snapshot
+        self.timestamp = None
+        self._ob = None
+
+    def _sign(self, side):
+        return -1 if side == Consts.BID else 1
+
+    def reset(self, bids, asks, sequence, timestamp=None):
+        """
+        Start over from a full snapshot.
+        :param bids: list of (price, volume) amounts
+        :param asks: list of (price, volume) amounts
+        :param sequence: of the last update the snapshot includes
+        """
+        for side, levels in ((Consts.BID, bids), (Consts.ASK, asks)):
+            self.levels[side] = dict((Decimal(p), Decimal(v)) for p, v in levels)
+            self.keys[side] = sorted(self._sign(side) * p for p in self.levels[side])
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self._ob = None
+
+    def apply(self, update):
+        """
+        :return: False if the snapshot already included the update
+        :raise SequenceGap: if updates were missed, the book should be resynchronized
+        """
+        if self.sequence is None:
+            raise SequenceGap(None, update.sequence)
+        if update.sequence <= self.sequence:
+            return False
+        if update.sequence != self.sequence + 1:
+            raise SequenceGap(self.sequence + 1, update.sequence)
+
+        levels = self.levels[update.side]
+        keys = self.keys[update.side]
+        key = self._sign(update.side) * update.price
+        if update.action == DELETE or not update.volume:
+            if levels.pop(update.price, None) is not None:
+                del keys[bisect_left(keys, key)]
+        else:
+            if update.price not in levels:
+                insort(keys, key)
+            levels[update.price] = update.volume
+
+        self.sequence = update.sequence
+        self.timestamp = update.timestamp
+        self._ob = None
+        return True
+
+    def side(self, side):
+        """
+        :return: list of (price, volume) amounts, best first
+        """
+        sign = self._sign(side)
+        keys = self.keys[side] if self.depth is None else self.keys[side][:self.depth]
+        return [(sign * k, self.levels[side][sign * k]) for k in keys]
+
+    @property
+    def top(self):
+        """
+        (best bid, best ask) price amounts, None on an empty side
+        """
+        bids, asks = self.keys[Consts.BID], self.keys[Consts.ASK]
+        return (-bids[0] if bids else None, asks[0] if asks else None)
+
+    @property
+    def consistent(self):
+        """
+        False while the book has an empty side or is crossed, as it can be half way through a burst of updates
+        """
+        bid, ask = self.top
+        return bid is not None and ask is not None and bid < ask
+
+    def orderbook(self, exchange=None):
+        """
+        :return: the book as get_orderbook() gives it, built again only after it changed
+        """
+        if self._ob is None:
+            self._ob = {}
+            for side, name in ((Consts.BID, 'bids'), (Consts.ASK, 'asks')):
+                self._ob[name] = [BookLevel(Money(p, self.price_currency), Money(v, self.volume_currency), exchange, side) for p, v in self.side(side)]
+        return self._ob
+
+
+class ReplayFeed(object):
+    """
+    Recorded orderbooks of one exchange, replayed as level updates.
+    """
+
+    def __init__(self, directory, key, speed=None, drop=0., seed=None):
+        """
+        :param speed: replay speed against the recording time, None for as fast as possible
+        :param drop: fraction of updates lost on the way, to exercise resynchronization
+        """
+        self.key = key.lower()
+        self.directory = directory
+        self.speed = speed
+        self.drop = drop
+        self.random = random.Random(seed)
+
+        # the exchange side of the feed
+        self.sequence = 0
+        self.timestamp = None
+        self.bids = {}
+        self.asks = {}
+
+    def snapshot(self):
+        """
+        :return: (bids, asks, sequence, timestamp), the orderbook as the exchange has it now
+        """
+        bids = sorted(self.bids.items(), reverse=True)
+        asks = sorted(self.asks.items())
+        return bids, asks, self.sequence, self.timestamp
+
+    def updates(self):
+        """
+        :return: iterator of LevelUpdate
+        """
+        started = None
+        for timestamp, key, bids, asks in ob_recorder.snapshots(self.directory, [self.key]):
+            if self.speed:
+                if started is None:
+                    started = (monotonic_ns(), timestamp)
+                wait = (started[0] + (timestamp - started[1]) / self.speed - monotonic_ns()) / 1e9
+                if wait > 0:
+                    time.sleep(wait)
+
+            bids = dict((Decimal(p), Decimal(v)) for p, v in bids)
+            asks = dict((Decimal(p), Decimal(v)) for p, v in asks)
+            changes = diff(Consts.BID, self.bids, bids) + diff(Consts.ASK, self.asks, asks)
+            for i, (side, action, price, volume) in enumerate(changes):
+                # the exchange book moves one update at a time, for snapshot() to match its sequence
+                levels = self.bids if side == Consts.BID else self.asks
+                if action == DELETE:
+                    del levels[price]
+                else:
+                    levels[price] = volume
+                self.sequence += 1
+                # spread over the record, each update arriving on its own
+                self.timestamp = timestamp + i
+                if self.drop and self.random.random() < self.drop:
+                    continue
+                yield LevelUpdate(self.sequence, side, action, price, volume, self.timestamp)
+
+
+class OrderbookStream(object):
+    """
+    Keeps a LocalOrderbook up to date from a feed, calling listeners(book, update) after each update applied.
+    A feed has a key, updates() giving LevelUpdates and snapshot() giving (bids, asks, sequence, timestamp),
+    or None when it could not get one.
+    """
+
+    def __init__(self, feed, depth=None, backoff=1., max_backoff=60.):
+        """
+        :param backoff: seconds before asking a new snapshot, after one that did not bring the book back in sync.
+        Doubled after each failure, up to max_backoff. Measured on the update timestamps, so replays do not
+        depend on how fast they run.
+        """
+        self.feed = feed
+        self.book = LocalOrderbook(feed.key, depth)
+        self.listeners = []
+        self.running = False
+        self.pending = []  # updates received while out of sync, in wait for a recent enough snapshot
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = 0  # snapshots in a row that did not bring the book back in sync
+        self.retry_at = None  # nanoseconds, no snapshot is asked before
+
+        # statistics
+        self.applied = 0
+        self.skipped = 0
+        self.resyncs = 0
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def resync(self):
+        """
+        :return: False if the feed gave no snapshot
+        """
+        snapshot = self.feed.snapshot()
+        self.resyncs += 1
+        if snapshot is None:
+            return False
+        bids, asks, sequence, timestamp = snapshot
+        self.book.reset(bids, asks, sequence, timestamp)
+        return True
+
+    def _failed(self, now):
+        delay = min(self.backoff * 2 ** self.failures, self.max_backoff)
+        self.failures += 1
+        self.retry_at = now + int(delay * 1e9)
+
+    def _apply(self, update):
+        """
+        :return: iterator of the updates applied, each given right after it is
+        """
+        if not self.pending:
+            try:
+                if self.book.apply(update):
+                    yield update
+                else:
+                    self.skipped += 1
+                return
+            except SequenceGap:
+                pass
+
+        # out of sync: updates are kept until a snapshot catches up with them
+        self.pending.append(update)
+        now = now_ns() if update.timestamp is None else update.timestamp
+        if self.retry_at is not None and now < self.retry_at:
+            return
+        if not self.resync():
+            self._failed(now)
+            return
+
+        pending = sorted(self.pending, key=lambda u: u.sequence)
+        self.pending = []
+        for i, u in enumerate(pending):
+            try:
+                applied = self.book.apply(u)
+            except SequenceGap:
+                # the snapshot is older than the updates, or some are still missing
+                self.pending = pending[i:]
+                self._failed(now)
+                return
+            if applied:
+                yield u
+            else:
+                self.skipped += 1
+        self.failures = 0
+        self.retry_at = None
+
+    def updates(self):
+        """
+        :return: iterator of the LevelUpdates applied, listeners are called before each is given
+        """
+        self.running = True
+        for update in self.feed.updates():
+            for applied in self._apply(update):
+                self.applied += 1
+                for listener in self.listeners:
+                    listener(self.book, applied)
+                yield applied
+            if not self.running:
+                break
+
+    def run(self):
+        for _ in self.updates():
+            pass
+
+    def stop(self):
+        self.running = False
+
+    def snapshots(self, top_only=False):
+        """
+        The book after each update, as backtest.Backtest.run() takes snapshots, one tick per update.
+        :param top_only: only when the best bid or ask changed
+        """
+        top = None
+        for update in self.updates():
+            if not self.book.consistent:
+                continue
+            if top_only:
+                if self.book.top == top:
+                    continue
+                top = self.book.top
+            yield update.timestamp, self.book.key, self.book.side(Consts.BID), self.book.side(Consts.ASK)
+
+    def __str__(self):
+        return self.book.key + ": " + str(self.applied) + " updates applied, " + str(self.skipped) + " skipped, " + str(self.resyncs) + " resyncs"
+
+
+class StreamingExchange(object):
+    """
+    Exchange wrapper giving the streamed orderbook, everything else is delegated to the wrapped exchange.
+    """
+
+    def __init__(self, exchange, stream):
+        self.exchange = exchange
+        self.stream = stream
+
+    def get_orderbook(self, *args, **kwargs):
+        return self.stream.book.orderbook(self.exchange)
+
+    def __getattr__(self, name):
+        return getattr(self.exchange, name)
+
+
+class OnUpdate(object):
+    """
+    Listener running a strategy tick on updates of the book, rather than every tick_sleep seconds.
+    """
+
+    def __init__(self, strategy, exchanges, top_only=True, min_interval=0.):
+        """
+        :param exchanges: whose orders the strategy is given, as the harness would: open ones, and the ids of
+        those eaten since the last tick
+        :param top_only: only tick when the best bid or ask changed
+        :param min_interval: seconds between two ticks at least
+        """
+        self.strategy = strategy
+        self.exchanges = exchanges
+        self.top_only = top_only
+        self.min_interval = min_interval
+        # strategies take either (current_orders) or (current_orders, eaten_order_ids)
+        self.tick_args = strategy.tick.__code__.co_argcount - 1
+        self.top = None
+        self.last = None
+        self.ticks = 0
+
+    def orders(self):
+        """
+        :return: (dict of order id -> open order, dict of eaten order id -> None)
+        """
+        current_orders = {}
+        eaten_order_ids = {}
+        for exchange in self.exchanges:
+            current, eaten = exchange.consolidate_ledger()
+            current_orders.update((o['id'], o) for o in current)
+            eaten_order_ids.update((oid, None) for oid in eaten)
+        return current_orders, eaten_order_ids
+
+    def __call__(self, book, update):
+        if not book.consistent:
+            return
+        if self.top_only:
+            if book.top == self.top:
+                return
+            self.top = book.top
+        now = monotonic_ns()
+        if self.last is not None and now - self.last < self.min_interval * 1e9:
+            return
+        self.last = now
+        self.ticks += 1
+        current_orders, eaten_order_ids = self.orders()
+        if self.tick_args >= 2:
+            self.strategy.tick(current_orders, eaten_order_ids)
+        else:
+            self.strategy.tick(current_orders)
+
+
+def replay_snapshots(directory, keys, top_only=False, drop=0., seed=None):
+    """
+    Recorded orderbooks of several exchanges replayed as streams, in time order, one snapshot per update.
+    :return: (snapshots, streams)
+    """
+    streams = [OrderbookStream(ReplayFeed(directory, key, drop=drop, seed=seed)) for key in keys]
+    return heapq.merge(*[s.snapshots(top_only) for s in streams]), streams
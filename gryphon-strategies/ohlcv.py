@@ -0,0 +1,136 @@
+"""
+OHLCV bars built incrementally from the orderbook midpoints we observe on each tick.
+Strategies can react on completed bars instead of raw ticks.
+"""
+from collections import deque
+
+from gryphon.lib.metrics import midpoint as midpoint_lib
+
+from basic_ts import now_ns
+
+
+class Bar(object):
+
+    def __init__(self, timestamp, price, volume=0):
+        self.start = timestamp
+        self.end = timestamp
+        self.open = price
+        self.high = price
+        self.low = price
+        self.close = price
+        self.volume = volume
+        self.ticks = 1
+
+    def update(self, timestamp, price, volume=0):
+        self.end = timestamp
+        if price > self.high:
+            self.high = price
+        if price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += volume
+        self.ticks += 1
+
+    def __str__(self):
+        return "O: " + str(self.open) + " H: " + str(self.high) + " L: " + str(self.low) + " C: " + str(self.close) + " V: " + str(self.volume) + " ticks: " + str(self.ticks)
+
+
+class BarBuilder(object):
+    """
+    Builds bars one price at a time, keeping the last `history` completed bars.
+    """
+
+    def __init__(self, closes, history=1000):
+        """
+        :param closes: function of (current bar, timestamp of a new price), True if the bar is
+        complete before that price
+        """
+        self.closes = closes
+        self.bars = deque(maxlen=history)
+        self.current = None
+
+    def update(self, timestamp, price, volume=0):
+        """
+        :return: the bar completed by this price, or None
+        """
+        completed = None
+        if self.current is not None and self.closes(self.current, timestamp):
+            completed = self.current
+            self.bars.append(completed)
+            self.current = None
+
+        if self.current is None:
+            self.current = Bar(timestamp, price, volume)
+        else:
+            self.current.update(timestamp, price, volume)
+        return completed
+
+    def last(self):
+        return self.bars[-1] if self.bars else None
+
+    def __len__(self):
+        return len(self.bars)
+
+
+class TimeBarBuilder(BarBuilder):
+    """
+    Bars covering `seconds`, aligned on the epoch. No bar is produced for periods without any tick.
+    """
+
+    def __init__(self, seconds, history=1000):
+        self.seconds = float(seconds)
+        super(TimeBarBuilder, self).__init__(self._closes, history=history)
+
+    def _closes(self, bar, timestamp):
+        return timestamp // self.seconds != bar.start // self.seconds
+
+
+class TickBarBuilder(BarBuilder):
+    """
+    Bars made of `ticks` prices each.
+    """
+
+    def __init__(self, ticks, history=1000):
+        self.ticks = int(ticks)
+        super(TickBarBuilder, self).__init__(self._closes, history=history)
+
+    def _closes(self, bar, timestamp):
+        return bar.ticks >= self.ticks
+
+
+class OHLCV(object):
+    """
+    Builds bars of several sizes at once, from the same prices.
+    Time bars are keyed by their duration in seconds, tick bars by "<n>t" (e.g. "100t").
+    """
+
+    def __init__(self, seconds=(), ticks=(), history=1000):
+        self.builders = {}
+        for s in seconds:
+            self.builders[s] = TimeBarBuilder(s, history=history)
+        for t in ticks:
+            self.builders[str(t) + "t"] = TickBarBuilder(t, history=history)
+
+    def update(self, price, volume=0, timestamp=None):
+        """
+        Add a price to all bars.
+        :param timestamp: in seconds since epoch, defaults to now
+        :return: dict of the bars completed by this price, by key
+        """
+        timestamp = now_ns() / 1e9 if timestamp is None else timestamp
+        completed = {}
+        for key, builder in self.builders.items():
+            bar = builder.update(timestamp, price, volume)
+            if bar is not None:
+                completed[key] = bar
+        return completed
+
+    def update_from_orderbook(self, ob, volume=0, timestamp=None):
+        """
+        Add the midpoint of an orderbook to all bars.
+        Orderbooks do not tell us the traded volume, pass it if known (our own fills for instance).
+        """
+        return self.update(midpoint_lib.get_midpoint_from_orderbook(ob), volume=volume, timestamp=timestamp)
+
+    def __getitem__(self, key):
+        return self.builders[key]
@@ -0,0 +1,108 @@
+"""
+Columnar archive of settled (filled or cancelled) orders.
+One row per order, in numpy columns, so millions of orders cost a few dozen bytes each
+and aggregates are computed without touching Python objects.
+Order ids are not kept: orders are looked up live, on the Desk, the archive is for aggregates.
+"""
+import numpy as np
+
+from gryphon.lib.exchange.consts import Consts
+
+
+MODES = {Consts.BID: 1, Consts.ASK: -1}
+KINDS = {'limit': 0, 'market': 1}
+
+
+class OrderArchive(object):
+
+    COLUMNS = [
+        ('mode', np.int8),
+        ('kind', np.int8),
+        ('cancelled', np.bool_),
+        ('price', np.float64),
+        ('volume', np.float64),
+        ('volume_filled', np.float64),
+        ('placed_at', np.int64),  # nanoseconds since epoch
+        ('settled_at', np.int64),
+    ]
+
+    def __init__(self, initial_capacity=1024):
+        self.size = 0
+        self.capacity = initial_capacity
+        self.columns = dict((name, np.zeros(initial_capacity, dtype=dtype)) for name, dtype in self.COLUMNS)
+        # a desk trades a single pair
+        self.price_currency = None
+        self.volume_currency = None
+
+    def _grow(self):
+        self.capacity *= 2
+        for name, dtype in self.COLUMNS:
+            column = np.zeros(self.capacity, dtype=dtype)
+            column[:self.size] = self.columns[name][:self.size]
+            self.columns[name] = column
+
+    def append(self, order, settled_at, cancelled=False):
+        if self.size == self.capacity:
+            self._grow()
+
+        if self.price_currency is None:
+            self.price_currency = order.price.currency
+            self.volume_currency = order.volume.currency
+        assert order.price.currency == self.price_currency and order.volume.currency == self.volume_currency
+
+        row = self.size
+        self.columns['mode'][row] = MODES[order.mode]
+        self.columns['kind'][row] = KINDS[order.kind]
+        self.columns['cancelled'][row] = cancelled
+        self.columns['price'][row] = float(order.price.amount)
+        self.columns['volume'][row] = float(order.volume.amount)
+        self.columns['volume_filled'][row] = float(order.volume_filled.amount)
+        self.columns['placed_at'][row] = order.placed_at
+        self.columns['settled_at'][row] = settled_at
+        self.size += 1
+
+    def column(self, name):
+        """
+        :return: a view of a column, for the orders archived so far
+        """
+        return self.columns[name][:self.size]
+
+    def _mask(self, mode=None, since=None, until=None):
+        mask = np.ones(self.size, dtype=np.bool_)
+        if mode is not None:
+            mask &= self.column('mode') == MODES[mode]
+        if since is not None:
+            mask &= self.column('settled_at') >= since
+        if until is not None:
+            mask &= self.column('settled_at') <= until
+        return mask
+
+    # aggregates, optionally by mode and settlement time range (nanoseconds since epoch)
+
+    def count(self, mode=None, since=None, until=None):
+        return int(self._mask(mode, since, until).sum())
+
+    def filled_volume(self, mode=None, since=None, until=None):
+        return float(self.column('volume_filled')[self._mask(mode, since, until)].sum())
+
+    def notional(self, mode=None, since=None, until=None):
+        """
+        price times filled volume
+        """
+        mask = self._mask(mode, since, until)
+        return float((self.column('price')[mask] * self.column('volume_filled')[mask]).sum())
+
+    def vwap(self, mode=None, since=None, until=None):
+        volume = self.filled_volume(mode, since, until)
+        return self.notional(mode, since, until) / volume if volume else None
+
+    def fill_ratio(self, mode=None, since=None, until=None):
+        """
+        filled volume over volume ordered
+        """
+        mask = self._mask(mode, since, until)
+        volume = self.column('volume')[mask].sum()
+        return float(self.column('volume_filled')[mask].sum() / volume) if volume else None
+
+    def __len__(self):
+        return self.size
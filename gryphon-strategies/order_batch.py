@@ -0,0 +1,142 @@
+"""
+Concurrent submission of several orders to an exchange.
+Cancels are sent first, all at once, then new orders, all at once,
+so the time to get quotes live is about the slowest round-trip, not the sum of them.
+"""
+from multiprocessing.pool import ThreadPool
+
+from basic_ts import monotonic_ns
+
+
+CANCEL = 'cancel'
+CANCEL_ALL = 'cancel_all'
+LIMIT = 'limit'
+MARKET = 'market'
+
+
+class OrderIntent(object):
+
+    def __init__(self, kind, mode=None, volume=None, price=None, order_id=None):
+        self.kind = kind
+        self.mode = mode
+        self.volume = volume
+        self.price = price
+        self.order_id = order_id
+
+    @classmethod
+    def limit(cls, mode, volume, price):
+        return cls(LIMIT, mode=mode, volume=volume, price=price)
+
+    @classmethod
+    def market(cls, mode, volume):
+        return cls(MARKET, mode=mode, volume=volume)
+
+    @classmethod
+    def cancel(cls, order_id):
+        return cls(CANCEL, order_id=order_id)
+
+    @classmethod
+    def cancel_all(cls):
+        return cls(CANCEL_ALL)
+
+    @property
+    def is_cancel(self):
+        return self.kind in (CANCEL, CANCEL_ALL)
+
+    def __str__(self):
+        if self.kind == CANCEL:
+            return "CANCEL " + str(self.order_id)
+        elif self.kind == CANCEL_ALL:
+            return "CANCEL ALL"
+        return self.kind.upper() + " " + str(self.mode) + " " + str(self.volume) + ("" if self.price is None else " @ " + str(self.price))
+
+
+class OrderResult(object):
+
+    def __init__(self, intent, response=None, error=None, started=None, ended=None):
+        self.intent = intent
+        self.response = response  # what the exchange returned
+        self.error = error  # exception raised, if any
+        self.started = started  # monotonic nanoseconds
+        self.ended = ended
+        self.order = None  # filled in by the Desk, for placed orders
+
+    @property
+    def duration(self):
+        """
+        round-trip in seconds
+        """
+        return (self.ended - self.started) / 1e9
+
+    @property
+    def success(self):
+        if self.error is not None:
+            return False
+        if self.intent.is_cancel:
+            return True
+        # no response in dry-run
+        return not self.response or bool(self.response.get('success'))
+
+    def __str__(self):
+        return str(self.intent) + (" FAILED: " + str(self.error) if self.error is not None else "") + " in " + str(self.duration) + "s"
+
+
+def dispatch(exchange, intent):
+    """
+    Send one OrderIntent to an exchange, timed. Errors are kept in the result, not raised.
+    :return: OrderResult
+    """
+    started = monotonic_ns()
+    try:
+        if intent.kind == LIMIT:
+            response = exchange.limit_order(intent.mode, intent.volume, intent.price)
+        elif intent.kind == MARKET:
+            # gryphon takes the volume first for market orders, unlike limit orders
+            response = exchange.market_order(intent.volume, intent.mode)
+        elif intent.kind == CANCEL:
+            response = exchange.cancel_order(order_id=intent.order_id)
+        elif intent.kind == CANCEL_ALL:
+            response = exchange.cancel_all_open_orders()
+        else:
+            raise ValueError("unknown order intent " + str(intent.kind))
+    except Exception as e:
+        return OrderResult(intent, error=e, started=started, ended=monotonic_ns())
+    return OrderResult(intent, response=response, started=started, ended=monotonic_ns())
+
+
+class BatchDispatcher(object):
+    """
+    Sends OrderIntents to an exchange on a bounded pool of threads.
+    With max_workers=1 this is the same as sending them one after the other.
+    """
+
+    def __init__(self, exchange, max_workers=4):
+        self.exchange = exchange
+        self.max_workers = max_workers
+        self.pool = None  # started on the first submit, strategies that never send orders need no threads
+
+    def _dispatch(self, intent):
+        return dispatch(self.exchange, intent)
+
+    def submit(self, intents):
+        """
+        :param intents: list of OrderIntent
+        :return: list of OrderResult, in the same order
+        """
+        if self.pool is None:
+            self.pool = ThreadPool(self.max_workers)
+        results = {}
+        cancels = [i for i in intents if i.is_cancel]
+        orders = [i for i in intents if not i.is_cancel]
+        # new orders must not be caught by the cancels
+        for phase in (cancels, orders):
+            if phase:
+                for intent, result in zip(phase, self.pool.map(self._dispatch, phase)):
+                    results[id(intent)] = result
+        return [results[id(i)] for i in intents]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
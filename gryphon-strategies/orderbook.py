@@ -0,0 +1,25 @@
+"""
+Orderbooks in the shape gryphon exchanges give them, for the orderbooks we build ourselves:
+replayed by the backtest, or kept up to date from a stream.
+"""
+
+
+def currencies(exchange_key):
+    """
+    'bitstamp_btc_eur' -> ('BTC', 'EUR')
+    """
+    volume_currency, price_currency = exchange_key.split('_')[-2:]
+    return volume_currency.upper(), price_currency.upper()
+
+
+class BookLevel(object):
+    """
+    An orderbook entry, as gryphon exchanges give them
+    """
+    __slots__ = ('price', 'volume', 'exchange', 'order_type')
+
+    def __init__(self, price, volume, exchange=None, order_type=None):
+        self.price = price
+        self.volume = volume
+        self.exchange = exchange
+        self.order_type = order_type
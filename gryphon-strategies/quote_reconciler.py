@@ -0,0 +1,67 @@
+"""
+Reconciles the quotes we want with the orders already live on the exchange,
+instead of cancelling everything and posting again on each tick.
+Orders still close enough to what we want are left alone, and keep their place in the queue.
+"""
+from cdecimal import Decimal
+
+from gryphon.lib.exchange.consts import Consts
+
+from order_batch import OrderIntent
+
+
+class QuoteReconciler(object):
+
+    def __init__(self, price_tolerance=Decimal('0'), volume_tolerance=Decimal('0')):
+        """
+        :param price_tolerance: relative price difference under which a live order is kept
+        :param volume_tolerance: relative volume difference under which a live order is kept
+        """
+        self.price_tolerance = Decimal(price_tolerance)
+        self.volume_tolerance = Decimal(volume_tolerance)
+
+        # since the start
+        self.kept = 0
+        self.cancelled = 0
+        self.posted = 0
+
+    def _close(self, actual, desired, tolerance):
+        return abs(actual.amount - desired.amount) <= tolerance * abs(desired.amount)
+
+    def matches(self, live_order, volume, price):
+        """
+        :param live_order: an order as returned by exchange.get_open_orders()
+        """
+        return (self._close(live_order['price'], price, self.price_tolerance) and
+                self._close(live_order['volume_remaining'], volume, self.volume_tolerance))
+
+    def reconcile(self, open_orders, desired):
+        """
+        :param open_orders: live orders, as returned by exchange.get_open_orders()
+        :param desired: dict of mode -> (volume, price), or None when we want no order on that side
+        :return: list of OrderIntent, cancelling the orders that moved and posting the missing quotes
+        """
+        intents = []
+        for mode in (Consts.BID, Consts.ASK):
+            quote = desired.get(mode)
+            keep = None
+            for o in open_orders or []:
+                if o['mode'] != mode:
+                    continue
+                # only one order per side is kept, the first one close enough
+                if keep is None and quote is not None and self.matches(o, *quote):
+                    keep = o
+                else:
+                    intents.append(OrderIntent.cancel(o['id']))
+                    self.cancelled += 1
+
+            if keep is not None:
+                self.kept += 1
+            elif quote is not None:
+                volume, price = quote
+                intents.append(OrderIntent.limit(mode, volume, price))
+                self.posted += 1
+        return intents
+
+    def report(self):
+        return "Quotes kept: " + str(self.kept) + " cancelled: " + str(self.cancelled) + " posted: " + str(self.posted)
@@ -0,0 +1,232 @@
+"""
+Parameter sweep : backtests a strategy over many configurations, on all cores,
+and ranks them by PnL and drawdown.
+
+Configurations are a grid over some init_configurable keys, or random samples in ranges.
+Market data is read by workers from recorded segments (see ob_recorder), mmapped, so the pages are
+shared by all workers instead of being copied. JSONL orderbooks are converted to segments once, before
+the workers start.
+
+Usage :
+    python sweep.py dynamic_market_making.DynamicMarketMaking dynamic_market_making.conf <orderbooks> \
+        --exchange bitstamp_btc_eur --balance bitstamp_btc_eur:EUR:1000 --balance bitstamp_btc_eur:BTC:0.1 \
+        --grid spread=0.001,0.002,0.005 --range spread_coef_on_loss=1.1:3 --samples 1000
+"""
+import argparse
+import importlib
+import itertools
+import os
+import random
+import shutil
+import sys
+import tempfile
+import traceback
+from multiprocessing import Pool, cpu_count
+
+from cdecimal import Decimal
+
+from gryphon.lib.money import Money
+
+import ob_recorder
+from backtest import Backtest, backtest_exchange, load_configuration, parse_value, read_jsonl
+
+
+def grid(params):
+    """
+    :param params: dict of key -> list of values
+    :return: list of dicts, one per combination
+    """
+    keys = sorted(params)
+    return [dict(zip(keys, values)) for values in itertools.product(*[params[k] for k in keys])]
+
+
+def _sample(rng, low, high):
+    if isinstance(low, Money):
+        return Money(_sample(rng, low.amount, high.amount), currency=low.currency)
+    if isinstance(low, int) and isinstance(high, int):
+        return rng.randint(low, high)
+    if Decimal(low).as_tuple().exponent >= 0 and Decimal(high).as_tuple().exponent >= 0:
+        # whole numbers, e.g. periods
+        return Decimal(rng.randint(int(low), int(high)))
+    # keep the precision of the bounds given
+    places = max(-Decimal(low).as_tuple().exponent, -Decimal(high).as_tuple().exponent, 0) + 2
+    return Decimal(repr(round(rng.uniform(float(low), float(high)), places)))
+
+
+def random_samples(number, ranges, choices=None, seed=None):
+    """
+    :param ranges: dict of key -> (low, high), Decimal, int or Money bounds
+    :param choices: dict of key -> list of values, picked from uniformly
+    :return: list of `number` dicts
+    """
+    rng = random.Random(seed)
+    choices = choices or {}
+    samples = []
+    for _ in range(number):
+        sample = dict((k, _sample(rng, low, high)) for k, (low, high) in sorted(ranges.items()))
+        sample.update((k, rng.choice(values)) for k, values in sorted(choices.items()))
+        samples.append(sample)
+    return samples
+
+
+class SweepResult(object):
+
+    def __init__(self, params, pnl=None, max_drawdown=None, fills=0, error=None):
+        self.params = params
+        self.pnl = pnl
+        self.max_drawdown = max_drawdown
+        self.fills = fills
+        self.error = error
+
+    def score(self, drawdown_weight=0.):
+        if self.error is not None:
+            return float('-inf')
+        return self.pnl - drawdown_weight * self.max_drawdown
+
+    def __str__(self):
+        params = ", ".join(k + "=" + str(v) for k, v in sorted(self.params.items()))
+        if self.error is not None:
+            return params + " FAILED: " + self.error.splitlines()[-1]
+        return "PnL: " + str(round(self.pnl, 8)) + " max drawdown: " + str(round(self.max_drawdown, 8)) + " fills: " + str(self.fills) + " | " + params
+
+
+def rank(results, drawdown_weight=0.):
+    """
+    Best first : highest PnL (less drawdown_weight times the max drawdown), then lowest drawdown.
+    """
+    return sorted(results, key=lambda r: (-r.score(drawdown_weight), r.max_drawdown if r.error is None else 0))
+
+
+# worker state, set once per process by _init_worker
+_worker = {}
+
+
+def _init_worker(strategy_path, configuration, exchanges_configuration, exchange_keys, balances, orderbooks, resolution, workdir):
+    """
+    :param orderbooks: ob_recorder directory
+    """
+    module_name, class_name = strategy_path.rsplit('.', 1)
+    _worker['strategy_class'] = getattr(importlib.import_module(module_name), class_name)
+    _worker['configuration'] = configuration
+    _worker['exchanges_configuration'] = exchanges_configuration
+    _worker['exchange_keys'] = exchange_keys
+    _worker['balances'] = balances
+    _worker['orderbooks'] = orderbooks
+    _worker['resolution'] = resolution
+
+    # strategies write log files in the current directory, and print
+    os.chdir(workdir)
+    sys.stdout = open(os.devnull, 'w')
+
+
+def run_one(params):
+    """
+    Backtest one configuration, in a worker.
+    :return: SweepResult
+    """
+    configuration = dict(_worker['configuration'])
+    configuration.update(params)
+    exchanges = [backtest_exchange(key, _worker['exchanges_configuration'].get(key), _worker['balances'].get(key))
+                 for key in _worker['exchange_keys']]
+    backtest = None
+    try:
+        backtest = Backtest(_worker['strategy_class'], configuration, exchanges)
+        unknown = [k for k in params if not hasattr(backtest.strategy, k)]
+        if unknown:
+            raise ValueError("not configurable: " + ", ".join(unknown))
+        report = backtest.run(ob_recorder.snapshots(_worker['orderbooks'], _worker['exchange_keys'], resolution=_worker['resolution']))
+        currency = exchanges[0].price_currency
+        return SweepResult(params, report.pnl(currency), report.max_drawdown(currency), sum(e.fills for e in exchanges))
+    except Exception:
+        return SweepResult(params, error=traceback.format_exc())
+    finally:
+        # strategies hold thread pools, thousands of configurations would exhaust the threads
+        close = getattr(backtest and backtest.strategy, 'close', None)
+        if close is not None:
+            close()
+        # each strategy instance adds a file handler to its module logger
+        logger = getattr(backtest and backtest.strategy, 'logger', None)
+        if logger is not None:
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                handler.close()
+
+
+def sweep(strategy_path, configuration, exchanges_configuration, exchange_keys, balances, orderbooks, params_list,
+          processes=None, resolution=10**9):
+    """
+    :param strategy_path: module.Class of the strategy
+    :param orderbooks: .jsonl file or ob_recorder directory
+    :param params_list: list of dicts of configuration keys to override
+    :return: list of SweepResult, in the order of params_list
+    """
+    workdir = tempfile.mkdtemp(prefix='sweep.')
+    try:
+        directory = os.path.abspath(orderbooks)
+        if not os.path.isdir(directory):
+            # JSONL snapshots are already grouped by tick
+            directory = os.path.join(workdir, 'orderbooks')
+            os.mkdir(directory)
+            ob_recorder.save(directory, read_jsonl(orderbooks))
+            resolution = None
+        pool = Pool(processes or cpu_count(), initializer=_init_worker,
+                    initargs=(strategy_path, configuration, exchanges_configuration, exchange_keys, balances,
+                              directory, resolution, workdir))
+        try:
+            return pool.map(run_one, params_list, chunksize=max(1, len(params_list) // (4 * (processes or cpu_count()))))
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _parse_assignment(text):
+    key, value = text.split('=', 1)
+    return key.strip(), value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest a strategy over many configurations")
+    parser.add_argument('strategy', help="module.Class, e.g. dynamic_market_making.DynamicMarketMaking")
+    parser.add_argument('configuration', help="strategy .conf file, the base configuration")
+    parser.add_argument('orderbooks', help="recorded orderbooks, .jsonl file or ob_recorder directory")
+    parser.add_argument('--exchange', action='append', default=[], help="exchange key, the first one is the strategy exchange")
+    parser.add_argument('--balance', action='append', default=[], help="EXCHANGE:CURRENCY:AMOUNT starting balance")
+    parser.add_argument('--grid', action='append', default=[], help="key=v1,v2,... values to try")
+    parser.add_argument('--range', action='append', default=[], help="key=low:high, sampled uniformly (needs --samples)")
+    parser.add_argument('--samples', type=int, default=0, help="random configurations instead of the whole grid")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--processes', type=int, default=None, help="defaults to the number of cores")
+    parser.add_argument('--drawdown-weight', type=float, default=0., help="ranking on PnL minus this times the max drawdown")
+    parser.add_argument('--resolution', type=float, default=1., help="seconds, ob_recorder orderbooks of different exchanges within it make one tick")
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    configuration, exchanges_configuration = load_configuration(args.configuration)
+    if args.exchange:
+        configuration.setdefault('exchange', args.exchange[0])
+
+    balances = {}
+    for b in args.balance:
+        key, currency, amount = b.split(':')
+        balances.setdefault(key, {})[currency] = Money(amount, currency=currency)
+
+    values = dict((k, [parse_value(v.strip()) for v in vs.split(',')]) for k, vs in map(_parse_assignment, args.grid))
+    ranges = dict((k, tuple(parse_value(v.strip()) for v in bounds.split(':'))) for k, bounds in map(_parse_assignment, args.range))
+    if args.samples:
+        params_list = random_samples(args.samples, ranges, values, seed=args.seed)
+    else:
+        params_list = grid(values)
+
+    results = sweep(args.strategy, configuration, exchanges_configuration, args.exchange, balances, args.orderbooks,
+                    params_list, processes=args.processes, resolution=int(args.resolution * 1e9))
+    ranked = rank(results, args.drawdown_weight)
+    failed = sum(1 for r in results if r.error is not None)
+    print(str(len(results)) + " configurations, " + str(failed) + " failed")
+    for r in ranked[:args.top]:
+        print(r)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import os
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from gryphon.lib.money import Money
+
+# compiled from arb.pyx, see requirements.txt
+arb = pytest.importorskip('arb')
+
+# an orderbook entry, as gryphon exchanges give them
+BookLevel = namedtuple('BookLevel', 'price volume')
+
+
+def orderbook(currency, bids, asks):
+    return {
+        'bids': [BookLevel(Money(p, currency), Money(v, 'BTC')) for p, v in bids],
+        'asks': [BookLevel(Money(p, currency), Money(v, 'BTC')) for p, v in asks],
+    }
+
+
+def test_cross_walks_levels_while_profitable():
+    books = [
+        orderbook('EUR', [('99', '1')], [('100', '0.5'), ('101', '1')]),
+        orderbook('EUR', [('103', '0.7'), ('101.5', '2')], [('104', '1')]),
+        # not crossed with the others
+        orderbook('EUR', [('98', '1')], [('105', '1')]),
+    ]
+    volumes, profits = arb.find_crosses(*arb.book_arrays(books, depth=2), fees=np.zeros(3))
+
+    # 0.5 at 100 -> 103, 0.2 at 101 -> 103, 0.8 at 101 -> 101.5, then the asks are used up
+    assert volumes[0, 1] == pytest.approx(1.5)
+    assert profits[0, 1] == pytest.approx(0.5 * 3 + 0.2 * 2 + 0.8 * 0.5)
+    assert volumes[1, 0] == 0
+    assert not volumes[2].any() and not volumes[:, 2].any()
+    assert arb.crossed_pairs(volumes, profits) == [(0, 1, volumes[0, 1], profits[0, 1])]
+
+
+def test_fees_and_currencies():
+    books = [
+        orderbook('EUR', [('3590', '1')], [('3600', '1')]),
+        # 4010 USD is 3609 EUR
+        orderbook('USD', [('4010', '1')], [('4100', '1')]),
+    ]
+    rates = arb.rates_to(books, 'EUR')
+    assert rates == [1., pytest.approx(0.9)]
+
+    volumes, _ = arb.find_crosses(*arb.book_arrays(books, rates=rates), fees=np.zeros(2))
+    assert volumes[0, 1] == pytest.approx(1.0)
+    # 0.25% on each side is more than the 9 EUR of difference
+    volumes, _ = arb.find_crosses(*arb.book_arrays(books, rates=rates), fees=np.array([0.0025, 0.0025]))
+    assert volumes[0, 1] == 0
@@ -0,0 +1,89 @@
+import os
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.exchange.exceptions import ExchangeAPIErrorException
+from gryphon.lib.money import Money
+
+from arb_executor import ArbExecutor, UNWIND_COMPLETE, UNWIND_NONE
+
+Cross = namedtuple('Cross', 'buy_exchange sell_exchange')
+
+
+class StubExchange(object):
+    """
+    Fills market orders up to `fill_ratio` of their volume, at `price`.
+    """
+
+    def __init__(self, name, price, fill_ratio=1, details=True):
+        self.name = name
+        self.price = Money(price, 'EUR')
+        self.fill_ratio = fill_ratio
+        self.details = details
+        self.orders = {}
+        self.calls = []
+
+    def market_order(self, volume, mode):
+        self.calls.append((volume, mode))
+        order_id = self.name + str(len(self.calls))
+        self.orders[order_id] = volume * self.fill_ratio
+        return {'success': True, 'order_id': order_id}
+
+    def get_order_details(self, order_id):
+        if not self.details:
+            raise ExchangeAPIErrorException(self, "order details unavailable")
+        filled = self.orders[order_id]
+        return {'btc_total': filled, 'fiat_total': self.price * filled.amount}
+
+
+def execute(buy, sell, unwind='flatten'):
+    executor = ArbExecutor(unwind=unwind)
+    try:
+        return executor.execute(Cross(buy, sell), Money('1', 'BTC'))
+    finally:
+        executor.close()
+
+
+def test_both_legs_sent_with_gryphon_argument_order():
+    buy, sell = StubExchange('KRAKEN', '100'), StubExchange('BITSTAMP', '101')
+    execution = execute(buy, sell)
+    # market_order takes the volume first
+    assert buy.calls == [(Money('1', 'BTC'), Consts.BID)]
+    assert sell.calls == [(Money('1', 'BTC'), Consts.ASK)]
+    assert execution.complete
+    assert execution.buy.price == Money('100', 'EUR')
+    assert not execution.unwinds
+
+
+def test_flatten_sells_the_excess_where_it_was_bought():
+    buy, sell = StubExchange('KRAKEN', '100'), StubExchange('BITSTAMP', '101', fill_ratio='0.6')
+    execution = execute(buy, sell)
+    assert buy.calls[1] == (Money('0.4', 'BTC'), Consts.ASK)
+    assert execution.imbalance == Money('0', 'BTC')
+
+
+def test_complete_sends_the_missing_volume_again():
+    buy, sell = StubExchange('KRAKEN', '100'), StubExchange('BITSTAMP', '101', fill_ratio='0.6')
+    execution = execute(buy, sell, unwind=UNWIND_COMPLETE)
+    assert sell.calls[1] == (Money('0.4', 'BTC'), Consts.ASK)
+    # which fills 60% again
+    assert execution.imbalance == Money('0.16', 'BTC')
+
+
+def test_imbalance_kept_without_unwind():
+    buy, sell = StubExchange('KRAKEN', '100'), StubExchange('BITSTAMP', '101', fill_ratio='0.6')
+    execution = execute(buy, sell, unwind=UNWIND_NONE)
+    assert len(buy.calls) == len(sell.calls) == 1
+    assert execution.imbalance == Money('0.4', 'BTC')
+
+
+def test_unknown_fill_is_not_unwound():
+    buy, sell = StubExchange('KRAKEN', '100'), StubExchange('BITSTAMP', '101', details=False)
+    execution = execute(buy, sell)
+    assert execution.sell.success and not execution.sell.confirmed
+    assert not execution.confirmed and not execution.complete
+    assert not execution.unwinds
+    assert len(buy.calls) == len(sell.calls) == 1
@@ -0,0 +1,61 @@
+import math
+import os
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.money import Money
+
+from arb_graph import PairGraph, currencies
+
+# an orderbook entry, as gryphon exchanges give them
+BookLevel = namedtuple('BookLevel', 'price volume')
+
+
+def top(base, quote, bid, bid_volume, ask, ask_volume):
+    return {
+        'bids': [BookLevel(Money(bid, quote), Money(bid_volume, base))],
+        'asks': [BookLevel(Money(ask, quote), Money(ask_volume, base))],
+    }
+
+
+def graph(fee=0.):
+    g = PairGraph(max_hops=3)
+    for key in ('bitstamp_eth_btc', 'bitstamp_btc_eur', 'kraken_eth_eur'):
+        g.add_pair(key, fee=fee)
+    g.update('bitstamp_eth_btc', top('ETH', 'BTC', '0.08', '10', '0.081', '10'))
+    g.update('bitstamp_btc_eur', top('BTC', 'EUR', '4000', '0.5', '4010', '0.5'))
+    g.update('kraken_eth_eur', top('ETH', 'EUR', '300', '1', '301', '1'))
+    return g
+
+
+def test_currencies():
+    assert currencies('bitstamp_eth_btc') == ('ETH', 'BTC')
+
+
+def test_triangle_in_both_directions():
+    g = graph()
+    assert sorted(c.currencies for c in g.cycles) == [['BTC', 'ETH', 'EUR', 'BTC'], ['BTC', 'EUR', 'ETH', 'BTC']]
+
+    # selling BTC for EUR, buying ETH with it, selling the ETH for BTC
+    cycle, = g.profitable_cycles()
+    assert cycle.currencies == ['BTC', 'EUR', 'ETH', 'BTC']
+    assert math.isclose(cycle.profit, 4000 / 301. * 0.08 - 1)
+    # bounded by the ETH for sale in EUR
+    assert math.isclose(cycle.volume, 301 / 4000.)
+
+
+def test_fees_remove_the_cycle():
+    assert not graph(fee=0.03).profitable_cycles()
+
+
+def test_only_changed_tops_are_evaluated():
+    g = graph()
+    assert not g.update('kraken_eth_eur', top('ETH', 'EUR', '300', '1', '301', '1'))
+    # the ETH ask went up, the cycle is gone
+    assert g.update('kraken_eth_eur', top('ETH', 'EUR', '300', '1', '330', '1'))
+    assert not g.profitable_cycles()
+    # and an empty book takes the pair out
+    assert g.update('kraken_eth_eur', {'bids': [], 'asks': []})
+    assert all(c.log_return is None for c in g.cycles)
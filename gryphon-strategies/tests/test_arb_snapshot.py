@@ -0,0 +1,42 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from arb_snapshot import ArbSnapshot, SnapshotFetcher, StampedOrderbook
+
+
+class BarrierExchange(object):
+    """
+    Gives its orderbook only once all the exchanges of the barrier are being fetched.
+    """
+
+    def __init__(self, name, barrier):
+        self.name = name
+        self.barrier = barrier
+
+    def get_orderbook(self):
+        self.barrier.wait()
+        return {'exchange': self.name}
+
+
+def test_orderbooks_fetched_at_the_same_time():
+    barrier = threading.Barrier(2, timeout=5)
+    fetcher = SnapshotFetcher(max_workers=2, max_skew=5)
+    try:
+        snapshot = fetcher.fetch([BarrierExchange('KRAKEN', barrier), BarrierExchange('BITSTAMP', barrier)])
+    finally:
+        fetcher.close()
+    # in the order of the exchanges
+    assert snapshot.orderbooks == [{'exchange': 'KRAKEN'}, {'exchange': 'BITSTAMP'}]
+    assert snapshot.synchronized
+
+
+def test_skew_bounds_the_books():
+    books = [StampedOrderbook(None, {}, started=0, ended=2 * 10 ** 9), StampedOrderbook(None, {}, started=10 ** 9, ended=4 * 10 ** 9)]
+    assert books[1].latency == 3
+    assert ArbSnapshot(books).skew == 4
+    assert ArbSnapshot(books).synchronized
+    assert ArbSnapshot(books, max_skew=4).synchronized
+    assert not ArbSnapshot(books, max_skew=3.5).synchronized
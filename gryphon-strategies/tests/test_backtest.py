@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.execution.strategies.base import Strategy
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.money import Money
+
+import basic_ts
+from backtest import Backtest, BacktestExchange
+from basic_ts import monotonic_ns, now_ns, set_replay_time
+
+
+class Bidder(Strategy):
+    """
+    Places one bid under the book on the first tick, and notes what each tick sees.
+    """
+
+    def __init__(self, db, harness, strategy_configuration):
+        self.exchange = None
+        self.ts_directory = None
+        self.seen = []
+        super(Bidder, self).__init__(db, harness, strategy_configuration)
+
+    def configure(self, strategy_configuration):
+        self.init_configurable('exchange', strategy_configuration)
+        self.init_configurable('ts_directory', strategy_configuration)
+        self.primary_exchange = self.harness.exchange_from_key(self.exchange)
+
+    def tick(self, current_orders, eaten_order_ids):
+        if not self.seen:
+            self.order = self.primary_exchange.limit_order(Consts.BID, Money('1', 'BTC'), Money('99', 'EUR'))
+        self.seen.append((now_ns(), list(eaten_order_ids)))
+
+
+def snapshots():
+    yield 10**18, 'bitstamp_btc_eur', [('98', '1')], [('101', '1')]
+    # someone sells down to our bid
+    yield 10**18 + 10**9, 'bitstamp_btc_eur', [('97', '1')], [('98.5', '1')]
+    yield 10**18 + 2 * 10**9, 'bitstamp_btc_eur', [('97', '1')], [('98.5', '1')]
+
+
+def test_strategy_sees_recorded_time_and_eaten_orders(tmpdir):
+    exchange = BacktestExchange('bitstamp_btc_eur', balance={'EUR': Money('1000', 'EUR')})
+    backtest = Backtest(Bidder, {'exchange': 'bitstamp_btc_eur', 'ts_directory': str(tmpdir)}, [exchange])
+    report = backtest.run(snapshots())
+
+    strategy = backtest.strategy
+    assert [t for t, _ in strategy.seen] == [10**18, 10**18 + 10**9, 10**18 + 2 * 10**9]
+    # given once, on the tick after the fill
+    assert [eaten for _, eaten in strategy.seen] == [[], [strategy.order['order_id']], []]
+    assert exchange.balance['BTC'] == Money('1', 'BTC')
+    assert report.ticks == 3
+    # live indicator stores are left alone
+    assert strategy.ts_directory is None
+    assert not os.listdir(str(tmpdir))
+    # back to the system clocks
+    assert basic_ts._replay_ns is None
+
+
+def test_replay_keeps_monotonic_clock_running():
+    set_replay_time(10**18)
+    try:
+        started = monotonic_ns()
+        time.sleep(0.01)
+        ended = monotonic_ns()
+        # latencies measured within a replayed tick are real
+        assert ended - started >= 10**7
+        assert now_ns() == 10**18
+
+        # next recorded time closer than the tick took: the monotonic clock does not go back
+        set_replay_time(10**18 + 1)
+        assert monotonic_ns() >= ended
+        assert now_ns() == 10**18 + 1
+    finally:
+        set_replay_time(None)
+
+
+class Recorded(Bidder):
+
+    def __init__(self, db, harness, strategy_configuration):
+        self.ob_directory = None
+        super(Recorded, self).__init__(db, harness, strategy_configuration)
+
+    def configure(self, strategy_configuration):
+        super(Recorded, self).configure(strategy_configuration)
+        self.init_configurable('ob_directory', strategy_configuration)
+
+
+def test_backtests_do_not_record_orderbooks(tmpdir):
+    exchange = BacktestExchange('bitstamp_btc_eur', balance={'EUR': Money('1000', 'EUR')})
+    backtest = Backtest(Recorded, {'exchange': 'bitstamp_btc_eur', 'ob_directory': str(tmpdir)}, [exchange])
+    backtest.run(snapshots())
+
+    assert backtest.strategy.ob_directory is None
+    assert not os.listdir(str(tmpdir))
@@ -0,0 +1,85 @@
+import os
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.money import Money
+
+from arb_snapshot import ArbSnapshot, StampedOrderbook
+from balance_book import BalanceBook, account
+
+# an orderbook entry, as gryphon exchanges give them
+BookLevel = namedtuple('BookLevel', 'price volume')
+
+
+class StubExchange(object):
+    market_order_fee = 0
+
+    def __init__(self, name, **balance):
+        self.name = name
+        self.balance = balance
+        self.fetches = 0
+
+    def get_balance(self):
+        self.fetches += 1
+        return dict((currency, Money(amount, currency)) for currency, amount in self.balance.items())
+
+
+class Leg(object):
+
+    def __init__(self, exchange, mode, filled, price=None, confirmed=True):
+        self.exchange = exchange
+        self.mode = mode
+        self.filled = Money(filled, 'BTC')
+        self.price = price
+        self.success = True
+        self.confirmed = confirmed
+
+
+def test_account():
+    assert account('BITSTAMP_BTC_EUR') == account('bitstamp_btc_usd') == 'bitstamp'
+
+
+def test_pairs_of_an_exchange_share_its_account():
+    btc_eur = StubExchange('BITSTAMP_BTC_EUR', BTC='1', EUR='1000')
+    btc_usd = StubExchange('BITSTAMP_BTC_USD', BTC='1', USD='500')
+    balances = BalanceBook()
+
+    assert balances.get_balance(btc_eur)['BTC'] == Money('1', 'BTC')
+    balances.apply(Leg(btc_eur, Consts.ASK, '0.6', price=Money('100', 'EUR')))
+    assert balances.get_balance(btc_eur) == {'BTC': Money('0.4', 'BTC'), 'EUR': Money('1060', 'EUR')}
+
+    # the BTC sold on the EUR pair is not there any more for the USD one
+    balance = balances.get_balance(btc_usd)
+    assert balance == {'BTC': Money('0.4', 'BTC'), 'EUR': Money('1060', 'EUR'), 'USD': Money('500', 'USD')}
+    balances.apply(Leg(btc_usd, Consts.ASK, '0.4', price=Money('110', 'USD')))
+    assert balances.get_balance(btc_eur)['BTC'] == Money('0', 'BTC')
+    assert balances.get_balance(btc_eur)['USD'] == Money('544', 'USD')
+
+    # fetched once per pair
+    assert (btc_eur.fetches, btc_usd.fetches, balances.fetches) == (1, 1, 2)
+
+
+def test_fill_priced_on_the_snapshot():
+    kraken = StubExchange('KRAKEN_BTC_EUR', BTC='0', EUR='1000')
+    ob = {'bids': [BookLevel(Money('99', 'EUR'), Money('1', 'BTC'))], 'asks': [BookLevel(Money('101', 'EUR'), Money('1', 'BTC'))]}
+    balances = BalanceBook(ArbSnapshot([StampedOrderbook(kraken, ob, 0, 0)]))
+    balances.get_balance(kraken)
+    # a bid takes the asks
+    balances.apply(Leg(kraken, Consts.BID, '1'))
+    assert balances.get_balance(kraken) == {'BTC': Money('1', 'BTC'), 'EUR': Money('899', 'EUR')}
+
+
+def test_unconfirmed_fill_fetches_the_account_again():
+    btc_eur = StubExchange('BITSTAMP_BTC_EUR', BTC='1', EUR='1000')
+    btc_usd = StubExchange('BITSTAMP_BTC_USD', BTC='1', USD='500')
+    balances = BalanceBook()
+    balances.get_balance(btc_eur)
+    balances.get_balance(btc_usd)
+    balances.apply(Leg(btc_eur, Consts.ASK, '0', confirmed=False))
+
+    balances.get_balance(btc_usd)
+    balances.get_balance(btc_eur)
+    assert (btc_eur.fetches, btc_usd.fetches) == (2, 2)
@@ -0,0 +1,143 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from cdecimal import Decimal
+
+from gryphon.lib.money import Money
+
+import basic_ts
+from basic_ts import TS, ArrayTS, FloatTS, TrendCounter
+
+
+def test_keeps_the_last_values():
+    ts = TS(capacity=3)
+    for value in (1, 3, 9, 3):
+        ts += Decimal(value)
+
+    assert len(ts) == 3
+    assert [value for _, value in ts.series] == [3, 9, 3]
+    assert [d for _, d in reversed(ts.derivative)] == [-1, 1]
+    assert ts.last()[1] == 3
+    # 2 * (new - old) / (new + old)
+    assert [d for _, d in ts.derivative] == [1, -1]
+    assert ts.deriv(last=1) == -1
+    assert ts.deriv(last=2) == 0
+
+    ts.dropfirst(2)
+    assert [value for _, value in ts.series] == [3]
+    assert ts.deriv() is None
+
+
+def test_windows_match_recomputed_statistics():
+    rng = random.Random(1)
+    windowed = TS(capacity=50, windows=(5,))
+    plain = TS(capacity=50)
+    for _ in range(200):
+        value = Decimal(rng.randint(90, 110))
+        windowed += value
+        plain += value
+        if not plain.derivative:
+            continue
+        # the plain series recomputes them from the last derivative values
+        assert abs(windowed.deriv(5) - plain.deriv(5)) < Decimal('1e-20')
+        assert windowed.minimum(5) == plain.minimum(5)
+        assert windowed.maximum(5) == plain.maximum(5)
+        assert abs(windowed.variance(5) - plain.variance(5)) < Decimal('1e-20')
+
+    # registered late, over the values already there
+    window = plain.register_window(7)
+    assert abs(window.mean - sum(plain.derivative.value(-i) for i in range(1, 8)) / 7) < Decimal('1e-20')
+
+    windowed.dropfirst(47)
+    assert len(windowed.derivative) == 2
+    assert windowed.windows[5].count == 2
+    assert abs(windowed.deriv(5) - (windowed.derivative.value(0) + windowed.derivative.value(1)) / 2) < Decimal('1e-20')
+
+
+def test_array_ts_keeps_the_last_points_contiguous():
+    ts = ArrayTS(capacity=4)
+    for i in range(10):
+        ts.append(float(i), timestamp=i)
+    assert list(ts.values) == [6., 7., 8., 9.]
+    assert list(ts.timestamps) == [6, 7, 8, 9]
+
+    ts.extend([10., 11., 12.], timestamps=[10, 11, 12])
+    assert list(ts.values) == [9., 10., 11., 12.]
+    assert ts.last() == (12, 12.)
+    # views of the same memory
+    assert ts.values.base is ts._values
+
+
+def test_vectorized_indicators():
+    values = np.array([100., 110., 99., 99., 120.])
+
+    np.testing.assert_allclose(basic_ts.returns(values)[1:], values[1:] / values[:-1] - 1)
+    assert np.isnan(basic_ts.returns(values)[0])
+    np.testing.assert_allclose(basic_ts.rolling_mean(values, 2)[1:], (values[1:] + values[:-1]) / 2)
+    np.testing.assert_allclose(basic_ts.rolling_std(values, 3)[2:], [np.std(values[i - 2:i + 1]) for i in range(2, 5)])
+
+    # the recurrence, ema[t] = alpha * value[t] + (1 - alpha) * ema[t - 1]
+    long_values = np.random.RandomState(0).uniform(90, 110, 5000)
+    expected = [long_values[0]]
+    for v in long_values[1:]:
+        expected.append(0.1 * v + 0.9 * expected[-1])
+    np.testing.assert_allclose(basic_ts.ema(long_values, span=19), expected)
+    # continued from a previous computation
+    np.testing.assert_allclose(basic_ts.ema(long_values[1000:], span=19, initial=expected[999]), expected[1000:])
+
+
+def test_float_ts():
+    ts = FloatTS(cur='EUR', windows=(2,))
+    ts += Money('100', 'EUR')
+    ts += Money('300', 'EUR')
+    assert type(ts.last()[1]) is float
+    assert ts.deriv(2) == 1.0
+    assert ts.to_money(ts.last()[1]) == Money('300', 'EUR')
+
+
+def test_float_ts_in_ticks():
+    ts = FloatTS(cur='EUR', tick_size='0.01')
+    ts += Money('4000.07', 'EUR')
+    ts += Money('4000.1', 'EUR')
+    # fixed point, no rounding error on the way back
+    assert [value for _, value in ts.series] == [400007, 400010]
+    assert ts.to_money(ts.last()[1]) == Money('4000.10', 'EUR')
+
+
+def test_trend_counter_matches_recount():
+    rng = random.Random(2)
+    trend = TrendCounter((3, 10))
+    signs = []
+    for _ in range(100):
+        value = rng.choice((-0.5, 0, 0.25, 1))
+        trend += value
+        signs.append(value)
+        for horizon in (3, 10):
+            last = signs[-horizon:]
+            assert trend.bullcount(horizon) == sum(1 for v in last if v > 0)
+            assert trend.bearcount(horizon) == sum(1 for v in last if v < 0)
+    assert len(trend) == 10
+
+
+def test_time_range_queries():
+    # wrapped around in its buffer
+    ts = TS(capacity=5)
+    for value in (1, 3, 9, 3, 1, 3, 9, 27):
+        ts += Decimal(value)
+        time.sleep(0.001)
+    timestamps = [t for t, _ in ts.series]
+    assert timestamps == sorted(timestamps)
+
+    assert [v for _, v in ts.between(timestamps[1], timestamps[3])] == [1, 3, 9]
+    assert [v for _, v in ts.since(timestamps[2] + 1)] == [9, 27]
+    assert ts.since(timestamps[-1] + 1) == []
+    assert len(ts.last_duration(3600)) == 5
+
+    derivatives = [d for _, d in ts.derivative]
+    since = [t for t, _ in ts.derivative][1]
+    assert ts.deriv_since(since) == sum(derivatives[1:]) / len(derivatives[1:])
@@ -0,0 +1,119 @@
+import logging
+import os
+import sys
+from collections import namedtuple
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.money import Money
+
+from book_index import OrderbookIndex
+from invest_single import Desk
+
+# an orderbook entry, as gryphon exchanges give them
+BookLevel = namedtuple('BookLevel', 'price volume')
+
+
+class DryRunHarness(object):
+    execute = False
+
+
+class ExchangeWrapper(object):
+    min_order_size = Money('0.001', 'BTC')
+
+
+class DryRunExchange(object):
+    """
+    Exchange of a dry-run harness: market data, but no orders sent.
+    """
+    exchange_wrapper = ExchangeWrapper()
+
+    def __init__(self):
+        self.orderbooks = 0
+
+    def get_orderbook(self):
+        self.orderbooks += 1
+        return {
+            'bids': [BookLevel(Money('99', 'EUR'), Money('1', 'BTC'))],
+            'asks': [BookLevel(Money('101', 'EUR'), Money('0.5', 'BTC')), BookLevel(Money('102', 'EUR'), Money('1', 'BTC'))],
+        }
+
+    def limit_order(self, mode, volume, price):
+        return None
+
+    def market_order(self, volume, mode):
+        return None
+
+
+def book():
+    return OrderbookIndex({
+        'bids': [BookLevel(Money('99', 'EUR'), Money('1', 'BTC')), BookLevel(Money('98', 'EUR'), Money('2', 'BTC'))],
+        'asks': [BookLevel(Money('101', 'EUR'), Money('0.5', 'BTC')), BookLevel(Money('102', 'EUR'), Money('1', 'BTC'))],
+    })
+
+
+def test_midpoint_and_spread():
+    index = book()
+    assert index.midpoint == Money('100', 'EUR')
+    assert index.spread == Money('2', 'EUR')
+    assert OrderbookIndex({'bids': [], 'asks': []}).midpoint is None
+
+
+def test_price_for_volume():
+    index = book()
+    # a BID takes the asks, an ASK the bids
+    assert index.price_for_volume(Consts.BID, Money('0.5', 'BTC')) == Money('101', 'EUR')
+    assert index.price_for_volume(Consts.BID, Money('0.6', 'BTC')) == Money('102', 'EUR')
+    assert index.price_for_volume(Consts.ASK, Money('2', 'BTC')) == Money('98', 'EUR')
+    assert index.price_for_volume(Consts.BID, Money('2', 'BTC')) is None
+
+
+def test_vwap_and_slippage():
+    index = book()
+    # 0.5 @ 101 + 1 @ 102
+    assert index.vwap(Consts.BID, Money('1.5', 'BTC')) == Money('152.5', 'EUR') / Decimal('1.5')
+    assert index.vwap(Consts.ASK, Money('2', 'BTC')) == Money('98.5', 'EUR')
+    assert index.slippage(Consts.ASK, Money('1', 'BTC')) == 0
+    assert index.slippage(Consts.ASK, Money('2', 'BTC')) == Decimal('0.5') / 99
+    assert index.vwap(Consts.ASK, Money('4', 'BTC')) is None
+
+
+def test_volume_up_to():
+    index = book()
+    assert index.volume_up_to(Consts.BID, Money('100', 'EUR')) == Money('0', 'BTC')
+    assert index.volume_up_to(Consts.BID, Money('101', 'EUR')) == Money('0.5', 'BTC')
+    assert index.volume_up_to(Consts.ASK, Money('98', 'EUR')) == Money('3', 'BTC')
+
+
+def desk():
+    return Desk(DryRunHarness(), DryRunExchange(), logging.getLogger(__name__))
+
+
+def test_market_order_before_first_tick():
+    d = desk()
+    order = d.market_bid(Money('1', 'BTC'))
+
+    # priced on the orderbook fetched for it
+    assert d.exchange.orderbooks == 1
+    assert order.price == Money('102', 'EUR')
+    assert order.filled
+    assert d.last_filled is order
+
+
+def test_limit_orders_in_dry_run():
+    d = desk()
+    d.tick({}, {})
+    assert d.book.midpoint == Money('100', 'EUR')
+
+    # crossing the book, filled at once
+    ask = d.limit_ask(Money('0.5', 'BTC'), Money('99', 'EUR'))
+    assert ask.filled
+    assert d.last_filled_by_mode[Consts.ASK] is ask
+    # resting in the book
+    bid = d.limit_bid(Money('0.5', 'BTC'), Money('100', 'EUR'))
+    current, eaten = {}, {}
+    d.tick(current, eaten)
+    assert list(current) == [bid.id]
+    assert d.last_unfilled() is bid
@@ -0,0 +1,119 @@
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.money import Money
+
+from invest_single import Desk, LimitOrder, PositionLedger
+
+
+class LiveHarness(object):
+    execute = True
+
+
+class ExchangeWrapper(object):
+    min_order_size = Money('0.001', 'BTC')
+
+
+class LiveExchange(object):
+    """
+    Accepts every order, fills are given to the Desk as eaten ids on tick.
+    """
+    exchange_wrapper = ExchangeWrapper()
+
+    def __init__(self):
+        self.placed = 0
+
+    def get_orderbook(self):
+        return {'bids': [], 'asks': []}
+
+    def limit_order(self, mode, volume, price):
+        self.placed += 1
+        return {'success': True, 'order_id': str(self.placed)}
+
+    def cancel_order(self, order_id):
+        return {'success': True}
+
+
+def desk():
+    return Desk(LiveHarness(), LiveExchange(), logging.getLogger(__name__))
+
+
+def fill(d, *orders):
+    d.tick({}, dict((o.id, o) for o in orders))
+
+
+def test_ledger_on_partial_fills():
+    ledger = PositionLedger(logging.getLogger(__name__))
+    bid = LimitOrder(mode=Consts.BID, id='1', price=Money('100', 'EUR'), volume=Money('1', 'BTC'))
+    ledger.placed(bid)
+    assert ledger.position == {'EUR': Money('-100', 'EUR')}
+
+    ledger.filled(bid, Money('0.4', 'BTC'))
+    ledger.filled(bid, Money('0.6', 'BTC'))
+    assert ledger.position == {'EUR': Money('-100', 'EUR'), 'BTC': Money('1', 'BTC')}
+
+
+def test_position_follows_orders():
+    d = desk()
+    bid = d.limit_bid(Money('1', 'BTC'), Money('100', 'EUR'))
+    ask = d.limit_ask(Money('1', 'BTC'), Money('110', 'EUR'))
+    # committed when placed
+    assert d.ephemeral_position == {'EUR': Money('-100', 'EUR'), 'BTC': Money('-1', 'BTC')}
+
+    fill(d, bid)
+    assert d.ephemeral_position == {'EUR': Money('-100', 'EUR'), 'BTC': Money('0', 'BTC')}
+    fill(d, ask)
+    assert d.ephemeral_position == {'EUR': Money('10', 'EUR'), 'BTC': Money('0', 'BTC')}
+
+
+def test_last_filled_and_unfilled():
+    d = desk()
+    bid1 = d.limit_bid(Money('1', 'BTC'), Money('100', 'EUR'))
+    ask = d.limit_ask(Money('1', 'BTC'), Money('110', 'EUR'))
+    bid2 = d.limit_bid(Money('1', 'BTC'), Money('99', 'EUR'))
+    assert d.last_unfilled() is bid2
+    assert d.last_unfilled(Consts.ASK) is ask
+    assert d.last_unfilled_order_is(Consts.BID)
+    assert d.last_filled is None
+
+    fill(d, bid1)
+    assert d.last_filled is bid1
+    assert list(d.open_orders) == [ask.id, bid2.id]
+    assert list(d.open_by_mode[Consts.BID]) == [bid2.id]
+
+    fill(d, bid2)
+    assert d.last_unfilled() is ask
+    assert d.last_unfilled(Consts.BID) is None
+    # an older order filled later is not the last filled
+    fill(d, ask)
+    assert d.last_filled is bid2
+    assert d.last_filled_order_is(Consts.BID)
+    assert d.last_filled_by_mode == {Consts.BID: bid2, Consts.ASK: ask}
+    assert d.last_unfilled() is None
+
+
+def test_unknown_eaten_ids_are_ignored():
+    d = desk()
+    bid = d.limit_bid(Money('1', 'BTC'), Money('100', 'EUR'))
+    d.tick({}, {'unknown': None})
+    assert d.order(bid.id) is bid
+    assert d.order('unknown') is None
+
+
+def test_cancel_archives_the_order():
+    d = desk()
+    bid = d.limit_bid(Money('1', 'BTC'), Money('100', 'EUR'))
+    d._fill(bid, Money('0.25', 'BTC'))
+    assert d.cancel(bid.id) is bid
+
+    # the unfilled part is given back
+    assert d.ephemeral_position == {'EUR': Money('-25', 'EUR'), 'BTC': Money('0.25', 'BTC')}
+    assert d.last_unfilled() is None
+    assert d.last_filled is None
+    assert d.archive.count() == 1
+    assert list(d.archive.column('cancelled')) == [True]
+    assert d.archive.filled_volume() == 0.25
@@ -0,0 +1,73 @@
+import os
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.money import Money
+
+from fill_simulator import FillSimulator
+from invest_single import LimitOrder, MarketOrder
+
+# an orderbook entry, as gryphon exchanges give them
+BookLevel = namedtuple('BookLevel', 'price volume')
+
+
+def levels(*entries):
+    return [BookLevel(Money(price, 'EUR'), Money(volume, 'BTC')) for price, volume in entries]
+
+
+def book(bids=(), asks=()):
+    return {'bids': levels(*bids), 'asks': levels(*asks)}
+
+
+def order(cls, oid, mode, volume, price=None, seq=0):
+    o = cls(mode=mode, id=oid, price=None if price is None else Money(price, 'EUR'), volume=Money(volume, 'BTC'))
+    o.seq = seq
+    return o
+
+
+def test_market_order_walks_the_book():
+    simulator = FillSimulator()
+    ob = book(asks=[('101', '0.5'), ('102', '1')])
+    assert simulator.placed(order(MarketOrder, '1', Consts.BID, '1.2'), ob) == Money('1.2', 'BTC')
+    assert simulator.placed(order(MarketOrder, '2', Consts.BID, '2'), ob) == Money('1.5', 'BTC')
+    assert not simulator.orders
+
+
+def test_crossing_limit_order_rests_for_the_rest():
+    simulator = FillSimulator()
+    bid = order(LimitOrder, '1', Consts.BID, '1', '101')
+    assert simulator.placed(bid, book(bids=[('100', '1')], asks=[('101', '0.5'), ('102', '1')])) == Money('0.5', 'BTC')
+    # partly filled, first in the queue at its price
+    assert simulator.queue_ahead == {'1': Money('0', 'BTC')}
+
+
+def test_resting_order_behind_the_queue():
+    simulator = FillSimulator()
+    bid = order(LimitOrder, '1', Consts.BID, '1', '100')
+    assert simulator.placed(bid, book(bids=[('100', '1')], asks=[('101', '1')])) == 0
+    assert simulator.queue_ahead['1'] == Money('1', 'BTC')
+
+    # the queue ahead of us left partly
+    assert simulator.match(book(bids=[('100', '0.75')], asks=[('101', '1')])) == []
+    assert simulator.queue_ahead['1'] == Money('0.75', 'BTC')
+    # the asks came down to our price: the queue goes first
+    assert simulator.match(book(asks=[('100', '0.5')])) == []
+    assert simulator.queue_ahead['1'] == Money('0.25', 'BTC')
+    assert simulator.match(book(asks=[('100', '1')])) == [(bid, Money('0.75', 'BTC'))]
+
+
+def test_oldest_orders_fill_first():
+    simulator = FillSimulator()
+    ob = book(bids=[('99', '1')], asks=[('101', '1')])
+    first = order(LimitOrder, '1', Consts.BID, '1', '100', seq=0)
+    second = order(LimitOrder, '2', Consts.BID, '1', '100', seq=1)
+    simulator.placed(first, ob)
+    simulator.placed(second, ob)
+
+    # liquidity taken by the first order is not there for the second
+    fills = simulator.match(book(asks=[('100', '1.5')]))
+    assert fills == [(first, Money('1', 'BTC')), (second, Money('0.5', 'BTC'))]
+    assert list(simulator.orders) == ['2']
@@ -0,0 +1,67 @@
+import os
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.money import Money
+
+from ob_recorder import OrderbookRecorder, load, segment_paths
+from tick_snapshot import tick_exchange
+
+# an orderbook entry, as gryphon exchanges give them
+BookLevel = namedtuple('BookLevel', 'price volume')
+
+
+def book(price):
+    return {
+        'bids': [BookLevel(Money(price - 1, 'EUR'), Money('1', 'BTC'))],
+        'asks': [BookLevel(Money(price + 1, 'EUR'), Money('2', 'BTC'))],
+    }
+
+
+def test_resumes_after_pruning(tmpdir):
+    directory = str(tmpdir)
+    recorder = OrderbookRecorder(directory, 'bitstamp_btc_eur', depth=2, segment_records=2)
+    for i in range(6):
+        recorder.record(book(100 + i), timestamp=i)
+    recorder.flush()
+    paths = segment_paths(directory, 'bitstamp_btc_eur')
+    assert len(paths) == 3
+
+    # the oldest segments pruned, the next one must not overwrite the last one
+    for path in paths[:2]:
+        os.remove(path)
+    recorder = OrderbookRecorder(directory, 'bitstamp_btc_eur', depth=2, segment_records=2)
+    for i in range(6, 8):
+        recorder.record(book(100 + i), timestamp=i)
+    recorder.flush()
+
+    assert [os.path.basename(p) for p in segment_paths(directory, 'bitstamp_btc_eur')] == [
+        'bitstamp_btc_eur.000002.ob', 'bitstamp_btc_eur.000003.ob']
+    timestamps = [int(r['timestamp']) for records in load(directory, 'bitstamp_btc_eur') for r in records]
+    assert timestamps == [4, 5, 6, 7]
+    assert load(directory, 'bitstamp_btc_eur')[-1]['bid_price'][-1][0] == 106
+
+
+class StubExchange(object):
+
+    def get_orderbook(self):
+        return book(100)
+
+
+class StubHarness(object):
+
+    def exchange_from_key(self, key):
+        return StubExchange()
+
+
+def test_tick_exchange_records_orderbooks(tmpdir):
+    exchange = tick_exchange(StubHarness(), 'bitstamp_btc_eur', ob_directory=str(tmpdir))
+    exchange.get_orderbook()
+    exchange.new_tick()
+    exchange.get_orderbook()
+
+    records = load(str(tmpdir), 'bitstamp_btc_eur')[0]
+    assert len(records) == 2
+    assert records[0]['ask_volume'][0] == 2
@@ -0,0 +1,143 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.exchange.consts import Consts
+
+from ob_stream import ADD, MODIFY, LevelUpdate, OnUpdate, OrderbookStream
+
+
+class LaggingFeed(object):
+    """
+    Feed whose snapshots are `lag` updates behind, and which loses the updates in `lost`.
+    """
+
+    def __init__(self, updates, lag=0, lost=()):
+        self.key = 'bitstamp_btc_eur'
+        self.all = updates
+        self.lag = lag
+        self.lost = lost
+        self.sent = 0
+
+    def snapshot(self):
+        sequence = max(self.sent - self.lag, 0)
+        bids, asks = {}, {}
+        for u in self.all[:sequence]:
+            (bids if u.side == Consts.BID else asks)[u.price] = u.volume
+        return sorted(bids.items(), reverse=True), sorted(asks.items()), sequence, None
+
+    def updates(self):
+        for u in self.all:
+            self.sent = u.sequence
+            if u.sequence not in self.lost:
+                yield u
+
+
+def feed_updates(number, interval=10**9):
+    """
+    :param interval: nanoseconds between updates
+    """
+    updates = [LevelUpdate(1, Consts.ASK, ADD, '200', '1', timestamp=interval)]
+    for i in range(2, number + 1):
+        updates.append(LevelUpdate(i, Consts.BID, ADD if i == 2 else MODIFY, '100', str(i), timestamp=i * interval))
+    return updates
+
+
+def test_lost_update_with_lagging_snapshot():
+    updates = feed_updates(20)
+    stream = OrderbookStream(LaggingFeed(updates, lag=3, lost=(10,)))
+    seen = []
+    stream.subscribe(lambda book, update: seen.append((update.sequence, book.levels[Consts.BID].get(update.price))))
+    applied = [u.sequence for u in stream.updates()]
+
+    # updates kept while the snapshots lagged are applied once one caught up, in order, none twice
+    assert applied == sorted(set(applied))
+    assert applied[-1] == 20
+    assert stream.book.sequence == 20
+    assert stream.book.side(Consts.BID) == [(100, 20)]
+    assert not stream.pending
+    # listeners see the book as of each update
+    assert all(volume == sequence for sequence, volume in seen if sequence > 1)
+    # first snapshot, then at #11, #12 one second later, and #14 two seconds after that
+    assert stream.resyncs == 4
+
+
+def test_burst_after_gap_asks_one_snapshot_per_backoff():
+    # all updates within the same second
+    updates = feed_updates(50, interval=10**6)
+    stream = OrderbookStream(LaggingFeed(updates, lag=5, lost=(10,)), backoff=1.)
+    applied = [u.sequence for u in stream.updates()]
+
+    assert applied[-1] == 9
+    assert stream.resyncs == 2
+    assert [u.sequence for u in stream.pending] == list(range(11, 51))
+
+
+class FailingFeed(LaggingFeed):
+
+    def __init__(self, updates, failures):
+        super(FailingFeed, self).__init__(updates)
+        self.failures = failures
+
+    def snapshot(self):
+        if self.failures:
+            self.failures -= 1
+            return None
+        return super(FailingFeed, self).snapshot()
+
+
+def test_backs_off_when_snapshots_fail():
+    updates = feed_updates(20)
+    stream = OrderbookStream(FailingFeed(updates, failures=2), backoff=1.)
+    applied = [u.sequence for u in stream.updates()]
+
+    # failed at #1 and #2, retried two seconds later at #4, with a snapshot including the updates kept
+    assert stream.resyncs == 3
+    assert stream.skipped == 4
+    assert applied == list(range(5, 21))
+    assert stream.book.side(Consts.BID) == [(100, 20)]
+    assert stream.failures == 0
+
+
+class LedgerExchange(object):
+
+    def consolidate_ledger(self):
+        return [{'id': '1', 'mode': Consts.BID}], ['2']
+
+
+class TwoArgsStrategy(object):
+
+    def __init__(self):
+        self.ticks = []
+
+    def tick(self, current_orders, eaten_order_ids):
+        self.ticks.append((current_orders, eaten_order_ids))
+
+
+class OneArgStrategy(object):
+
+    def __init__(self):
+        self.ticks = []
+
+    def tick(self, current_orders):
+        self.ticks.append(current_orders)
+
+
+def test_ticks_on_top_of_book_changes_with_real_orders():
+    updates = [
+        LevelUpdate(1, Consts.ASK, ADD, '200', '1'),
+        LevelUpdate(2, Consts.BID, ADD, '100', '1'),
+        LevelUpdate(3, Consts.BID, MODIFY, '100', '2'),
+        LevelUpdate(4, Consts.BID, ADD, '101', '1'),
+    ]
+    strategy, single = TwoArgsStrategy(), OneArgStrategy()
+    stream = OrderbookStream(LaggingFeed(updates))
+    stream.subscribe(OnUpdate(strategy, [LedgerExchange()]))
+    stream.subscribe(OnUpdate(single, [LedgerExchange()]))
+    list(stream.updates())
+
+    # not on the one sided book at #1, nor on the volume change at #3
+    assert len(strategy.ticks) == len(single.ticks) == 2
+    assert strategy.ticks[0] == ({'1': {'id': '1', 'mode': Consts.BID}}, {'2': None})
+    assert single.ticks[0] == {'1': {'id': '1', 'mode': Consts.BID}}
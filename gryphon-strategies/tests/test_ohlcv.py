@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ohlcv import OHLCV
+
+
+def test_time_and_tick_bars():
+    bars = OHLCV(seconds=(60,), ticks=(3,))
+    completed = []
+    for timestamp, price in [(0, 10), (20, 12), (40, 9), (59, 11), (61, 13), (130, 8)]:
+        completed.append(bars.update(price, volume=1, timestamp=timestamp))
+
+    # tick bars close before their fourth price, time bars before the first price of the next minute
+    assert [list(c) for c in completed] == [[], [], [], ['3t'], [60], [60]]
+    minute = bars[60].bars[0]
+    assert (minute.open, minute.high, minute.low, minute.close, minute.volume, minute.ticks) == (10, 12, 9, 11, 4, 4)
+    # no bar for the minute without ticks
+    assert len(bars[60]) == 2
+    assert str(bars['3t'].last()) == "O: 10 H: 12 L: 9 C: 9 V: 3 ticks: 3"
+    assert bars['3t'].current.ticks == 3
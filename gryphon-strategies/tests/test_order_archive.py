@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.money import Money
+
+from invest_single import LimitOrder, MarketOrder
+from order_archive import OrderArchive
+
+
+def order(cls, mode, price, volume, filled):
+    o = cls(mode=mode, id=None, price=Money(price, 'EUR'), volume=Money(volume, 'BTC'))
+    o.fill(Money(filled, 'BTC'))
+    o.placed_at = 0
+    return o
+
+
+def test_aggregates_by_mode_and_time():
+    archive = OrderArchive(initial_capacity=2)
+    archive.append(order(LimitOrder, Consts.BID, '100', '1', '1'), settled_at=10)
+    archive.append(order(MarketOrder, Consts.BID, '110', '2', '1'), settled_at=20)
+    archive.append(order(LimitOrder, Consts.ASK, '120', '1', '0'), settled_at=30, cancelled=True)
+    # grown past the initial capacity
+    assert len(archive) == 3
+    assert list(archive.column('settled_at')) == [10, 20, 30]
+    assert list(archive.column('cancelled')) == [False, False, True]
+
+    assert archive.count() == 3
+    assert archive.count(mode=Consts.BID) == 2
+    assert archive.count(since=15, until=25) == 1
+    assert archive.filled_volume(mode=Consts.BID) == 2
+    assert archive.notional() == 210
+    assert archive.vwap(mode=Consts.BID) == 105
+    assert archive.vwap(mode=Consts.ASK) is None
+    assert archive.fill_ratio() == 0.5
+    assert archive.fill_ratio(since=40) is None
@@ -0,0 +1,67 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.exchange.consts import Consts
+
+from order_batch import BatchDispatcher, OrderIntent
+
+
+class SlowExchange(object):
+    """
+    Answers after `delay` seconds, noting the calls in the order they came.
+    """
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _call(self, *call):
+        with self.lock:
+            self.calls.append(call)
+        time.sleep(self.delay)
+
+    def limit_order(self, mode, volume, price):
+        self._call('limit', mode, volume, price)
+        return {'success': True, 'order_id': str(price)}
+
+    def cancel_order(self, order_id):
+        self._call('cancel', order_id)
+        if order_id == 'gone':
+            raise ValueError("order not found")
+        return {'success': True}
+
+
+def test_cancels_first_then_orders_concurrently():
+    exchange = SlowExchange()
+    dispatcher = BatchDispatcher(exchange, max_workers=4)
+    intents = [OrderIntent.limit(Consts.BID, 1, 99), OrderIntent.cancel('a'), OrderIntent.limit(Consts.ASK, 1, 101), OrderIntent.cancel('gone')]
+
+    started = time.time()
+    results = dispatcher.submit(intents)
+    elapsed = time.time() - started
+    dispatcher.close()
+
+    # two round-trips, one for the cancels, one for the orders
+    assert elapsed < 3 * exchange.delay
+    assert set(c[0] for c in exchange.calls[:2]) == {'cancel'}
+    assert set(c[0] for c in exchange.calls[2:]) == {'limit'}
+    # results in the order of the intents, errors kept
+    assert [r.intent for r in results] == intents
+    assert [r.success for r in results] == [True, True, True, False]
+    assert isinstance(results[3].error, ValueError)
+
+
+def test_pool_started_on_first_submit():
+    dispatcher = BatchDispatcher(SlowExchange(delay=0), max_workers=2)
+    assert dispatcher.pool is None
+    dispatcher.close()
+
+    dispatcher.submit([OrderIntent.cancel('a')])
+    assert dispatcher.pool is not None
+    dispatcher.close()
+    assert dispatcher.pool is None
@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.money import Money
+
+from order_batch import CANCEL, LIMIT
+from quote_reconciler import QuoteReconciler
+
+
+def live(oid, mode, volume, price):
+    return {'id': oid, 'mode': mode, 'volume_remaining': Money(volume, 'BTC'), 'price': Money(price, 'EUR')}
+
+
+def described(intents):
+    return [(i.kind, i.order_id) if i.kind == CANCEL else (i.kind, i.mode, i.volume, i.price) for i in intents]
+
+
+def test_orders_within_tolerance_are_kept():
+    reconciler = QuoteReconciler(price_tolerance='0.01', volume_tolerance='0.1')
+    open_orders = [live('1', Consts.BID, '1', '100'), live('2', Consts.ASK, '1', '110')]
+    desired = {
+        Consts.BID: (Money('1.05', 'BTC'), Money('100.5', 'EUR')),
+        Consts.ASK: (Money('1', 'BTC'), Money('112', 'EUR')),
+    }
+    intents = reconciler.reconcile(open_orders, desired)
+    # the ask moved by more than 1%, cancelled and posted again
+    assert described(intents) == [(CANCEL, '2'), (LIMIT, Consts.ASK, Money('1', 'BTC'), Money('112', 'EUR'))]
+    assert (reconciler.kept, reconciler.cancelled, reconciler.posted) == (1, 1, 1)
+
+
+def test_one_order_per_side():
+    reconciler = QuoteReconciler()
+    open_orders = [live('1', Consts.BID, '1', '100'), live('2', Consts.BID, '1', '100'), live('3', Consts.ASK, '1', '110')]
+    intents = reconciler.reconcile(open_orders, {Consts.BID: (Money('1', 'BTC'), Money('100', 'EUR')), Consts.ASK: None})
+    # duplicates and sides we do not want any more are cancelled
+    assert described(intents) == [(CANCEL, '2'), (CANCEL, '3')]
+
+
+def test_quotes_posted_without_live_orders():
+    reconciler = QuoteReconciler()
+    intents = reconciler.reconcile(None, {Consts.BID: (Money('1', 'BTC'), Money('100', 'EUR'))})
+    assert described(intents) == [(LIMIT, Consts.BID, Money('1', 'BTC'), Money('100', 'EUR'))]
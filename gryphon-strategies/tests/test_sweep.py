@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cdecimal import Decimal
+
+from gryphon.execution.strategies.base import Strategy
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.money import Money
+
+import ob_recorder
+from backtest import read_jsonl
+from sweep import grid, rank, sweep
+
+
+class Taker(Strategy):
+    """
+    Buys `volume` at the best ask, on each tick.
+    """
+
+    def __init__(self, db, harness, strategy_configuration):
+        self.exchange = None
+        self.volume = Decimal('0')
+        super(Taker, self).__init__(db, harness, strategy_configuration)
+
+    def configure(self, strategy_configuration):
+        self.init_configurable('exchange', strategy_configuration)
+        self.init_configurable('volume', strategy_configuration)
+        self.primary_exchange = self.harness.exchange_from_key(self.exchange)
+
+    def tick(self, current_orders):
+        asks = self.primary_exchange.get_orderbook()['asks']
+        if self.volume and asks:
+            self.primary_exchange.limit_order(Consts.BID, Money(self.volume, 'BTC'), asks[0].price)
+
+
+def write_jsonl(path, ticks):
+    with open(path, 'w') as f:
+        for i in range(ticks):
+            price = 4000 + i
+            f.write(json.dumps({'timestamp': 1500000000 + i, 'exchange': 'bitstamp_btc_eur',
+                                'bids': [[str(price - 1), '1'], [str(price - 2), '2']],
+                                'asks': [[str(price + 1), '1']]}) + "\n")
+
+
+def test_save_jsonl_to_segments(tmpdir):
+    path = str(tmpdir.join('obs.jsonl'))
+    write_jsonl(path, 5)
+    directory = str(tmpdir.mkdir('segments'))
+
+    assert ob_recorder.save(directory, read_jsonl(path)) == ['bitstamp_btc_eur']
+    assert list(ob_recorder.snapshots(directory, ['bitstamp_btc_eur'])) == [
+        (t, k, [(repr(float(p)), repr(float(v))) for p, v in bids], [(repr(float(p)), repr(float(v))) for p, v in asks])
+        for t, k, bids, asks in read_jsonl(path)]
+
+
+def test_sweep_over_jsonl(tmpdir):
+    path = str(tmpdir.join('obs.jsonl'))
+    write_jsonl(path, 10)
+    balances = {'bitstamp_btc_eur': {'EUR': Money('100000', 'EUR'), 'BTC': Money('0', 'BTC')}}
+    params_list = grid({'volume': [Decimal('0'), Decimal('0.1'), Decimal('0.2')]})
+
+    results = sweep(__name__ + '.Taker', {'exchange': 'bitstamp_btc_eur'}, {}, ['bitstamp_btc_eur'], balances, path,
+                    params_list, processes=2)
+
+    assert [r.error for r in results] == [None] * 3
+    assert [r.params for r in results] == params_list
+    assert [r.fills for r in results] == [0, 10, 10]
+    # buying at the ask loses the spread
+    assert rank(results)[0].params == {'volume': Decimal('0')}
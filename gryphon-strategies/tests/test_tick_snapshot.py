@@ -0,0 +1,99 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gryphon.lib.exchange.consts import Consts
+from gryphon.lib.money import Money
+
+from tick_snapshot import TickSnapshot, tick_exchange
+
+
+class Balance(dict):
+    pass
+
+
+class StubExchange(object):
+    name = 'BITSTAMP_BTC_EUR'
+
+    def __init__(self):
+        self.calls = []
+
+    def get_orderbook(self, volume_limit=None):
+        self.calls.append(('get_orderbook', volume_limit))
+        return {'bids': [], 'asks': [], 'volume_limit': volume_limit}
+
+    def get_balance(self):
+        self.calls.append(('get_balance',))
+        return Balance(EUR=Money('1000', 'EUR'), BTC=Money('1', 'BTC'))
+
+    def get_open_orders(self):
+        self.calls.append(('get_open_orders',))
+        return []
+
+    def limit_order(self, mode, volume, price):
+        return {'success': True, 'order_id': '1'}
+
+    def market_order(self, volume, mode):
+        self.calls.append(('market_order', volume, mode))
+        return {'success': True, 'order_id': '2'}
+
+
+def test_fetches_once_per_tick():
+    exchange = StubExchange()
+    snapshot = TickSnapshot(exchange)
+    for _ in range(3):
+        snapshot.get_orderbook()
+        snapshot.get_balance()
+        snapshot.get_open_orders()
+    assert len(exchange.calls) == 3
+    assert snapshot.tick_saved == 6
+
+    snapshot.new_tick()
+    snapshot.get_orderbook()
+    assert len(exchange.calls) == 4
+    assert snapshot.tick_calls == 1
+
+
+def test_orderbooks_cached_by_arguments():
+    exchange = StubExchange()
+    snapshot = TickSnapshot(exchange)
+    assert snapshot.get_orderbook()['volume_limit'] is None
+    assert snapshot.get_orderbook(volume_limit=10)['volume_limit'] == 10
+    assert snapshot.get_orderbook(volume_limit=10)['volume_limit'] == 10
+    assert exchange.calls == [('get_orderbook', None), ('get_orderbook', 10)]
+
+
+def test_limit_order_debits_a_copy():
+    snapshot = TickSnapshot(StubExchange())
+    before = snapshot.get_balance()
+    snapshot.limit_order(Consts.BID, Money('0.5', 'BTC'), Money('100', 'EUR'))
+    snapshot.limit_order(Consts.ASK, Money('0.25', 'BTC'), Money('110', 'EUR'))
+
+    after = snapshot.get_balance()
+    assert isinstance(after, Balance)
+    assert after['EUR'] == Money('950', 'EUR')
+    assert after['BTC'] == Money('0.75', 'BTC')
+    # the balance given before is left as fetched
+    assert before['EUR'] == Money('1000', 'EUR')
+
+
+def test_market_order_invalidates_balance():
+    exchange = StubExchange()
+    snapshot = TickSnapshot(exchange)
+    snapshot.get_balance()
+    snapshot.market_order(Money('0.5', 'BTC'), Consts.BID)
+    snapshot.get_balance()
+    assert [c[0] for c in exchange.calls] == ['get_balance', 'market_order', 'get_balance']
+
+
+class StubHarness(object):
+
+    def exchange_from_key(self, key):
+        return StubExchange()
+
+
+def test_tick_exchange():
+    snapshot = tick_exchange(StubHarness(), 'bitstamp_btc_eur')
+    assert isinstance(snapshot, TickSnapshot)
+    assert snapshot.name == 'BITSTAMP_BTC_EUR'
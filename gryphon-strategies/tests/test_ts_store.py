@@ -0,0 +1,72 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from basic_ts import TS, FloatTS, TrendCounter
+from ts_store import TSStore, open_store, store_path
+
+
+def test_grows_and_keeps_records(tmpdir):
+    path = store_path(str(tmpdir), 'dmm', 'bitstamp_btc_eur', 'midpoints')
+    store = TSStore(path, initial_capacity=2)
+    for i in range(5):
+        store.append(i, float(i))
+    store.flush()
+
+    store = TSStore(path)
+    assert len(store) == 5
+    assert store.capacity == 8
+    assert [int(t) for t in store.tail(3)['timestamp']] == [2, 3, 4]
+
+
+def test_rejects_other_files(tmpdir):
+    path = str(tmpdir.join('other.ts'))
+    with open(path, 'wb') as f:
+        f.write(b'x' * 64)
+    with pytest.raises(ValueError):
+        TSStore(path)
+
+
+def test_restart_restores_floats(tmpdir):
+    path = store_path(str(tmpdir), 'dmm', 'bitstamp_btc_eur', 'volatility')
+    volat = FloatTS().attach(TSStore(path))
+    for value in (0.01, 0.02, 0.04):
+        volat += value
+    volat.store.flush()
+
+    # restarted: the restored values are floats, and new ones can be added to them
+    volat = FloatTS().attach(TSStore(path))
+    assert [value for _, value in volat.series] == [0.01, 0.02, 0.04]
+    volat += 0.04
+    assert volat.deriv(1) == 0.0
+    assert volat.series.timestamp(-1) >= volat.series.timestamp(-2)
+
+
+def test_restart_restores_decimals(tmpdir):
+    path = store_path(str(tmpdir), 'dmm', 'bitstamp_btc_eur', 'volatility')
+    volat = TS().attach(TSStore(path))
+    volat += 1
+    volat += 2
+    volat.store.flush()
+
+    volat = TS().attach(TSStore(path))
+    assert len(volat) == 2
+    volat += 2
+    assert volat.deriv(1) == 0
+
+
+def test_trend_follows_restored_history(tmpdir):
+    midpoints = FloatTS().attach(open_store(str(tmpdir), 'hodl', 'bitstamp_btc_eur', 'midpoints'))
+    trend = TrendCounter((2, 3))
+    for value in (100., 101., 101., 102., 101.):
+        midpoints += value
+        md = midpoints.deriv(last=1)
+        if md:
+            trend += md
+    midpoints.store.flush()
+
+    restored = TrendCounter((2, 3)).follow(FloatTS().attach(open_store(str(tmpdir), 'hodl', 'bitstamp_btc_eur', 'midpoints')))
+    assert str(restored) == str(trend) == "2: +1/-1 3: +2/-1"
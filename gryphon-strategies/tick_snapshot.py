@@ -0,0 +1,130 @@
+"""
+Per-tick cache of market data, wrapping an exchange as returned by harness.exchange_from_key().
+The orderbook, balance and open orders are fetched at most once per tick.
+Orders may be placed from several threads (see order_batch), the cached balance is replaced, never changed in place.
+"""
+import copy
+import threading
+
+from gryphon.lib.exchange.consts import Consts
+
+from ob_recorder import OrderbookRecorder, RecordingExchange
+
+
+class TickSnapshot(object):
+    """
+    Exchange wrapper caching get_orderbook, get_balance and get_open_orders until the next tick.
+    Placing orders adjusts the cached balance locally, cancelling orders invalidates it.
+    Everything else is delegated to the wrapped exchange.
+    """
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+
+        self._orderbooks = {}  # call arguments -> orderbook
+        self._balance = None
+        self._open_orders = None
+        self._lock = threading.Lock()
+
+        # network calls made and avoided, since the start
+        self.calls = 0
+        self.saved = 0
+        self.tick_calls = 0
+        self.tick_saved = 0
+
+    def new_tick(self):
+        """
+        Forget the previous tick data. To be called at the start of each tick.
+        """
+        self._orderbooks = {}
+        self._balance = None
+        self._open_orders = None
+        self.tick_calls = 0
+        self.tick_saved = 0
+
+    def _fetched(self, cached):
+        if cached is None:
+            self.calls += 1
+            self.tick_calls += 1
+            return False
+        self.saved += 1
+        self.tick_saved += 1
+        return True
+
+    def get_orderbook(self, *args, **kwargs):
+        # e.g. a deeper orderbook is another call
+        key = (args, tuple(sorted(kwargs.items())))
+        if not self._fetched(self._orderbooks.get(key)):
+            self._orderbooks[key] = self.exchange.get_orderbook(*args, **kwargs)
+        return self._orderbooks[key]
+
+    def get_balance(self):
+        if not self._fetched(self._balance):
+            self._balance = self.exchange.get_balance()
+        return self._balance
+
+    def get_open_orders(self):
+        if not self._fetched(self._open_orders):
+            self._open_orders = self.exchange.get_open_orders()
+        return self._open_orders
+
+    def limit_order(self, mode, volume, price, *args, **kwargs):
+        order = self.exchange.limit_order(mode, volume, price, *args, **kwargs)
+        self._open_orders = None
+        if order and order.get('success'):
+            self._debit(mode, volume, price)
+        return order
+
+    def market_order(self, volume, mode, *args, **kwargs):
+        order = self.exchange.market_order(volume, mode, *args, **kwargs)
+        # we cannot tell the execution price from here
+        self._invalidate()
+        return order
+
+    def cancel_order(self, *args, **kwargs):
+        result = self.exchange.cancel_order(*args, **kwargs)
+        self._invalidate()
+        return result
+
+    def cancel_all_open_orders(self, *args, **kwargs):
+        result = self.exchange.cancel_all_open_orders(*args, **kwargs)
+        self._invalidate()
+        return result
+
+    def _invalidate(self):
+        with self._lock:
+            self._balance = None
+            self._open_orders = None
+
+    def _debit(self, mode, volume, price):
+        """
+        Funds committed to an order are not available anymore for this tick.
+        The balance is copied, so the one returned to callers before does not change under them.
+        """
+        with self._lock:
+            if self._balance is None:
+                return
+            balance = copy.copy(self._balance)
+            if mode == Consts.BID:
+                balance[price.currency] = balance.get(price.currency) - price * volume.amount
+            elif mode == Consts.ASK:
+                balance[volume.currency] = balance.get(volume.currency) - volume
+            self._balance = balance
+
+    def report(self):
+        return "Market data calls: " + str(self.tick_calls) + " (saved " + str(self.tick_saved) + ") this tick, " + str(self.calls) + " (saved " + str(self.saved) + ") overall"
+
+    def __getattr__(self, name):
+        return getattr(self.exchange, name)
+
+
+def tick_exchange(harness, key, ob_directory=None):
+    """
+    The exchange of a strategy, with its market data fetched at most once per tick.
+    :param key: exchange key, e.g. 'bitstamp_btc_eur'
+    :param ob_directory: where to record the orderbooks fetched, to backtest on them later
+    """
+    exchange = harness.exchange_from_key(key)
+    if ob_directory:
+        exchange = RecordingExchange(exchange, OrderbookRecorder(ob_directory, key))
+    return TickSnapshot(exchange)
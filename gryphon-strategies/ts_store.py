@@ -0,0 +1,89 @@
+"""
+Memory-mapped, append-only storage for our time series, so a restarted strategy
+finds its indicator history where it left it.
+
+File layout : a 16 bytes header (magic, record count), followed by fixed-width records
+(int64 timestamp, float64 value, float64 derivative). The file grows by doubling,
+records past the count are unused.
+
+Stores are not bounded: they keep every record appended, 24 bytes each, about 2 MB a day for a series
+appended to every second. Remove a store to start it over.
+
+Timestamps are wall clock nanoseconds since epoch, so they stay meaningful across reboots.
+"""
+import os
+
+import numpy as np
+
+
+MAGIC = b'GRYTS001'
+HEADER_SIZE = 16
+
+RECORD = np.dtype([('timestamp', '<i8'), ('value', '<f8'), ('derivative', '<f8')])
+
+
+class TSStore(object):
+
+    def __init__(self, path, initial_capacity=4096):
+        self.path = path
+
+        if not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE:
+            with open(path, 'wb') as f:
+                f.write(MAGIC + np.zeros(1, dtype='<i8').tobytes())
+                f.truncate(HEADER_SIZE + initial_capacity * RECORD.itemsize)
+        else:
+            with open(path, 'rb') as f:
+                magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(path + " is not a time series store")
+
+        self._map()
+
+    def _map(self):
+        self.capacity = (os.path.getsize(self.path) - HEADER_SIZE) // RECORD.itemsize
+        self.header = np.memmap(self.path, dtype='<i8', mode='r+', offset=len(MAGIC), shape=(1,))
+        self.records = np.memmap(self.path, dtype=RECORD, mode='r+', offset=HEADER_SIZE, shape=(self.capacity,))
+
+    def _grow(self):
+        self.flush()
+        capacity = 2 * self.capacity
+        del self.header, self.records
+        with open(self.path, 'r+b') as f:
+            f.truncate(HEADER_SIZE + capacity * RECORD.itemsize)
+        self._map()
+
+    def append(self, timestamp, value, derivative=float('nan')):
+        count = int(self.header[0])
+        if count == self.capacity:
+            self._grow()
+        self.records[count] = (timestamp, value, derivative)
+        # the count is updated last, so a crash never exposes a partial record
+        self.header[0] = count + 1
+
+    def tail(self, number):
+        """
+        :return: a view of the last `number` records, without copying them
+        """
+        count = len(self)
+        return self.records[max(count - int(number), 0):count]
+
+    def flush(self):
+        self.records.flush()
+        self.header.flush()
+
+    def __len__(self):
+        return int(self.header[0])
+
+
+def store_path(directory, actor, exchange, name):
+    """
+    one store per actor, exchange and series
+    """
+    return os.path.join(directory, ".".join([str(actor), str(exchange), name, "ts"]))
+
+
+def open_store(directory, actor, exchange, name):
+    """
+    :return: the TSStore of this series in `directory`, created when there is none yet
+    """
+    return TSStore(store_path(directory, actor, exchange, name))